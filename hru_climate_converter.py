@@ -9,19 +9,237 @@ The online platform takes data in a different format so this script converts the
 files for PRMS that is developed by the USGS and used locally.
 """
 
+from collections import OrderedDict
 from fileinput import filename
-import __main__
+import hashlib
+import json
+import os
 import pandas as pd
 import numpy as np
-from __main__ import __name__
+
+PRMS_DATE_COLUMNS = ["year","month","day","hour","minute","second"]
+
+
+def file_hash(filename, block_size=2**20):
+    """
+    Returns the MD5 hex digest of a file, read in blocks so large
+    csv files don't have to be held in memory.
+    """
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def column_hru(name):
+    """
+    Returns the hru number from a column name like tmin[23],
+    or 0 if the column does not reference an hru.
+    """
+    try:
+        return int(name.split("[")[1].split("]")[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+class ClimateCache(object):
+    """
+    Columnar on-disk cache of a converted climate by hru file.
+
+    Each source file gets a folder in cache_dir named by the MD5 hash of
+    the source file. The folder holds the date index (dates.npy, one
+    year/month/day row per time step), the date text as it was in the
+    converted file (date_text.npy), one days x columns array per variable
+    (i.e. tmin.npy) and index.json listing the variables, their column
+    names, hrus and which columns were integers. Arrays are memory mapped
+    on load so slicing a date window or an hru subset only reads the rows
+    that are needed.
+    """
+    def __init__(self, cache_dir, source_hash):
+        self.cache_dir = cache_dir
+        self.source_hash = source_hash
+        self.path = os.path.join(cache_dir, source_hash)
+        self.index_path = os.path.join(self.path, "index.json")
+        self.date_text_path = os.path.join(self.path, "date_text.npy")
+        self.variables = []
+        self.dates = None
+
+    def exists(self):
+        """
+        Check if the cache has been built for the source file
+        (caches without the date text are rebuilt)
+        """
+        return (os.path.isfile(self.index_path) and
+                os.path.isfile(self.date_text_path))
+
+    def build(self, df):
+        """
+        Writes the dates and every variable in the converted dataframe
+        to the cache. Columns are grouped into variables by the name in
+        front of the hru index, i.e. tmin[1], tmin[2] are stored in tmin.npy
+        (even if columns of other variables are between them)
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        dates = np.column_stack(
+            [df[name].astype(int).values for name in ["year","month","day"]])
+        np.save(os.path.join(self.path, "dates.npy"), dates)
+        date_text = np.column_stack(
+            [df[name].astype(str).values for name in ["year","month","day"]])
+        np.save(self.date_text_path, date_text.astype(str))
+
+        # Keep the variables in the order they first appear in the file
+        var_dict = OrderedDict()
+        for name in list(df.columns.values):
+            if name in PRMS_DATE_COLUMNS or name == "date":
+                continue
+            var_name = name.split("[")[0]
+            if var_name not in var_dict:
+                var_dict[var_name] = {"name":var_name, "columns":[], "hrus":[],
+                                      "integer":[]}
+            var_dict[var_name]["columns"].append(name)
+            var_dict[var_name]["hrus"].append(column_hru(name))
+            var_dict[var_name]["integer"].append(
+                bool(np.issubdtype(df[name].dtype, np.integer)))
+        variables = list(var_dict.values())
+
+        for var in variables:
+            values = df[var["columns"]].values.astype(np.float64)
+            np.save(os.path.join(self.path, var["name"] + ".npy"), values)
+
+        with open(self.index_path, 'w') as f:
+            json.dump({"source_hash":self.source_hash, "variables":variables}, f)
+        print "\tCached {0} variables to {1}".format(len(variables), self.path)
+        self.load()
+
+    def load(self):
+        """
+        Reads the cache index and memory maps the date index
+        """
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+        self.variables = index["variables"]
+        self.dates = np.load(os.path.join(self.path, "dates.npy"), mmap_mode='r')
+        self.date_text = np.load(self.date_text_path, mmap_mode='r')
+
+    def date_rows(self, start_date=None, end_date=None):
+        """
+        Returns the row indices between start_date and end_date (inclusive).
+        Dates can be anything pandas can convert to a timestamp.
+        """
+        date_key = self.dates[:,0]*10000 + self.dates[:,1]*100 + self.dates[:,2]
+        mask = np.ones(date_key.shape, dtype=bool)
+        if start_date is not None:
+            start = pd.Timestamp(start_date)
+            mask &= date_key >= start.year*10000 + start.month*100 + start.day
+        if end_date is not None:
+            end = pd.Timestamp(end_date)
+            mask &= date_key <= end.year*10000 + end.month*100 + end.day
+        return np.flatnonzero(mask)
+
+    def select(self, col_str, start_date=None, end_date=None, hru_list=None):
+        """
+        Returns the date text, column names, integer column flags and
+        values for all the variables having col_str in their name, sliced
+        to the date window and hrus.
+        """
+        rows = self.date_rows(start_date, end_date)
+        columns, integer, values = [], [], []
+        for var in self.variables:
+            if col_str not in var["name"]:
+                continue
+            cols = np.arange(len(var["columns"]))
+            if hru_list is not None:
+                cols = cols[np.in1d(var["hrus"], hru_list)]
+            data = np.load(os.path.join(self.path, var["name"] + ".npy"), mmap_mode='r')
+            values.append(data[rows][:,cols])
+            columns.extend([var["columns"][i] for i in cols])
+            integer.extend([var["integer"][i] for i in cols])
+
+        if values:
+            values = np.hstack(values)
+        else:
+            values = np.zeros((len(rows), 0))
+        return self.date_text[rows], columns, integer, values
+
+    def write_data_file(self, col_str, filename, start_date=None, end_date=None,
+                        hru_list=None):
+        """
+        Writes a PRMS data file straight from the cache, in the same
+        format as OnlineClimateFile.output_data_file (DataFrame.to_csv):
+        the date text as it was converted, integer columns as integers,
+        floats at full precision (repr) and missing values left blank
+        """
+        date_text, columns, integer, values = self.select(
+            col_str, start_date, end_date, hru_list)
+        vals_len = len(columns)
+
+        #Provide feedback is usr provided string was not found.
+        if vals_len <= 1 :
+            print "\nWarning: Column name {0} was not found in the file.".format(col_str)
+        else:
+            print "\nWriting {0} columns that contained the string {1}". format(vals_len, col_str)
+
+        def format_column(column, integer_flag):
+            if integer_flag:
+                return [str(int(v)) for v in column.tolist()]
+            return ['' if v != v else repr(v) for v in column.tolist()]
+
+        with open(filename,'w') as f:
+            #Append the PRMS expected Header
+            f.write("File Generated using Micahs hru_climate_converter.py\n")
+            f.write("{0} {1}\n".format(col_str,vals_len))
+            f.write("########################################\n")
+            # Hour, minute and second are always 0
+            for i in range(0, len(date_text), 10000):
+                text = [date_text[i:i+10000,j].tolist() for j in range(3)]
+                text.extend([["0"]*len(text[0])]*3)
+                text.extend([format_column(values[i:i+10000,j], integer[j])
+                             for j in range(vals_len)])
+                f.writelines(" ".join(row) + "\n" for row in zip(*text))
+        print "\tData file outputted to {0}".format(filename)
+
+    def write_windows(self, col_str_list, windows, prms_input_dir, hru_list=None):
+        """
+        Writes a set of data files for each date window.
+
+        args:
+            col_str_list    Variables to write, i.e. ["tmin","tmax"]
+            windows         List of (start_date, end_date) pairs
+            prms_input_dir  Directory the data files are written to, one
+                            sub folder per window named start_end
+        """
+        for start_date, end_date in windows:
+            window_dir = os.path.join(prms_input_dir, "{0}_{1}".format(
+                pd.Timestamp(start_date).strftime("%Y%m%d"),
+                pd.Timestamp(end_date).strftime("%Y%m%d")))
+            if not os.path.isdir(window_dir):
+                os.makedirs(window_dir)
+            for col_str in col_str_list:
+                self.write_data_file(
+                    col_str, os.path.join(window_dir, col_str + ".data"),
+                    start_date, end_date, hru_list)
+
 
 class OnlineClimateFile(object):
-    def __init__(self,filename,**kwargs):
+    def __init__(self,filename,cache_dir=None,**kwargs):
         if type(filename) == str:
             self.filename = filename
         else:
             ValueError("\nExpected filename to be type str not {0}".format(type(filename)))
-        
+
+        # Skip parsing the csv if the file has already been converted
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = ClimateCache(cache_dir, file_hash(self.filename))
+            if self.cache.exists():
+                print "\nReading cached data for {0}".format(self.filename)
+                self.cache.load()
+                self.df = None
+                return
+
         try:
             self.df = pd.read_csv(self.filename,parse_dates=True)
         except:
@@ -55,13 +273,26 @@ class OnlineClimateFile(object):
             for time_name, time_value in prms_date.items():
                 self.df.set_value(index, time_name,time_value)
 
-    def output_data_file(self,col_str,filename):
+        #Save the converted data so the csv doesn't need to be parsed again
+        if self.cache is not None:
+            self.cache.build(self.df)
+
+    def output_data_file(self,col_str,filename,start_date=None,end_date=None,hru_list=None):
         """
         Searches dataframe work for columns having the col_str,
         creates a new data frame work with the date append at the front
         of each line.
         Writes the file in space delimited format to filename
+
+        If the file is cached, the data is read from the cache and can be
+        limited to a date window (start_date, end_date) and list of hrus.
         """
+        if self.cache is not None:
+            self.cache.write_data_file(col_str, filename, start_date, end_date, hru_list)
+            return
+        elif start_date is not None or end_date is not None or hru_list is not None:
+            raise ValueError("\nDate and hru subsets require a cache_dir")
+
         frames = []
         df2 = pd.DataFrame(self.df[["year","month","day","hour","minute","second"]])         
         frames.append(df2)
@@ -90,7 +321,7 @@ class OnlineClimateFile(object):
             f.close()
         print "\tData file outputted to {0}".format(filename)
 
-    def write_climate_data(self,prms_input_dir):
+    def write_climate_data(self,prms_input_dir,start_date=None,end_date=None,hru_list=None):
         """
         Writes all the data required for PRMS Climate by HRU
         data to their respective files in the appropriate format
@@ -99,19 +330,36 @@ class OnlineClimateFile(object):
         
         climate = ["tmin","tmax", "precip", "swe"]
         for data in climate:
-            self.output_data_file(data,prms_input_dir + data + ".data")
+            self.output_data_file(data,prms_input_dir + data + ".data",
+                                  start_date,end_date,hru_list)
    
-    def write_runoff_data(self,prms_input_dir):
+    def write_runoff_data(self,prms_input_dir,start_date=None,end_date=None):
         """
         eWSF allows the user to collact station data to be used for prms with 
         ease. This converts the file to prms local executable to read.
         
         args:
             prms_input_dir    This is the location of the directory where PRMS will looks for data
+            start_date        First date to write, requires a cache (optional)
+            end_date          Last date to write, requires a cache (optional)
         """
         
         data = "runoff"
-        self.output_data_file(data,prms_input_dir + data + ".data")
+        self.output_data_file(data,prms_input_dir + data + ".data",start_date,end_date)
+
+    def write_climate_windows(self,prms_input_dir,windows,hru_list=None):
+        """
+        Writes the climate data files for several date windows from the
+        cache without re-reading the csv.
+
+        args:
+            prms_input_dir    Directory the window sub folders are written to
+            windows           List of (start_date, end_date) pairs
+        """
+        if self.cache is None:
+            raise ValueError("\nDate windows require a cache_dir")
+        self.cache.write_windows(["tmin","tmax", "precip", "swe"], windows,
+                                 prms_input_dir, hru_list)
 
 
 if __name__=='__main__':
@@ -18,84 +18,333 @@ from arcpy import env
 
 import numpy as np
 
-def count_selected(layer):
-    result = arcpy.GetCount_management(layer)
-    selected = int(result.getOutput(0))
-    logging.debug('Selected {} features'.format(selected))
-    
-    return selected
+# Vertex coordinates are rounded before matching shared edges/vertices
+coord_precision = 6
+
+# Stop iterating once the largest change in a filled value is below tol
+tol = 1e-6
+max_iter = 1000
 
-def estimate(file_name, field, null_value):
+
+class PolygonAdjacency(object):
     """
-    Estimate the parameters, 
+    Polygon adjacency graph stored in compressed sparse row (CSR) form
+
+    Row i holds the neighbors of polygon i in indices[indptr[i]:indptr[i+1]]
+    along with the length of the shared boundary (0 if the polygons only
+    touch at a vertex). SciPy isn't shipped with ArcGIS so the sparse
+    matrix-vector product is done with np.bincount.
     """
-    
-    # open the shapefile
-    f = arcpy.da.UpdateCursor(file_name, ["FID","SHAPE@",field],
-                              where_clause='{}={}'.format(field, null_value))
-        
-    # Make a layer from the feature class
-    arcpy.MakeFeatureLayer_management(file_name, "lyr") 
-    ret = True
-    
-    for h in f:
-        
-        logging.debug('Feature FID = {}'.format(h[0]))
-                        
-        # create the initial selection
-        arcpy.SelectLayerByAttribute_management("lyr", 'NEW_SELECTION', 'FID={}'.format(h[0]))
-        count_selected("lyr")
-        
-        # select where the boundary touches
-        arcpy.SelectLayerByLocation_management("lyr", 'BOUNDARY_TOUCHES', "lyr")
-        selected = count_selected("lyr")
-                
-        # get the selected values for sand
-        fld = np.zeros((selected,))
-        area = np.zeros((selected,))
-        for i,row in enumerate(arcpy.SearchCursor("lyr")):
-            fld[i] = row.getValue(field)
-            area[i] = row.Shape.area
-            
-        # remove any null values
-        idx = fld == null_value
-        fld = fld[~idx]
-        area = area[~idx]
-
-        # update with the average
-        w = area/np.sum(area)
-        
-        if np.sum(w) == 0:
-            ret = False
-        else:
-            h[2] = np.average(fld, weights=w)
-            f.updateRow(h)
-        
-            logging.debug('Updated value to {}'.format(h[2]))
-        
-    return ret
+    def __init__(self, indptr, indices, length, area):
+        self.indptr = indptr
+        self.indices = indices
+        self.length = length
+        self.area = area
+        self.n = len(indptr) - 1
+        self.rows = np.repeat(np.arange(self.n), np.diff(indptr))
+
+    def matvec(self, x, edge_weight=None):
+        """
+        Sum x over the neighbors of each polygon, x can be (n,) or (n, k)
+
+        If edge_weight is set, x of each neighbor is multiplied by the
+        weight of the edge (i.e. the shared boundary length)
+        """
+        if x.ndim == 2:
+            return np.column_stack(
+                [self.matvec(x[:, j], edge_weight) for j in range(x.shape[1])])
+        weights = x[self.indices]
+        if edge_weight is not None:
+            weights = weights * edge_weight
+        return np.bincount(self.rows, weights=weights, minlength=self.n)
+
+    def neighbor_area(self):
+        """
+        Total area of the neighbors of each polygon
+        """
+        return self.matvec(self.area)
+
+
+def group_pairs(keys, ids):
+    """
+    Find all pairs of different ids that share a key
+
+    Args:
+        keys: (n, k) array of integer keys (i.e. quantized vertices)
+        ids: (n,) array of polygon ids for each key
+
+    Returns:
+        Tuple of (a, b, first) arrays, first is the index of the first
+        record in the group so edge lengths can be looked up
+    """
+    order = np.lexsort(keys.T[::-1])
+    keys = keys[order]
+    ids = ids[order]
+    new_group = np.ones(len(ids), dtype=bool)
+    new_group[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+    group = np.cumsum(new_group) - 1
+    group_size = np.bincount(group)
+
+    a_list, b_list, first_list = [], [], []
+    for offset in range(1, group_size.max() if len(group_size) else 1):
+        same = group[offset:] == group[:-offset]
+        a = ids[:-offset][same]
+        b = ids[offset:][same]
+        keep = a != b
+        a_list.append(a[keep])
+        b_list.append(b[keep])
+        first_list.append(order[:-offset][same][keep])
+    if not a_list:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return (np.concatenate(a_list), np.concatenate(b_list),
+            np.concatenate(first_list))
+
+
+def build_adjacency(rings, ring_ids, area, n):
+    """
+    Build the polygon adjacency graph from shared edges and vertices
+
+    Two polygons are neighbors if they have a vertex at the same
+    (rounded) location, which includes every polygon sharing an edge.
+    The length of the shared edges is kept for each pair of neighbors.
+    This is narrower than the old BOUNDARY_TOUCHES selection: polygons
+    that only touch where a vertex of one lies along an edge of the other
+    (T-junctions without a matching vertex) are not neighbors.
+
+    Args:
+        rings: list of (m, 2) arrays of closed ring coordinates
+        ring_ids: polygon index of each ring
+        area: (n,) array of polygon areas
+        n: number of polygons
+
+    Returns:
+        PolygonAdjacency
+    """
+    scale = 10 ** coord_precision
+    vertex_list, edge_list, vertex_id_list, edge_id_list = [], [], [], []
+    for ring, ring_id in zip(rings, ring_ids):
+        q = np.round(np.asarray(ring, dtype=np.float64) * scale).astype(np.int64)
+        vertex_list.append(q[:-1])
+        vertex_id_list.append(np.full(len(q) - 1, ring_id, dtype=np.int64))
+        edge_list.append(np.hstack([q[:-1], q[1:]]))
+        edge_id_list.append(np.full(len(q) - 1, ring_id, dtype=np.int64))
+    vertices = np.vstack(vertex_list)
+    edges = np.vstack(edge_list)
+    vertex_ids = np.concatenate(vertex_id_list)
+    edge_ids = np.concatenate(edge_id_list)
+
+    # Direction doesn't matter for matching, order each edge's end points
+    swap = ((edges[:, 0] > edges[:, 2]) |
+            ((edges[:, 0] == edges[:, 2]) & (edges[:, 1] > edges[:, 3])))
+    edges[swap] = edges[swap][:, [2, 3, 0, 1]]
+    edge_length = np.hypot(
+        edges[:, 2] - edges[:, 0], edges[:, 3] - edges[:, 1]) / float(scale)
+
+    # Polygons sharing an edge, then polygons that only share a vertex
+    a_edge, b_edge, first = group_pairs(edges, edge_ids)
+    a_vertex, b_vertex, _ = group_pairs(vertices, vertex_ids)
+    a = np.concatenate([a_edge, b_edge, a_vertex, b_vertex])
+    b = np.concatenate([b_edge, a_edge, b_vertex, a_vertex])
+    length = np.concatenate([
+        edge_length[first], edge_length[first],
+        np.zeros(2 * len(a_vertex))])
+
+    # Collapse duplicate pairs, summing the shared boundary length
+    pair_key, inverse = np.unique(a * n + b, return_inverse=True)
+    length = np.bincount(inverse, weights=length)
+    rows = pair_key // n
+    indices = pair_key % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(rows, minlength=n))
+    return PolygonAdjacency(indptr, indices, length, area)
+
+
+def read_polygons(file_name, fields):
+    """
+    Read the polygon rings, areas and field values from the shapefile
+    in a single cursor pass
+
+    Returns:
+        Tuple of fids, (n, k) array of field values, areas, rings and
+        the polygon index of each ring
+    """
+    fids, values, area, rings, ring_ids = [], [], [], [], []
+    with arcpy.da.SearchCursor(file_name, ["FID", "SHAPE@"] + fields) as s_cursor:
+        for i, row in enumerate(s_cursor):
+            fids.append(row[0])
+            area.append(row[1].area)
+            values.append(row[2:])
+            for part in row[1]:
+                # Interior rings are separated by a None point
+                ring = []
+                for pnt in part:
+                    if pnt is None:
+                        rings.append(ring)
+                        ring_ids.append(i)
+                        ring = []
+                    else:
+                        ring.append((pnt.X, pnt.Y))
+                rings.append(ring)
+                ring_ids.append(i)
+    rings = [r for r in rings if len(r) > 1]
+    values = np.array(values, dtype=np.float64).reshape(len(fids), len(fields))
+    return (np.array(fids), values,
+            np.array(area, dtype=np.float64), rings, ring_ids)
+
+
+def fill_nulls(adjacency, values, null_mask, field_names=None):
+    """
+    Boundary length and area weighted gap filling on the adjacency graph
+
+    Each null polygon is set to the weighted average of its neighbors
+    that have a value. Neighbors are weighted by their area times the
+    length of the shared boundary, so a large polygon that only touches
+    a corner counts less than one along a whole side. If the only donors
+    touch at a vertex (no shared boundary), their area is the weight.
+
+    Filled polygons become donors on the next sweep, and sweeps continue
+    until no more polygons are filled and the filled values change by less
+    than tol. All the fields (columns) are filled in the same sweep, a
+    field stops being updated once it has converged.
+
+    Args:
+        adjacency: PolygonAdjacency
+        values: (n, k) array of field values
+        null_mask: (n, k) array, True where the value is null
+        field_names: names of the fields (columns) for log messages
+
+    Returns:
+        Tuple of the filled values, mask of values that are set and
+        the number of sweeps each field took to converge
+    """
+    values = np.where(null_mask, 0, values)
+    has_value = ~null_mask
+    area = adjacency.area[:, np.newaxis]
+    n_fields = values.shape[1]
+    active = null_mask.any(axis=0)
+    n_iter = np.zeros(n_fields, dtype=int)
+    for it in range(max_iter):
+        if not np.any(active):
+            break
+        cols = np.flatnonzero(active)
+        donor_area = area * has_value[:, cols]
+        weight = adjacency.matvec(donor_area, adjacency.length)
+        total = adjacency.matvec(
+            donor_area * values[:, cols], adjacency.length)
+        vertex_mask = weight <= 0
+        if np.any(vertex_mask):
+            weight[vertex_mask] = adjacency.matvec(donor_area)[vertex_mask]
+            total[vertex_mask] = adjacency.matvec(
+                donor_area * values[:, cols])[vertex_mask]
+        update = null_mask[:, cols] & (weight > 0)
+        new_values = values[:, cols].copy()
+        new_values[update] = total[update] / weight[update]
+
+        for j, col in enumerate(cols):
+            # Only compare values that were set on the previous sweep
+            changed = update[:, j] & has_value[:, col]
+            if np.any(changed):
+                delta = np.abs(new_values[changed, j] - values[changed, col]).max()
+            else:
+                delta = 0
+            filled = np.count_nonzero(update[:, j] & ~has_value[:, col])
+            logging.debug('Iteration {} field {}: filled {}, max change {}'.format(
+                it, col, filled, delta))
+            n_iter[col] = it + 1
+            if filled == 0 and delta < tol:
+                active[col] = False
+
+        values[:, cols] = new_values
+        has_value[:, cols] |= update
+    if np.any(active):
+        if field_names is None:
+            field_names = [str(col) for col in range(n_fields)]
+        logging.warning(
+            '  Fields did not converge after {} iterations: {}'.format(
+                max_iter, ', '.join(
+                    field_names[col] for col in np.flatnonzero(active))))
+    return values, has_value, n_iter
+
+
+def estimate(file_name, fields, null_values):
+    """
+    Estimate the parameters from the neighboring polygons
+
+    The adjacency graph is built once for all of the polygons and shared
+    by all the fields, the null values are filled on the graph and all
+    the fields are written back in one cursor pass.
+
+    Args:
+        file_name: Input shapefile
+        fields: List of field names to fill
+        null_values: List of null values, one for each field
+
+    Returns:
+        True if all the null values were filled
+    """
+    logging.info('Reading polygons')
+    fids, values, area, rings, ring_ids = read_polygons(file_name, fields)
+    null_mask = values == np.array(null_values, dtype=np.float64)
+    logging.info('  {} polygons'.format(len(fids)))
+    for j, field in enumerate(fields):
+        logging.info('  {} with {}={}'.format(
+            np.count_nonzero(null_mask[:, j]), field, null_values[j]))
+    if not np.any(null_mask):
+        return True
+
+    logging.info('Building adjacency graph')
+    adjacency = build_adjacency(rings, ring_ids, area, len(fids))
+    logging.info('  {} neighbor pairs'.format(len(adjacency.indices) // 2))
+
+    logging.info('Filling null values')
+    values, has_value, n_iter = fill_nulls(
+        adjacency, values, null_mask, fields)
+    missing = (null_mask & ~has_value).sum(axis=0)
+    for j, field in enumerate(fields):
+        logging.info('  {}: {} iterations, {} filled, {} unfilled'.format(
+            field, n_iter[j], np.count_nonzero(null_mask[:, j] & has_value[:, j]),
+            missing[j]))
+
+    # Write back only the polygons that had a null value
+    write = np.any(null_mask & has_value, axis=1)
+    fid_index = dict(zip(fids, range(len(fids))))
+    with arcpy.da.UpdateCursor(file_name, ["FID"] + fields) as u_cursor:
+        for row in u_cursor:
+            i = fid_index[row[0]]
+            if not write[i]:
+                continue
+            for j in range(len(fields)):
+                if null_mask[i, j] and has_value[i, j]:
+                    row[j + 1] = values[i, j]
+            u_cursor.updateRow(row)
+
+    if np.any(missing):
+        logging.warning('  Some polygons have no neighbors with a value')
+    return not np.any(missing)
     
 
-def parameter_estimator(file_name, field, null_value=0):
+def parameter_estimator(file_name, fields, null_values=0):
     """
     Estimate the parameters for the given shapfile
+
+    Args:
+        file_name: Input shapefile
+        fields: Field name or list of field names
+        null_values: Null value or list of null values, one for each field
     """
+    if isinstance(fields, basestring):
+        fields = [fields]
+    if not isinstance(null_values, (list, tuple)):
+        null_values = [null_values] * len(fields)
+    if len(null_values) != len(fields):
+        logging.error('\nERROR: Set one null value or one for each field')
+        sys.exit()
     
     # Set ArcGIS environment variables
-    arcpy.CheckOutExtension('Spatial')
     env.overwriteOutput = True
-    # env.pyramid = 'PYRAMIDS -1'
-    env.pyramid = 'PYRAMIDS 0'
-#     env.workspace = stream_temp_ws
-    env.scratchWorkspace = 'in_memory'
     
-    for it in range(3):
-        logging.debug('Iteration {}'.format(it))
-        
-        ret = estimate(file_name, field, null_value)
-        
-        if ret:
-            break
+    estimate(file_name, fields, null_values)
 
     logging.info('\nDone!')
 
@@ -109,20 +358,22 @@ def arg_parse():
         '-f', '--file', required=True,
         help='Input shapefile')
     parser.add_argument(
-        '-c', '--field', required=True,
-        help='Shapefile field name')
+        '-c', '--field', required=True, nargs='+',
+        help='Shapefile field name(s)')
     parser.add_argument(
-        '-n', '--null',
-        help='Null value to overwrite, default 0')
+        '-n', '--null', nargs='+',
+        help='Null value(s) to overwrite, one or one per field, default 0')
     args = parser.parse_args()
 
     # Convert input file to an absolute path
     if os.path.isfile(os.path.abspath(args.file)):
         args.file = os.path.abspath(args.file)
     if args.null is None:
-        args.null = 0
+        args.null = [0] * len(args.field)
     else:
-        args.null = int(args.null)
+        args.null = [int(n) for n in args.null]
+    if len(args.null) == 1:
+        args.null = args.null * len(args.field)
     return args
 
 
@@ -139,7 +390,7 @@ if __name__ == '__main__':
     # Calculate PRMS Muskingum Stream Parameters
     parameter_estimator(
         file_name=args.file,
-        field=args.field,
-        null_value=args.null)
+        fields=args.field,
+        null_values=args.null)
     
     
\ No newline at end of file
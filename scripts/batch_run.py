@@ -0,0 +1,267 @@
+#--------------------------------
+# Name:         batch_run.py
+# Purpose:      Calculate all PRMS parameters for many projects
+# Notes:        ArcGIS 10.2 Version
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import select_arcpy
+import arcpy
+
+from run_all import calculate_all_parameters, stage_list
+
+
+def batch_run(ini_list, workers=1, data_name='ALL', report_path=None,
+              tile_cache_ws=None, overwrite_flag=False, debug_flag=False):
+    """Calculate all PRMS parameters for a list of project INI files
+
+    Projects are run by a pool of worker processes.  Each worker imports
+    arcpy and checks out the Spatial Analyst license once (in
+    worker_init), then runs projects one after another.
+
+    If tile_cache_ws is set, every project uses it as its
+    tile_cache_folder.  The national DEM/LANDFIRE/PRISM/soil rasters
+    are then projected once per tile and shared by all basins on the
+    same output grid, and projection plans are shared by projects on
+    identical grids.
+
+    Args:
+        ini_list (list): project INI file paths
+        workers (int): number of worker processes
+        data_name (str): PRISM data type (TMAX, TMIN, PPT, ALL)
+        report_path (str): summary report CSV file path
+        tile_cache_ws (str): shared tile cache folder for all projects
+        overwrite_flag (bool): if True, overwrite existing files
+        debug_flag (bool): if True, enable debug level logging
+
+    Returns:
+        list: result dictionaries for each project
+    """
+    logging.info('\nPRMS Batch Run')
+    logging.info('  Projects: {0}'.format(len(ini_list)))
+    logging.info('  Workers:  {0}'.format(workers))
+    if tile_cache_ws:
+        # Worker processes inherit the environment
+        logging.info('  Tile cache: {0}'.format(tile_cache_ws))
+        os.environ['PRMS_TILE_CACHE'] = tile_cache_ws
+
+    task_list = [
+        (ini_path, data_name, overwrite_flag, debug_flag)
+        for ini_path in ini_list]
+    result_list = []
+    batch_start = time.time()
+    if workers <= 1:
+        arcpy.CheckOutExtension('Spatial')
+        for task in task_list:
+            result_list.append(basin_worker(task))
+            log_result(result_list[-1], len(result_list), len(task_list))
+    else:
+        # Only warnings and errors are printed from the workers,
+        #   each script still writes its full log file
+        pool = multiprocessing.Pool(
+            workers, initializer=worker_init,
+            initargs=(logging.DEBUG if debug_flag else logging.INFO,
+                      logging.WARNING))
+        try:
+            for result in pool.imap_unordered(basin_worker, task_list):
+                result_list.append(result)
+                log_result(result, len(result_list), len(task_list))
+        finally:
+            pool.close()
+            pool.join()
+    batch_time = time.time() - batch_start
+
+    # Report the projects in the order they were listed
+    result_list.sort(key=lambda r: ini_list.index(r['ini']))
+    logging.info('\n' + report_table(result_list))
+    logging.info('\nBatch run time: {0:.1f}s'.format(batch_time))
+    if report_path:
+        logging.info('\nWriting report\n  {0}'.format(report_path))
+        write_report(result_list, report_path)
+    return result_list
+
+
+def worker_init(log_level, console_level):
+    """Set up logging and check out Spatial Analyst in each worker process
+
+    The log level is applied to the console handler only, so the log
+    file handlers added by each script still get every message.
+    The stages still call CheckOutExtension, but the license is already
+    held by the worker so those calls return right away.
+    """
+    logging.basicConfig(level=log_level, format='%(message)s')
+    root_logger = logging.getLogger('')
+    root_logger.setLevel(log_level)
+    for handler in root_logger.handlers:
+        handler.setLevel(console_level)
+    arcpy.CheckOutExtension('Spatial')
+
+
+def basin_worker(task):
+    """Run all parameter scripts for one project
+
+    Errors are caught (including the sys.exit() calls in the scripts) so
+    that one project can't stop the rest of the batch.
+    """
+    ini_path, data_name, overwrite_flag, debug_flag = task
+    time_list = []
+    basin_start = time.time()
+    try:
+        calculate_all_parameters(
+            config_path=ini_path, data_name=data_name,
+            overwrite_flag=overwrite_flag, debug_flag=debug_flag,
+            time_list=time_list)
+        status = 'OK'
+    except SystemExit:
+        status = 'ERROR'
+    except Exception:
+        logging.error(traceback.format_exc())
+        status = 'ERROR'
+    finally:
+        # Don't carry environment settings into the next project
+        arcpy.ResetEnvironments()
+    return {
+        'ini': ini_path, 'status': status,
+        'total': time.time() - basin_start, 'stages': time_list,
+        'worker': multiprocessing.current_process().name}
+
+
+def log_result(result, i, n):
+    """Log a finished project"""
+    logging.info('  [{0}/{1}] {2} {3} ({4:.1f}s)'.format(
+        i, n, result['status'], result['ini'], result['total']))
+    if result['status'] != 'OK' and result['stages']:
+        logging.info('    Last finished stage: {0}'.format(
+            result['stages'][-1][0]))
+
+
+def report_table(result_list):
+    """Summary table of the run time (seconds) of each project/stage"""
+    stage_names = [stage[0] for stage in stage_list]
+    name_width = max([7] + [
+        len(os.path.basename(r['ini'])) for r in result_list])
+    header = '{0:<{1}s} {2:>6s} {3:>9s}'.format(
+        'Project', name_width, 'Status', 'Total')
+    header += ''.join(' {0:>9s}'.format(n[:9]) for n in stage_names)
+    line_list = [header, '-' * len(header)]
+    for result in result_list:
+        stage_dict = dict(result['stages'])
+        line = '{0:<{1}s} {2:>6s} {3:>9.1f}'.format(
+            os.path.basename(result['ini']), name_width, result['status'],
+            result['total'])
+        for stage_name in stage_names:
+            if stage_name in stage_dict.keys():
+                line += ' {0:>9.1f}'.format(stage_dict[stage_name])
+            else:
+                line += ' {0:>9s}'.format('-')
+        line_list.append(line)
+
+    # Stage totals show where the batch spent its time
+    stage_totals = [
+        sum(dict(r['stages']).get(n, 0) for r in result_list)
+        for n in stage_names]
+    line_list.append('-' * len(header))
+    line_list.append(
+        '{0:<{1}s} {2:>6s} {3:>9.1f}'.format(
+            'Total', name_width, '', sum(r['total'] for r in result_list)) +
+        ''.join(' {0:>9.1f}'.format(t) for t in stage_totals))
+    return '\n'.join(line_list)
+
+
+def write_report(result_list, report_path):
+    """Write the project/stage run times (seconds) to a CSV file"""
+    stage_names = [stage[0] for stage in stage_list]
+    with open(report_path, 'w') as report_f:
+        report_f.write(','.join(
+            ['INI', 'STATUS', 'WORKER', 'TOTAL'] +
+            [n.upper() for n in stage_names]) + '\n')
+        for result in result_list:
+            stage_dict = dict(result['stages'])
+            report_f.write(','.join(
+                [result['ini'], result['status'], result['worker'],
+                 '{0:.3f}'.format(result['total'])] +
+                ['{0:.3f}'.format(stage_dict[n])
+                 if n in stage_dict.keys() else ''
+                 for n in stage_names]) + '\n')
+
+
+def build_ini_list(ini_args):
+    """Expand INI paths/wildcards to a list of unique absolute paths"""
+    ini_list = []
+    for ini_arg in ini_args:
+        ini_paths = sorted(glob.glob(ini_arg))
+        if not ini_paths:
+            logging.warning('  No INI files match: {0}'.format(ini_arg))
+        for ini_path in ini_paths:
+            ini_path = os.path.abspath(ini_path)
+            if ini_path not in ini_list:
+                ini_list.append(ini_path)
+    return ini_list
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='PRMS Batch Run',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-i', '--ini', required=True, nargs='+',
+        help='Project input files (wildcards are expanded)', metavar='PATH')
+    parser.add_argument(
+        '-w', '--workers', default=1, type=int,
+        help='Number of worker processes')
+    parser.add_argument(
+        '-r', '--report', default='batch_run_report.csv',
+        help='Summary report CSV file', metavar='PATH')
+    parser.add_argument(
+        '-c', '--cache', default=None,
+        help='Tile cache folder shared by all projects', metavar='FOLDER')
+    parser.add_argument(
+        '-o', '--overwrite', default=False, action="store_true",
+        help='Force overwrite of existing files')
+    parser.add_argument(
+        '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action="store_const", dest="loglevel")
+    parser.add_argument(
+        '--type', default='ALL',
+        help='PRISM Data Type (TMAX, TMIN, PPT, ALL)')
+    args = parser.parse_args()
+
+    # Convert report file and cache folder to absolute paths
+    args.report = os.path.abspath(args.report)
+    if args.cache:
+        args.cache = os.path.abspath(args.cache)
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{0}'.format('#'*80))
+    log_f = '{0:<20s} {1}'
+    logging.info(log_f.format('Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Current Directory:', os.getcwd()))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    ini_list = build_ini_list(args.ini)
+    if not ini_list:
+        logging.error('\nERROR: No project INI files were found')
+        sys.exit()
+
+    # Calculate PRMS Parameters for each project
+    batch_run(
+        ini_list, workers=args.workers, data_name=args.type,
+        report_path=args.report, tile_cache_ws=args.cache,
+        overwrite_flag=args.overwrite,
+        debug_flag=args.loglevel==logging.DEBUG)
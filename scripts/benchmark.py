@@ -0,0 +1,505 @@
+#--------------------------------
+# Name:         benchmark.py
+# Purpose:      Time the NumPy/Python hot paths on synthetic basins
+# Notes:        ArcGIS 10.2 Version
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Set PRMS_ARCPY=FAKE to run without ArcGIS (see select_arcpy.py)
+from support_functions import *
+from prms_template_fill import param_value_str, patch_parameter_file
+
+# The climate converter and parameter editor are in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from select_param_editor import ParamEdit
+try:
+    from hru_climate_converter import ClimateCache
+    import pandas as pd
+except ImportError:
+    ClimateCache = None
+
+
+# Number of HRUs for each scale
+scale_dict = {'10k': 10000, '100k': 100000, '1m': 1000000}
+
+# Pure Python cases are run on a subset so the larger scales finish
+flood_fill_max_cells = 512 * 512
+param_edit_max_hrus = 100000
+climate_max_hrus = 2000
+climate_days = 3650
+
+
+def benchmark(scale_list, case_list=None, repeat=3, seed=0,
+              results_path=None, regression_ratio=1.25):
+    """Time the hot paths on synthetic basins
+
+    Args:
+        scale_list (list): scale names (10k, 100k, 1m)
+        case_list (list): case names to run (all if None)
+        repeat (int): number of times each case is run (best is kept)
+        seed (int): random seed for the synthetic basins
+        results_path (str): JSON lines file the results are added to
+        regression_ratio (float): flag cases that are this many times
+            slower than the median of the previous runs
+
+    Returns:
+        list: result dictionaries
+    """
+    logging.info('\nPRMS Benchmark')
+    previous_list = read_results(results_path)
+    run_dict = {
+        'time': dt.datetime.now().isoformat(' '),
+        'commit': git_commit(), 'host': platform.node(),
+        'python': platform.python_version(), 'numpy': np.__version__}
+    logging.info('  Commit: {0}'.format(run_dict['commit']))
+
+    temp_ws = tempfile.mkdtemp(prefix='prms_benchmark_')
+    result_list = []
+    try:
+        for scale in scale_list:
+            logging.info('\nScale: {0} HRUs'.format(scale))
+            basin = SyntheticBasin(scale_dict[scale], temp_ws, seed)
+            for case_name, setup_func, case_func in case_func_list:
+                if case_list and case_name not in case_list:
+                    continue
+                if case_name == 'climate_conversion' and ClimateCache is None:
+                    logging.info('  {0}: skipped (pandas)'.format(case_name))
+                    continue
+                time_list = []
+                for i in xrange(repeat):
+                    # Inputs that a case modifies are rebuilt (not timed)
+                    if setup_func is not None:
+                        setup_func(basin)
+                    case_start = time.time()
+                    case_n = case_func(basin)
+                    time_list.append(time.time() - case_start)
+                result = dict(run_dict)
+                result.update({
+                    'scale': scale, 'case': case_name, 'n': case_n,
+                    'seconds': min(time_list), 'peak_rss': peak_rss_func()})
+                result_list.append(result)
+                logging.info('  {0}: {1:.3f}s'.format(
+                    case_name, result['seconds']))
+            del basin
+    finally:
+        shutil.rmtree(temp_ws, ignore_errors=True)
+
+    logging.info('\n' + results_table(
+        result_list, previous_list, regression_ratio))
+    if results_path:
+        logging.info('\nAdding results to\n  {0}'.format(results_path))
+        with open(results_path, 'a') as results_f:
+            for result in result_list:
+                results_f.write(json.dumps(result, sort_keys=True) + '\n')
+    return result_list
+
+
+class SyntheticBasin():
+    """Synthetic DEM, HRUs, streams and remaps for a number of HRUs
+
+    HRUs are square blocks of hru_cells x hru_cells DEM cells on a
+    square grid.  The HRU polygons (for point in polygon) are the same
+    grid with jittered corners.  Stream segments are a random tree
+    with shuffled segment IDs.
+    """
+    def __init__(self, hru_count, temp_ws, seed=0, hru_cells=4, cs=10.0):
+        self.temp_ws = temp_ws
+        self.random = np.random.RandomState(seed)
+        self.hru_side = int(round(np.sqrt(hru_count)))
+        self.hru_count = self.hru_side ** 2
+        self.hru_cells = hru_cells
+        self.cs = cs
+        self.rows = self.cols = self.hru_side * hru_cells
+        logging.info('  Building synthetic basin ({0} x {1} cells)'.format(
+            self.rows, self.cols))
+
+        self.dem_array = fractal_dem(self.rows, self.cols, self.random)
+        self.flow_dir_array = d8_flow_dir(self.dem_array, cs)
+        self.hru_array = hru_zone_array(self.hru_side, hru_cells)
+        self.seg_array = stream_zone_array(self.hru_side, hru_cells)
+        self.veg_array = self.random.randint(
+            3000, 3400, (self.rows, self.cols)).astype(np.int32)
+
+        self.nseg = max(self.hru_count // 10, 1)
+        self.tosegment_array = random_tosegment(self.nseg, self.random)
+        self.edge_list, self.x_array, self.y_array = hru_polygon_mesh(
+            self.hru_side, hru_cells * cs, self.random)
+
+        self.remap_path = os.path.join(temp_ws, 'veg_remap.rmp')
+        write_remap(self.remap_path, self.random)
+
+
+def fractal_dem(rows, cols, random, beta=3.0, relief=1000.0):
+    """Fractal terrain from spectral synthesis (power ~ 1 / f^beta)
+
+    A regional slope is added so the terrain drains to one edge.
+    """
+    row_freq = np.fft.fftfreq(rows)[:, None]
+    col_freq = np.arange(cols // 2 + 1, dtype=np.float64)[None, :] / cols
+    freq = np.sqrt(row_freq ** 2 + col_freq ** 2)
+    freq[0, 0] = 1
+    amplitude = freq ** (-beta / 2)
+    amplitude[0, 0] = 0
+    phase = random.uniform(0, 2 * np.pi, amplitude.shape)
+    dem_array = np.fft.irfft2(amplitude * np.exp(1j * phase), s=(rows, cols))
+    del row_freq, col_freq, freq, amplitude, phase
+    dem_array -= dem_array.min()
+    dem_array *= relief / dem_array.max()
+    dem_array += np.linspace(relief, 0, rows)[:, None]
+    return dem_array
+
+
+def d8_flow_dir(dem_array, cs):
+    """D8 flow direction codes of the steepest downslope neighbor"""
+    rows, cols = dem_array.shape
+    pad_array = np.empty((rows + 2, cols + 2), dtype=np.float64)
+    pad_array.fill(np.inf)
+    pad_array[1:-1, 1:-1] = dem_array
+    flow_dir_array = np.zeros(dem_array.shape, dtype=np.int32)
+    max_drop = np.zeros(dem_array.shape, dtype=np.float64)
+    for d8_code, (row_offset, col_offset) in sorted(d8_offset_dict.items()):
+        drop = (dem_array - pad_array[
+            1 + row_offset:rows + 1 + row_offset,
+            1 + col_offset:cols + 1 + col_offset])
+        drop /= cs * np.hypot(row_offset, col_offset)
+        drop_mask = drop > max_drop
+        flow_dir_array[drop_mask] = d8_code
+        max_drop[drop_mask] = drop[drop_mask]
+    return flow_dir_array
+
+
+def hru_zone_array(hru_side, hru_cells):
+    """HRU IDs (1 based) of square blocks of cells"""
+    block_array = np.arange(1, hru_side ** 2 + 1).reshape(hru_side, hru_side)
+    return np.repeat(np.repeat(block_array, hru_cells, 0), hru_cells, 1)
+
+
+def stream_zone_array(hru_side, hru_cells, spacing=10):
+    """Stream segment IDs on every spacing-th HRU column"""
+    seg_array = np.zeros((hru_side * hru_cells,) * 2, dtype=np.int64)
+    seg_rows = np.arange(seg_array.shape[0])
+    for seg_col in xrange(0, seg_array.shape[1], spacing * hru_cells):
+        seg_array[:, seg_col] = (
+            seg_rows // (spacing * hru_cells) + 1 + seg_col * hru_side)
+    return seg_array
+
+
+def random_tosegment(nseg, random):
+    """Random stream tree, shuffled so segment IDs aren't in order"""
+    parent_array = np.zeros(nseg, dtype=np.int64)
+    parent_array[1:] = (random.uniform(size=nseg - 1) *
+                        np.arange(1, nseg)).astype(np.int64) + 1
+    seg_ids = random.permutation(nseg) + 1
+    tosegment_array = np.zeros(nseg, dtype=np.int64)
+    tosegment_array[seg_ids - 1] = np.where(
+        np.arange(nseg) > 0, seg_ids[parent_array - 1], 0)
+    return tosegment_array
+
+
+def hru_polygon_mesh(hru_side, hru_cs, random, jitter=0.25):
+    """Quadrilateral HRU polygons with jittered corners
+
+    Returns:
+        tuple: edge arrays (polygon_edge_func style) and the x/y of a
+            point inside each polygon
+    """
+    corner_x, corner_y = np.meshgrid(
+        np.arange(hru_side + 1) * hru_cs, np.arange(hru_side + 1) * hru_cs)
+    corner_x = corner_x + random.uniform(-jitter, jitter, corner_x.shape) * hru_cs
+    corner_y = corner_y + random.uniform(-jitter, jitter, corner_y.shape) * hru_cs
+    # Corners of each quad in clockwise order (ll, ul, ur, lr)
+    quad_x = np.dstack((
+        corner_x[:-1, :-1], corner_x[1:, :-1],
+        corner_x[1:, 1:], corner_x[:-1, 1:])).reshape(-1, 4)
+    quad_y = np.dstack((
+        corner_y[:-1, :-1], corner_y[1:, :-1],
+        corner_y[1:, 1:], corner_y[:-1, 1:])).reshape(-1, 4)
+    edge_array = np.dstack((
+        quad_x, quad_y, np.roll(quad_x, -1, 1), np.roll(quad_y, -1, 1)))
+    return (list(edge_array), quad_x.mean(axis=1), quad_y.mean(axis=1))
+
+
+def write_remap(remap_path, random):
+    """ASCII remap with direct values and ranges (like the veg remaps)"""
+    with open(remap_path, 'w') as remap_f:
+        remap_f.write('# Synthetic vegetation remap\n')
+        for value in xrange(3000, 3200):
+            remap_f.write('{0} : {1}\n'.format(value, random.randint(0, 5)))
+        for value in xrange(3200, 3400, 20):
+            remap_f.write('{0} {1} : {2}\n'.format(
+                value, value + 20, random.randint(0, 5)))
+
+
+def write_parameter_file(param_path, hru_count, param_count=20):
+    """Write a PRMS parameter file with HRU parameters
+
+    Values are formatted with param_value_str, like prms_template_fill.
+    """
+    value_array = np.arange(hru_count, dtype=np.float64) / hru_count
+    with open(param_path, 'w') as output_f:
+        output_f.write('Synthetic parameter file\nVersion: 1.7\n')
+        output_f.write('** Dimensions **\n####\nnhru\n{0}\n'.format(
+            hru_count))
+        output_f.write('** Parameters **\n')
+        for param_i in xrange(param_count):
+            param_type = 2 if param_i % 2 else 1
+            output_f.write('####\nparam_{0:02d} 10\n1\nnhru\n{1}\n{2}\n'.format(
+                param_i, hru_count, param_type))
+            for param_value in value_array * param_i:
+                output_f.write(param_value_str(param_value, param_type) + '\n')
+    return hru_count * param_count
+
+
+# Benchmark cases, each returns the number of items processed
+# Setup functions build the inputs of a case and are not timed
+def zonal_mean_case(basin):
+    zs_obj = ZonalAccumulator('MEAN')
+    for row_i in xrange(0, basin.rows, 1024):
+        zs_obj.add(basin.hru_array[row_i:row_i + 1024],
+                   basin.dem_array[row_i:row_i + 1024])
+    zs_obj.result()
+    return basin.dem_array.size
+
+
+def zonal_majority_case(basin):
+    zs_obj = ZonalAccumulator('MAJORITY')
+    for row_i in xrange(0, basin.rows, 1024):
+        zs_obj.add(basin.hru_array[row_i:row_i + 1024],
+                   basin.veg_array[row_i:row_i + 1024])
+    zs_obj.result()
+    return basin.veg_array.size
+
+
+def remap_case(basin):
+    Remap(basin.remap_path)(basin.veg_array)
+    return basin.veg_array.size
+
+
+def flood_fill_case(basin):
+    side = int(min(basin.rows, np.sqrt(flood_fill_max_cells)))
+    flood_fill(basin.dem_array[:side, :side], four_way_flag=True)
+    return side * side
+
+
+def erosion_case(basin):
+    np_binary_erosion(basin.dem_array > np.median(basin.dem_array))
+    return basin.dem_array.size
+
+
+def cascade_case(basin):
+    pair_list = [cascade_pair_func(
+        basin.flow_dir_array, basin.hru_array, basin.seg_array)]
+    cascade_pct_func(pair_list)
+    return basin.hru_array.size
+
+
+def stream_topology_case(basin):
+    topo_order = segment_topo_order(basin.tosegment_array)
+    segment_strahler_order(basin.tosegment_array, topo_order)
+    segment_upstream_sum(
+        basin.tosegment_array, topo_order, np.ones(basin.nseg))
+    segment_outlet(basin.tosegment_array, topo_order)
+    return basin.nseg
+
+
+def point_in_polygon_case(basin):
+    points_in_polygons_func(basin.x_array, basin.y_array, basin.edge_list)
+    return basin.hru_count
+
+
+def template_write_case(basin):
+    return write_parameter_file(
+        os.path.join(basin.temp_ws, 'template.param'), basin.hru_count)
+
+
+def param_patch_setup(basin):
+    basin.patch_path = os.path.join(basin.temp_ws, 'patch.param')
+    write_parameter_file(basin.patch_path, basin.hru_count)
+
+
+def param_patch_case(basin):
+    # Patch 1% of the HRUs in every parameter
+    patch_index = np.arange(0, basin.hru_count, 100).tolist()
+    patch_parameter_file(basin.patch_path, dict(
+        ('param_{0:02d}'.format(param_i), dict(
+            (i, param_value_str(1, 1)) for i in patch_index))
+        for param_i in xrange(20)))
+    return len(patch_index) * 20
+
+
+def param_edit_setup(basin):
+    basin.edit_path = os.path.join(basin.temp_ws, 'edit.param')
+    write_parameter_file(
+        basin.edit_path, min(basin.hru_count, param_edit_max_hrus),
+        param_count=4)
+
+
+def param_edit_case(basin):
+    # ParamEdit prints its progress
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        ParamEdit(basin.edit_path, 'param_03', 1.5, upper=0.5,
+                  selector='param_01', scaling=True)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return min(basin.hru_count, param_edit_max_hrus)
+
+
+def climate_conversion_setup(basin):
+    basin.climate_ws = os.path.join(basin.temp_ws, 'climate_cache')
+    if os.path.isdir(basin.climate_ws):
+        shutil.rmtree(basin.climate_ws)
+    if hasattr(basin, 'climate_df'):
+        return
+    hru_count = min(basin.hru_count, climate_max_hrus)
+    date_index = pd.date_range('2000-01-01', periods=climate_days)
+    column_list = ['year', 'month', 'day'] + [
+        '{0}[{1}]'.format(var_name, hru_id)
+        for var_name in ['tmax', 'tmin', 'precip']
+        for hru_id in xrange(1, hru_count + 1)]
+    basin.climate_df = pd.DataFrame(
+        np.column_stack([
+            date_index.year, date_index.month, date_index.day,
+            basin.random.uniform(size=(climate_days, 3 * hru_count))]),
+        columns=column_list)
+
+
+def climate_conversion_case(basin):
+    hru_count = min(basin.hru_count, climate_max_hrus)
+    climate_cache = ClimateCache(basin.climate_ws, 'synthetic')
+    climate_cache.build(basin.climate_df)
+    climate_cache.write_data_file(
+        'tmax', os.path.join(basin.temp_ws, 'tmax.data'),
+        '2005-01-01', '2006-12-31')
+    return hru_count * climate_days
+
+
+# Case name, setup function and case function
+case_func_list = [
+    ('zonal_mean', None, zonal_mean_case),
+    ('zonal_majority', None, zonal_majority_case),
+    ('remap', None, remap_case),
+    ('flood_fill', None, flood_fill_case),
+    ('erosion', None, erosion_case),
+    ('cascades', None, cascade_case),
+    ('stream_topology', None, stream_topology_case),
+    ('point_in_polygon', None, point_in_polygon_case),
+    ('template_write', None, template_write_case),
+    ('param_patch', param_patch_setup, param_patch_case),
+    ('param_edit', param_edit_setup, param_edit_case),
+    ('climate_conversion', climate_conversion_setup,
+     climate_conversion_case),
+]
+
+
+def read_results(results_path):
+    """Read the results of previous runs"""
+    if not results_path or not os.path.isfile(results_path):
+        return []
+    with open(results_path, 'r') as results_f:
+        return [json.loads(line) for line in results_f if line.strip()]
+
+
+def results_table(result_list, previous_list, regression_ratio=1.25,
+                  history=5):
+    """Summary table comparing each case to the previous runs
+
+    The baseline is the median of the last history runs of the same
+    case and scale on the same host.
+    """
+    header = '{0:<20s} {1:>5s} {2:>10s} {3:>10s} {4:>7s} {5:>10s}'.format(
+        'Case', 'Scale', 'Seconds', 'Baseline', 'Ratio', '')
+    line_list = [header, '-' * len(header)]
+    for result in result_list:
+        baseline_list = [
+            r['seconds'] for r in previous_list
+            if (r['case'] == result['case'] and
+                r['scale'] == result['scale'] and
+                r['host'] == result['host'])][-history:]
+        if baseline_list:
+            baseline = float(np.median(baseline_list))
+            ratio = result['seconds'] / baseline if baseline else 1.0
+            line_list.append(
+                '{0:<20s} {1:>5s} {2:>10.3f} {3:>10.3f} {4:>7.2f} {5:>10s}'.format(
+                    result['case'], result['scale'], result['seconds'],
+                    baseline, ratio,
+                    'SLOWER' if ratio > regression_ratio else ''))
+        else:
+            line_list.append('{0:<20s} {1:>5s} {2:>10.3f} {3:>10s}'.format(
+                result['case'], result['scale'], result['seconds'], '-'))
+    return '\n'.join(line_list)
+
+
+def git_commit():
+    """Short hash of the current commit, None if it can't be read"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='PRMS Benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-s', '--scale', default=['10k'], nargs='+',
+        choices=sorted(scale_dict.keys()), help='Number of HRUs')
+    parser.add_argument(
+        '-c', '--case', default=None, nargs='+',
+        choices=[case[0] for case in case_func_list],
+        help='Cases to run (default all)')
+    parser.add_argument(
+        '-n', '--repeat', default=3, type=int,
+        help='Runs of each case (the fastest is kept)')
+    parser.add_argument(
+        '--seed', default=0, type=int, help='Random seed')
+    parser.add_argument(
+        '-r', '--results', default='benchmark_results.json',
+        help='Results file (one JSON result per line)', metavar='PATH')
+    parser.add_argument(
+        '--ratio', default=1.25, type=float,
+        help='Flag cases this many times slower than previous runs')
+    parser.add_argument(
+        '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action="store_const", dest="loglevel")
+    args = parser.parse_args()
+
+    # Convert results file to an absolute path
+    args.results = os.path.abspath(args.results)
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{0}'.format('#'*80))
+    log_f = '{0:<20s} {1}'
+    logging.info(log_f.format('Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Current Directory:', os.getcwd()))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    benchmark(
+        args.scale, case_list=args.case, repeat=args.repeat, seed=args.seed,
+        results_path=args.results, regression_ratio=args.ratio)
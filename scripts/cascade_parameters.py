@@ -0,0 +1,192 @@
+#--------------------------------
+# Name:         cascade_parameters.py
+# Purpose:      PRMS HRU cascade parameters
+# Notes:        ArcGIS 10.2 Version
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import itertools
+import logging
+import os
+import sys
+
+import select_arcpy
+import arcpy
+from arcpy import env
+from arcpy.sa import *
+
+import numpy as np
+
+from support_functions import *
+
+
+@instrument('cascade_parameters', stage_flag=True)
+def cascade_parameters(config_path, overwrite_flag=False, debug_flag=False):
+    """Calculate PRMS HRU Cascade Parameters
+
+    Cascades are built in process from the D8 flow direction raster,
+    an HRU zone raster, and a stream segment raster.  This replaces
+    running the Cascade Routing Tool (CRT) executable.
+
+    Args:
+        config_file (str): Project config file path
+        ovewrite_flag (bool): if True, overwrite existing files
+        debug_flag (bool): if True, enable debug level logging
+
+    Returns:
+        None
+    """
+
+    # Initialize hru_parameters class
+    hru = HRUParameters(config_path)
+
+    # Log DEBUG to file
+    log_file_name = 'cascade_parameters_log.txt'
+    log_console = logging.FileHandler(
+        filename=os.path.join(hru.log_ws, log_file_name), mode='w')
+    log_console.setLevel(logging.DEBUG)
+    log_console.setFormatter(logging.Formatter('%(message)s'))
+    logging.getLogger('').addHandler(log_console)
+    logging.info('\nPRMS Cascade Parameters')
+
+    # Check the polygon path
+    hru.check_polygon_path()
+    if not arcpy.Exists(hru.stream_path):
+        logging.error(
+            '\nERROR: Stream shapefile ({0}) does not exist'.format(
+                hru.stream_path))
+        sys.exit()
+
+    # Input folders
+    dem_temp_ws = os.path.join(hru.param_ws, 'dem_rasters')
+    dem_fill_path = os.path.join(dem_temp_ws, 'dem_fill.img')
+    flow_dir_path = os.path.join(dem_temp_ws, 'flow_dir.img')
+    cascade_temp_ws = os.path.join(hru.param_ws, 'cascade_rasters')
+    if not os.path.isdir(cascade_temp_ws):
+        os.mkdir(cascade_temp_ws)
+
+    # Output paths
+    hru_zone_path = os.path.join(cascade_temp_ws, 'hru_zones.img')
+    seg_zone_path = os.path.join(cascade_temp_ws, 'seg_zones.img')
+
+    # Set ArcGIS environment variables
+    arcpy.CheckOutExtension('Spatial')
+    env.overwriteOutput = True
+    env.pyramid = 'PYRAMIDS 0'
+    env.workspace = cascade_temp_ws
+    env.scratchWorkspace = hru.scratch_ws
+
+    # Flow direction is only saved by dem_parameters if it was needed
+    if not arcpy.Exists(flow_dir_path):
+        if not arcpy.Exists(dem_fill_path):
+            logging.error(
+                ('\nERROR: Filled DEM raster does not exist' +
+                 '\nERROR:   {0}' +
+                 '\nERROR: Try re-running dem_parameters.py').format(
+                     dem_fill_path))
+            sys.exit()
+        logging.info('\nCalculating flow direction raster')
+        flow_dir_path = os.path.join(cascade_temp_ws, 'flow_dir.img')
+        flow_dir_obj = FlowDirection(Raster(dem_fill_path), True)
+        flow_dir_obj.save(flow_dir_path)
+        del flow_dir_obj
+    flow_dir_obj = Raster(flow_dir_path)
+    flow_dir_cs = flow_dir_obj.meanCellWidth
+
+    # HRU and stream segment rasters on the flow direction grid
+    # Segment IDs are the stream FID + 1, the same as TOSEGMENT
+    logging.info('\nBuilding HRU and stream segment rasters')
+    zone_raster_func(
+        hru.polygon_path, hru.id_field, hru_zone_path,
+        flow_dir_path, flow_dir_cs)
+    env.extent = flow_dir_path
+    env.snapRaster = flow_dir_path
+    env.outputCoordinateSystem = hru.polygon_path
+    seg_id_field = arcpy.Describe(hru.stream_path).OIDFieldName
+    arcpy.PolylineToRaster_conversion(
+        hru.stream_path, seg_id_field, seg_zone_path,
+        'MAXIMUM_LENGTH', '', flow_dir_cs)
+    arcpy.ClearEnvironment('extent')
+    arcpy.ClearEnvironment('snapRaster')
+    arcpy.ClearEnvironment('outputCoordinateSystem')
+
+    # Count the cells that cascade out of each HRU one tile at a time
+    logging.info('Routing cells')
+    pair_list = []
+    tile_iter = itertools.izip(
+        raster_halo_tiles(flow_dir_obj),
+        raster_halo_tiles(Raster(hru_zone_path)),
+        raster_halo_tiles(Raster(seg_zone_path)))
+    for flow_dir_tile, hru_tile, seg_tile in tile_iter:
+        logging.debug('  Rows {0}-{1}'.format(*flow_dir_tile[:2]))
+        pair_list.append(cascade_pair_func(
+            flow_dir_tile[2], hru_tile[2], seg_tile[2] + 1))
+    del tile_iter, flow_dir_obj
+
+    # Circular cascades are removed using the HRU mean elevations
+    hru_elev_array = arcpy.da.TableToNumPyArray(
+        hru.polygon_path, [hru.id_field, hru.dem_mean_field])
+    hru_up_id, hru_down_id, hru_strmseg_down_id, hru_pct_up = \
+        cascade_pct_func(
+            pair_list, hru_elev_array[hru.id_field],
+            hru_elev_array[hru.dem_mean_field], hru.cascade_min_pct)
+    del pair_list, hru_elev_array
+    logging.info('  ncascade = {0}'.format(hru_up_id.size))
+    logging.info('  HRUs with cascades = {0}'.format(
+        np.unique(hru_up_id).size))
+    logging.info('  Stream cascades = {0}'.format(
+        int(np.sum(hru_strmseg_down_id > 0))))
+
+    # Write the cascade parameters for prms_template_fill
+    logging.info('\nWriting cascade parameters')
+    logging.info('  {0}'.format(hru.cascade_path))
+    with open(hru.cascade_path, 'w') as output_f:
+        output_f.write(
+            'hru_up_id,hru_down_id,hru_strmseg_down_id,hru_pct_up\n')
+        for row in zip(hru_up_id.tolist(), hru_down_id.tolist(),
+                       hru_strmseg_down_id.tolist(), hru_pct_up.tolist()):
+            output_f.write('{0},{1},{2},{3:.6f}\n'.format(*row))
+
+    # Cleanup
+    for temp_path in [hru_zone_path, seg_zone_path]:
+        arcpy.Delete_management(temp_path)
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='Cascade Parameters',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-i', '--ini', required=True,
+        help='Project input file', metavar='PATH')
+    parser.add_argument(
+        '-o', '--overwrite', default=False, action="store_true",
+        help='Force overwrite of existing files')
+    parser.add_argument(
+        '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action="store_const", dest="loglevel")
+    args = parser.parse_args()
+
+    # Convert input file to an absolute path
+    if os.path.isfile(os.path.abspath(args.ini)):
+        args.ini = os.path.abspath(args.ini)
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{0}'.format('#'*80))
+    log_f = '{0:<20s} {1}'
+    logging.info(log_f.format('Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Current Directory:', os.getcwd()))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    # Calculate PRMS Cascade Parameters
+    cascade_parameters(
+        config_path=args.ini, overwrite_flag=args.overwrite,
+        debug_flag=args.loglevel==logging.DEBUG)
@@ -0,0 +1,159 @@
+#--------------------------------
+# Name:         coordinate_transforms.py
+# Purpose:      Vectorized coordinate transforms with NumPy arrays
+# Python:       2.7
+#--------------------------------
+
+import logging
+import sys
+
+import numpy as np
+
+
+# Semi-major axis (meters) and inverse flattening of each GCS
+spheroid_dict = {
+    'GCS_North_American_1983': (6378137.0, 298.257222101),
+    'GCS_WGS_1984': (6378137.0, 298.257223563),
+}
+
+# NAD_1983_To_WGS_1984_5 (EPSG:1515), coordinate frame rotation
+# Translations (meters), rotations (arc-seconds), scale difference (ppm)
+helmert_dict = {
+    'NAD_1983_To_WGS_1984_5': (
+        -0.991, 1.9072, 0.5129, -0.02579, -0.00965, -0.01166, 0.0),
+}
+
+
+def geodetic_to_ecef(lon, lat, a, inv_f):
+    """Geodetic longitude/latitude (degrees) to earth centered XYZ"""
+    e2 = (2 - 1.0 / inv_f) / inv_f
+    lon_r, lat_r = np.radians(lon), np.radians(lat)
+    sin_lat = np.sin(lat_r)
+    n = a / np.sqrt(1 - e2 * sin_lat ** 2)
+    return (
+        n * np.cos(lat_r) * np.cos(lon_r),
+        n * np.cos(lat_r) * np.sin(lon_r),
+        n * (1 - e2) * sin_lat)
+
+
+def ecef_to_geodetic(x, y, z, a, inv_f, iterations=4):
+    """Earth centered XYZ to geodetic longitude/latitude (degrees)
+
+    Latitude is solved iteratively, which converges to well under a
+    millimeter in a few iterations for points near the surface.
+    """
+    e2 = (2 - 1.0 / inv_f) / inv_f
+    p = np.hypot(x, y)
+    lat_r = np.arctan2(z, p * (1 - e2))
+    for i in xrange(iterations):
+        sin_lat = np.sin(lat_r)
+        n = a / np.sqrt(1 - e2 * sin_lat ** 2)
+        lat_r = np.arctan2(z + e2 * n * sin_lat, p)
+    return np.degrees(np.arctan2(y, x)), np.degrees(lat_r)
+
+
+def helmert_func(x, y, z, params, inverse_flag=False):
+    """Seven parameter (coordinate frame rotation) datum shift of XYZ"""
+    tx, ty, tz, rx, ry, rz, ds = params
+    rx, ry, rz = np.radians(np.array([rx, ry, rz]) / 3600.0)
+    s = 1 + ds * 1E-6
+    if not inverse_flag:
+        return (
+            tx + s * (x + rz * y - ry * z),
+            ty + s * (-rz * x + y + rx * z),
+            tz + s * (ry * x - rx * y + z))
+    # The rotations are small, so the inverse is the transpose
+    x, y, z = (x - tx) / s, (y - ty) / s, (z - tz) / s
+    return (
+        x - rz * y + ry * z,
+        rz * x + y - rx * z,
+        -ry * x + rx * y + z)
+
+
+def datum_shift_func(lon, lat, input_gcs, output_gcs, transform):
+    """Shift geographic coordinates between NAD83 and WGS84
+
+    Args:
+        lon (:class:`numpy.array`): longitude (degrees)
+        lat (:class:`numpy.array`): latitude (degrees)
+        input_gcs (str): input GCS name
+        output_gcs (str): output GCS name
+        transform (str): transformation name from transform_func
+            If None, the coordinates are returned unchanged
+
+    Returns:
+        tuple: shifted longitude and latitude arrays (degrees)
+    """
+    if not transform or input_gcs == output_gcs:
+        return lon, lat
+    if transform not in helmert_dict.keys():
+        logging.error(
+            '\nERROR: Unsupported transformation: {0}'.format(transform))
+        sys.exit()
+    for gcs in [input_gcs, output_gcs]:
+        if gcs not in spheroid_dict.keys():
+            logging.error(
+                '\nERROR: Unsupported geographic coordinate system: ' +
+                '{0}'.format(gcs))
+            sys.exit()
+    # Transform names are defined from NAD83 to WGS84
+    inverse_flag = input_gcs == 'GCS_WGS_1984'
+    x, y, z = geodetic_to_ecef(lon, lat, *spheroid_dict[input_gcs])
+    x, y, z = helmert_func(x, y, z, helmert_dict[transform], inverse_flag)
+    return ecef_to_geodetic(x, y, z, *spheroid_dict[output_gcs])
+
+
+def albers_params_func(sr):
+    """Albers projection parameters from an arcpy SpatialReference"""
+    return {
+        'a': float(sr.semiMajorAxis),
+        'inv_f': 1.0 / float(sr.flattening),
+        'lat_1': float(sr.standardParallel1),
+        'lat_2': float(sr.standardParallel2),
+        'lat_0': float(sr.latitudeOfOrigin),
+        'lon_0': float(sr.centralMeridian),
+        'x_0': float(sr.falseEasting),
+        'y_0': float(sr.falseNorthing),
+        'units': float(sr.metersPerUnit),
+    }
+
+
+def albers_forward(lon, lat, a, inv_f, lat_1, lat_2, lat_0, lon_0,
+                   x_0=0.0, y_0=0.0, units=1.0):
+    """Albers equal area conic projection on the ellipsoid
+
+    Snyder (1987) Map Projections - A Working Manual, equations 14-1 to
+    14-15.  Angles are in degrees, a is in meters, and the false
+    easting/northing are in the output units.
+
+    Returns:
+        tuple: x and y arrays
+    """
+    e2 = (2 - 1.0 / inv_f) / inv_f
+    e = np.sqrt(e2)
+
+    def m_func(phi):
+        return np.cos(phi) / np.sqrt(1 - e2 * np.sin(phi) ** 2)
+
+    def q_func(phi):
+        sin_phi = np.sin(phi)
+        return (1 - e2) * (
+            sin_phi / (1 - e2 * sin_phi ** 2) -
+            np.log((1 - e * sin_phi) / (1 + e * sin_phi)) / (2 * e))
+
+    phi_1, phi_2, phi_0 = np.radians([lat_1, lat_2, lat_0])
+    m_1, m_2 = m_func(phi_1), m_func(phi_2)
+    q_1, q_2, q_0 = q_func(phi_1), q_func(phi_2), q_func(phi_0)
+    if abs(phi_1 - phi_2) > 1E-10:
+        n = (m_1 ** 2 - m_2 ** 2) / (q_2 - q_1)
+    else:
+        n = np.sin(phi_1)
+    c = m_1 ** 2 + n * q_1
+    rho_0 = a * np.sqrt(c - n * q_0) / n
+
+    rho = a * np.sqrt(c - n * q_func(np.radians(lat))) / n
+    # Longitude difference is wrapped to +/-180
+    theta = n * np.radians((np.asarray(lon) - lon_0 + 180) % 360 - 180)
+    return (
+        rho * np.sin(theta) / units + x_0,
+        (rho_0 - rho * np.cos(theta)) / units + y_0)
@@ -16,14 +16,16 @@ import os
 # import re
 import sys
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
-# import numpy as np
+import numpy as np
 
 from support_functions import *
 
 
+@instrument('dem_parameters', stage_flag=True)
 def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
     """Calculate PRMS DEM Parameters
 
@@ -88,7 +90,8 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
                  '  Using automatic flow_acc_dem_factor: {0}').format(
                      flow_acc_dem_factor))
 
-    if hru.calc_flow_acc_dem_flag:
+    # Topographic wetness index also needs flow accumulation
+    if hru.calc_flow_acc_dem_flag or hru.calc_topo_index_flag:
         calc_flow_acc_flag = True
         calc_flow_dir_flag = True
     else:
@@ -105,9 +108,9 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
     # Check remap files comment style
     aspect_remap_path = os.path.join(hru.remap_ws, hru.aspect_remap_name)
     temp_adj_remap_path = os.path.join(hru.remap_ws, hru.temp_adj_remap_name)
-    remap_path_list = [aspect_remap_path, temp_adj_remap_path]
-    for remap_path in remap_path_list:
-        remap_check(remap_path)
+    # Remaps are compiled (and checked) once here
+    aspect_remap = remap_check(aspect_remap_path)
+    temp_adj_remap = remap_check(temp_adj_remap_path)
 
     # DEADBEEF
     # if not os.path.isfile(aspect_remap_path):
@@ -144,6 +147,7 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
     dem_fill_path = os.path.join(dem_temp_ws, 'dem_fill.img')
     flow_dir_path = os.path.join(dem_temp_ws, 'flow_dir.img')
     flow_acc_path = os.path.join(dem_temp_ws, 'flow_acc.img')
+    flow_hash_path = os.path.join(dem_temp_ws, 'flow_acc_hash.txt')
     flow_acc_dem_path = os.path.join(dem_temp_ws, 'flow_acc_x_dem.img')
     flow_acc_filter_path = os.path.join(dem_temp_ws, 'flow_acc_filter.img')
     dem_slope_path = os.path.join(dem_temp_ws, 'dem_slope.img')
@@ -168,6 +172,11 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
     add_field_func(hru.polygon_path, hru.dem_max_field, 'DOUBLE')
     add_field_func(hru.polygon_path, hru.dem_min_field, 'DOUBLE')
     add_field_func(hru.polygon_path, hru.dem_adj_field, 'DOUBLE')
+    if hru.calc_topo_index_flag:
+        # Older projects have a LONG field that truncates the index
+        if add_field_func(hru.polygon_path, hru.topo_index_field, 'DOUBLE',
+                          replace_flag=True):
+            HRUChanges.clear(hru, 'dem_parameters')
     if hru.calc_flow_acc_dem_flag:
         add_field_func(hru.polygon_path, hru.dem_flowacc_field, 'DOUBLE')
         add_field_func(hru.polygon_path, hru.dem_sum_field, 'DOUBLE')
@@ -247,18 +256,33 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
     dem_fill_obj = Fill(dem_path)
     dem_fill_obj.save(dem_fill_path)
     del dem_fill_obj
-    if calc_flow_dir_flag:
+
+    # Flow direction and accumulation are cached with a hash of the
+    #   filled DEM and are only recalculated if the filled DEM changes
+    flow_cache_flag = False
+    if calc_flow_dir_flag or calc_flow_acc_flag:
+        dem_fill_hash = raster_hash_func(dem_fill_path)
+        if (not overwrite_flag and
+            arcpy.Exists(flow_dir_path) and arcpy.Exists(flow_acc_path) and
+            os.path.isfile(flow_hash_path)):
+            with open(flow_hash_path, 'r') as hash_f:
+                flow_cache_flag = hash_f.read().strip() == dem_fill_hash
+        if flow_cache_flag:
+            logging.info('Using cached flow direction/accumulation rasters')
+    if calc_flow_dir_flag and not flow_cache_flag:
         logging.info('Calculating flow direction raster')
         dem_fill_obj = Raster(dem_fill_path)
         flow_dir_obj = FlowDirection(dem_fill_obj, True)
         flow_dir_obj.save(flow_dir_path)
         del flow_dir_obj, dem_fill_obj
-    if calc_flow_acc_flag:
+    if calc_flow_acc_flag and not flow_cache_flag:
         logging.info('Calculating flow accumulation raster')
         flow_dir_obj = Raster(flow_dir_path)
         flow_acc_obj = FlowAccumulation(flow_dir_obj)
         flow_acc_obj.save(flow_acc_path)
         del flow_acc_obj, flow_dir_obj
+        with open(flow_hash_path, 'w') as hash_f:
+            hash_f.write(dem_fill_hash)
     if hru.calc_flow_acc_dem_flag:
         # flow_acc_dem_obj = dem_fill_obj * flow_acc_obj
         # Low pass filter of flow_acc then take log10
@@ -269,44 +293,68 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
         flow_acc_dem_obj.save(flow_acc_dem_path)
         del flow_acc_dem_obj, flow_acc_filter_obj
 
-    # Calculate slope
+    # Calculate slope, aspect, aspect class, and temperature adjustment
+    # All four are calculated in a single tiled pass over the filled DEM
+    #   with a 3x3 Horn kernel (the same method as Slope and Aspect)
+    # Temperature adjustment is remapped from the reclassified aspect
     logging.info('Calculating slope raster')
-    dem_slope_obj = Slope(dem_fill_path, 'DEGREE')
-    # Setting small slopes to zero
     logging.info('  Setting slopes <= 0.01 to 0')
-    dem_slope_obj = Con(dem_slope_obj <= 0.01, 0, dem_slope_obj)
-    dem_slope_obj.save(dem_slope_path)
-    del dem_slope_obj
-
-    # Calculate aspect
     logging.info('Calculating aspect raster')
-    dem_aspect_obj = Aspect(dem_fill_path)
-    # Set small slopes to -1 aspect
     logging.debug('  Setting aspect for slopes <= 0.01 to -1')
-    dem_aspect_obj = Con(Raster(dem_slope_path) > 0.01, dem_aspect_obj, -1)
-    dem_aspect_obj.save(dem_aspect_path)
-    del dem_aspect_obj
-
-    # Reclassify aspect
     logging.debug('  Reclassifying: {0}'.format(aspect_remap_path))
-    dem_aspect_reclass_obj = ReclassByASCIIFile(
-        dem_aspect_path, aspect_remap_path)
-    dem_aspect_reclass_obj.save(dem_aspect_reclass_path)
-    del dem_aspect_reclass_obj
-
-    # Temperature Aspect Adjustment
     logging.info('Calculating temperature aspect adjustment raster')
-    temp_adj_obj = Float(ReclassByASCIIFile(
-        dem_aspect_reclass_path, temp_adj_remap_path))
-    # Since reclass can't remap to floats directly
-    # Values are scaled by 10 and stored as integers
-    temp_adj_obj *= 0.1
-    # This is a function in the
-    # temp_adj_obj = reclass_ascii_float_func(
-    #    dem_aspect_reclass_path, temp_adj_remap_path)
-    temp_adj_obj.save(temp_adj_path)
-    del temp_adj_obj
+    logging.debug('  Reclassifying: {0}'.format(temp_adj_remap_path))
+    dem_fill_obj = Raster(dem_fill_path)
+    dem_fill_pnt = arcpy.Point(
+        dem_fill_obj.extent.XMin, dem_fill_obj.extent.YMin)
+    dem_fill_cs = dem_fill_obj.meanCellWidth
+    dem_shape = (dem_fill_obj.height, dem_fill_obj.width)
+    dem_ymax = dem_fill_pnt.Y + dem_shape[0] * dem_fill_cs
+    # Each tile is saved as it is processed and the tiles are mosaiced
+    dem_tile_dict = dict(
+        (output_path, []) for output_path in [
+            dem_slope_path, dem_aspect_path, dem_aspect_reclass_path,
+            temp_adj_path])
+    env.outputCoordinateSystem = hru.sr
+    for row_i, row_j, dem_tile in raster_halo_tiles(dem_fill_obj):
+        logging.debug('  Rows: {0}-{1}'.format(row_i, row_j))
+        slope_tile, aspect_tile = horn_slope_aspect(dem_tile, dem_fill_cs)
+        # Setting small slopes to zero and their aspect to -1
+        flat_mask = slope_tile <= 0.01
+        slope_tile[flat_mask] = 0
+        aspect_tile[flat_mask] = -1
+        aspect_reclass_tile, temp_adj_tile = remap_array_func(
+            aspect_tile, [aspect_remap, [aspect_remap, temp_adj_remap]])
+        # Since reclass can't remap to floats directly
+        # Values are scaled by 10 and stored as integers
+        temp_adj_tile = np.where(
+            temp_adj_tile == remap_int_nodata, np.nan, 0.1 * temp_adj_tile)
+        tile_pnt = arcpy.Point(
+            dem_fill_pnt.X, dem_ymax - row_j * dem_fill_cs)
+        for output_path, output_tile, int_nodata in [
+                [dem_slope_path, slope_tile.astype(np.float32), None],
+                [dem_aspect_path, aspect_tile.astype(np.float32), None],
+                [dem_aspect_reclass_path, aspect_reclass_tile.astype(np.int32),
+                 remap_int_nodata],
+                [temp_adj_path, temp_adj_tile.astype(np.float32), None]]:
+            tile_path = '{0}_tile{1}.img'.format(
+                os.path.splitext(output_path)[0],
+                len(dem_tile_dict[output_path]))
+            array_to_raster(
+                output_tile, tile_path, tile_pnt, dem_fill_cs,
+                int_nodata=int_nodata)
+            dem_tile_dict[output_path].append(tile_path)
+            del output_tile
+        del dem_tile, slope_tile, aspect_tile, flat_mask
+        del aspect_reclass_tile, temp_adj_tile
+    del dem_fill_obj
 
+    # Mosaic the saved slope, aspect, and temperature adjustment tiles
+    for output_path, tile_path_list in sorted(dem_tile_dict.items()):
+        logging.debug('  {0}'.format(output_path))
+        mosaic_tiles_func(tile_path_list, output_path)
+    arcpy.ClearEnvironment('outputCoordinateSystem')
+    del dem_tile_dict
 
     # List of rasters, fields, and stats for zonal statistics
     zs_dem_dict = dict()
@@ -325,10 +373,69 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
     zs_dem_dict[hru.tmax_adj_field] = [temp_adj_path, 'MEAN']
     zs_dem_dict[hru.tmin_adj_field] = [temp_adj_path, 'MEAN']
 
+    # Only HRUs that changed since the last run are recalculated
+    dem_input_list = zs_input_list(zs_dem_dict)
+    if hru.calc_topo_index_flag:
+        dem_input_list.append(flow_acc_path)
+    hru_changes = HRUChanges(hru, 'dem_parameters', dem_input_list)
+    del dem_input_list
+
+    # Topographic wetness index
+    # Calculated from the cached flow accumulation and the slope raster
+    #   and reduced directly to HRU zonal means
+    if hru.calc_topo_index_flag:
+        logging.info('Calculating topographic wetness index')
+        zone_path = os.path.join(dem_temp_ws, 'hru_zones.img')
+        zone_raster_func(
+            hru.polygon_path, hru.fid_field, zone_path,
+            dem_fill_path, dem_fill_cs)
+        zone_obj = Raster(zone_path)
+        flow_acc_obj = Raster(flow_acc_path)
+        dem_slope_obj = Raster(dem_slope_path)
+        topo_index_acc = ZonalAccumulator('MEAN')
+        dem_xmin = dem_fill_pnt.X
+        # Only the window of the DEM that covers changed HRUs is read
+        win_row_i, win_row_j, win_col_i, win_col_j = \
+            hru_changes.raster_window(
+                dem_xmin, dem_ymax, dem_fill_cs, dem_shape[0], dem_shape[1])
+        win_xmin = dem_xmin + win_col_i * dem_fill_cs
+        win_cols = win_col_j - win_col_i
+        tile_rows = max(int(2 ** 20 / max(win_cols, 1)), 1)
+        for row_i in xrange(win_row_i, win_row_j, tile_rows):
+            tile_n = min(tile_rows, win_row_j - row_i)
+            tile_ymax = dem_ymax - row_i * dem_fill_cs
+            flow_acc_tile, flow_acc_nodata = raster_tile_func(
+                flow_acc_obj, win_xmin, tile_ymax, dem_fill_cs,
+                tile_n, win_cols)
+            flow_acc_tile = flow_acc_tile.astype(np.float64)
+            if not np.isnan(flow_acc_nodata):
+                flow_acc_tile[flow_acc_tile == flow_acc_nodata] = np.nan
+            dem_slope_tile, dem_slope_nodata = raster_tile_func(
+                dem_slope_obj, win_xmin, tile_ymax, dem_fill_cs,
+                tile_n, win_cols)
+            zone_tile, zone_nodata = raster_tile_func(
+                zone_obj, win_xmin, tile_ymax, dem_fill_cs,
+                tile_n, win_cols)
+            if np.issubdtype(zone_tile.dtype, np.floating):
+                zone_mask = np.isfinite(zone_tile)
+            else:
+                zone_mask = zone_tile != zone_nodata
+            zone_tile = np.where(zone_mask, zone_tile, -1).astype(np.int64)
+            topo_index_acc.add(zone_tile, topo_index_func(
+                flow_acc_tile, dem_slope_tile, dem_fill_cs))
+            del flow_acc_tile, dem_slope_tile, zone_tile, zone_mask
+        del zone_obj, flow_acc_obj, dem_slope_obj
+        arcpy.Delete_management(zone_path)
+        zonal_stats_update_func(
+            {hru.topo_index_field: topo_index_acc.result()},
+            hru.polygon_path, hru, fid_list=hru_changes.fid_list)
+        del topo_index_acc
+
 
     # Calculate DEM zonal statistics
     logging.info('\nCalculating DEM zonal statistics')
-    zonal_stats_func(zs_dem_dict, hru.polygon_path, hru)
+    zonal_stats_func(
+        zs_dem_dict, hru.polygon_path, hru, fid_list=hru_changes.fid_list)
 
     # Reset DEM_MEDIAN
     # logging.info('\nCalculating {0}'.format(hru.dem_median_field))
@@ -498,6 +605,7 @@ def dem_parameters(config_path, overwrite_flag=False, debug_flag=False):
         arcpy.Delete_management(hru_polygon_layer)
         del hru_polygon_layer
 
+    hru_changes.save()
     logging.info('Done!')
 
 
@@ -0,0 +1,1084 @@
+#--------------------------------
+# Name:         fake_arcpy/__init__.py
+# Purpose:      Minimal arcpy stand-in backed by NumPy and shapefile_io
+# Python:       2.7
+#--------------------------------
+"""Minimal local substitute for arcpy
+
+Only the parts of arcpy that the NumPy engines and the pipeline logic
+need are covered, so they can be run and tested without ArcGIS:
+
+    da.SearchCursor, da.UpdateCursor, da.FeatureClassToNumPyArray,
+    da.TableToNumPyArray, Describe, ListFields, AddField_management,
+    DeleteField_management, CalculateField_management,
+    GetCount_management, Raster, RasterToNumPyArray, NumPyArrayToRaster
+
+Feature classes are shapefiles read with shapefile_io.  Edits are only
+written to the DBF (geometry is read only).  Rasters are saved as a
+NumPy .npy file at the raster path with the extent, cellsize, nodata
+value and spatial reference in a JSON sidecar (path + '.json').
+
+Geoprocessing tools (ZonalStatisticsAsTable, ProjectRaster, etc.) and
+projecting geometry are not available.
+
+Use select_arcpy.py (PRMS_ARCPY=FAKE) to choose this module for
+"import arcpy".
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import re
+import sys
+
+import numpy as np
+
+import shapefile_io
+
+
+class Environment(object):
+    """arcpy.env settings"""
+    default_dict = {
+        'workspace': None, 'scratchWorkspace': None,
+        'overwriteOutput': False, 'extent': None, 'snapRaster': None,
+        'cellSize': None, 'outputCoordinateSystem': None, 'mask': None,
+        'pyramid': None, 'rasterStatistics': None,
+        'geographicTransformations': None}
+
+    def __init__(self):
+        self.__dict__.update(self.default_dict)
+
+env = Environment()
+
+
+def ClearEnvironment(environment_name):
+    setattr(env, environment_name,
+            Environment.default_dict.get(environment_name))
+
+
+def ResetEnvironments():
+    env.__dict__.update(Environment.default_dict)
+
+
+def CheckOutExtension(extension_code):
+    return 'CheckedOut'
+
+
+def CheckInExtension(extension_code):
+    return 'CheckedIn'
+
+
+def CheckExtension(extension_code):
+    return 'Available'
+
+
+def GetInstallInfo(product=None):
+    return {'ProductName': 'fake_arcpy', 'Version': '0.0', 'version': '0.0'}
+
+
+def AddMessage(message):
+    logging.info(message)
+
+
+def AddWarning(message):
+    logging.warning(message)
+
+
+def AddError(message):
+    logging.error(message)
+
+
+def GetMessages(severity=0):
+    return ''
+
+
+class Result():
+    """Geoprocessing tool result"""
+    def __init__(self, *output_list):
+        self.output_list = list(output_list)
+        self.outputCount = len(self.output_list)
+
+    def getOutput(self, index):
+        return str(self.output_list[index])
+
+    def __str__(self):
+        return str(self.output_list[0]) if self.output_list else ''
+
+
+class SpatialReference():
+    """Spatial reference from a WKT string, a .prj file or a factory code
+
+    Factory codes can't be resolved without a projection database, so the
+    name is set to 'WKID_<code>'.
+    """
+    def __init__(self, item=None):
+        self.factoryCode = 0
+        self.wkt = ''
+        if isinstance(item, (int, long)):
+            self.factoryCode = int(item)
+        elif isinstance(item, basestring) and os.path.isfile(item):
+            with open(item, 'r') as prj_f:
+                self.wkt = prj_f.read().strip()
+        elif isinstance(item, basestring) and re.match(
+                r'^\s*(PROJCS|GEOGCS)\[', item):
+            self.wkt = item.strip()
+        elif isinstance(item, basestring) and item.isdigit():
+            self.factoryCode = int(item)
+        elif item:
+            raise NotImplementedError(
+                'fake_arcpy can not resolve the spatial reference: ' +
+                '{0}'.format(item))
+
+    def loadFromString(self, wkt):
+        self.wkt = wkt.strip()
+
+    def exportToString(self):
+        if self.wkt:
+            return self.wkt
+        elif self.factoryCode:
+            return 'WKID:{0}'.format(self.factoryCode)
+        return ''
+
+    def wkt_value(self, keyword):
+        """First quoted value after a WKT keyword"""
+        match = re.search(r'{0}\["([^"]*)"'.format(keyword), self.wkt)
+        return match.group(1) if match else None
+
+    def wkt_number(self, keyword):
+        """Value of a WKT PARAMETER"""
+        match = re.search(
+            r'PARAMETER\["{0}",\s*([-+.0-9Ee]+)\]'.format(keyword),
+            self.wkt, re.I)
+        return float(match.group(1)) if match else 0.0
+
+    @property
+    def name(self):
+        if self.wkt:
+            return self.wkt_value('PROJCS') or self.wkt_value('GEOGCS')
+        elif self.factoryCode:
+            return 'WKID_{0}'.format(self.factoryCode)
+        return 'Unknown'
+
+    @property
+    def type(self):
+        if self.wkt.startswith('PROJCS'):
+            return 'Projected'
+        elif self.wkt.startswith('GEOGCS'):
+            return 'Geographic'
+        return 'Unknown'
+
+    @property
+    def GCS(self):
+        gcs = SpatialReference()
+        match = re.search(r'GEOGCS\[.*?\]\]\]', self.wkt)
+        if match:
+            gcs.wkt = match.group(0)
+        return gcs
+
+    @property
+    def linearUnitName(self):
+        if self.type != 'Projected':
+            return ''
+        return re.findall(r'UNIT\["([^"]*)"', self.wkt)[-1]
+
+    @property
+    def metersPerUnit(self):
+        if self.type != 'Projected':
+            return 1.0
+        return float(re.findall(r'UNIT\["[^"]*",\s*([-+.0-9Ee]+)\]',
+                                self.wkt)[-1])
+
+    @property
+    def semiMajorAxis(self):
+        match = re.search(
+            r'SPHEROID\["[^"]*",\s*([-+.0-9Ee]+),\s*([-+.0-9Ee]+)\]',
+            self.wkt)
+        return float(match.group(1)) if match else 0.0
+
+    @property
+    def flattening(self):
+        match = re.search(
+            r'SPHEROID\["[^"]*",\s*([-+.0-9Ee]+),\s*([-+.0-9Ee]+)\]',
+            self.wkt)
+        return 1.0 / float(match.group(2)) if match else 0.0
+
+    @property
+    def standardParallel1(self):
+        return self.wkt_number('Standard_Parallel_1')
+
+    @property
+    def standardParallel2(self):
+        return self.wkt_number('Standard_Parallel_2')
+
+    @property
+    def latitudeOfOrigin(self):
+        return self.wkt_number('Latitude_Of_Origin')
+
+    @property
+    def centralMeridian(self):
+        return self.wkt_number('Central_Meridian')
+
+    @property
+    def falseEasting(self):
+        return self.wkt_number('False_Easting')
+
+    @property
+    def falseNorthing(self):
+        return self.wkt_number('False_Northing')
+
+    def __eq__(self, other):
+        return (isinstance(other, SpatialReference) and
+                self.exportToString() == other.exportToString())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class Point():
+    def __init__(self, X=0.0, Y=0.0, Z=None, M=None, ID=0):
+        self.X, self.Y, self.Z, self.M, self.ID = float(X), float(Y), Z, M, ID
+
+    def __repr__(self):
+        return '{0} {1} NaN NaN'.format(self.X, self.Y)
+
+
+class Array(list):
+    """arcpy.Array (a list of Points or of Arrays)"""
+    @property
+    def count(self):
+        return len(self)
+
+    def add(self, value):
+        self.append(value)
+
+    def getObject(self, index):
+        return self[index]
+
+
+class Extent():
+    def __init__(self, XMin=None, YMin=None, XMax=None, YMax=None,
+                 ZMin=None, ZMax=None, MMin=None, MMax=None,
+                 spatial_reference=None):
+        self.XMin, self.YMin, self.XMax, self.YMax = [
+            float(v) if v is not None else None
+            for v in [XMin, YMin, XMax, YMax]]
+        self.ZMin, self.ZMax, self.MMin, self.MMax = ZMin, ZMax, MMin, MMax
+        self.spatialReference = spatial_reference
+
+    @property
+    def width(self):
+        return self.XMax - self.XMin
+
+    @property
+    def height(self):
+        return self.YMax - self.YMin
+
+    @property
+    def lowerLeft(self):
+        return Point(self.XMin, self.YMin)
+
+    @property
+    def lowerRight(self):
+        return Point(self.XMax, self.YMin)
+
+    @property
+    def upperLeft(self):
+        return Point(self.XMin, self.YMax)
+
+    @property
+    def upperRight(self):
+        return Point(self.XMax, self.YMax)
+
+    def __str__(self):
+        return '{0} {1} {2} {3} NaN NaN NaN NaN'.format(
+            self.XMin, self.YMin, self.XMax, self.YMax)
+
+
+def ring_signed_area(xy):
+    """Signed (shoelace) area of a ring, negative when clockwise"""
+    x, y = xy[:, 0], xy[:, 1]
+    return 0.5 * float(np.sum(x[:-1] * y[1:] - x[1:] * y[:-1]) +
+                       x[-1] * y[0] - x[0] * y[-1])
+
+
+class Geometry():
+    """Point, polyline or polygon geometry
+
+    Geometry is held as a list of parts, each a list of (n, 2) arrays.
+    Polygon parts are an exterior ring followed by its interior rings,
+    which arcpy separates with None when iterating over a part.
+    """
+    def __init__(self, geometry_type, part_list, spatial_reference=None):
+        self.type = geometry_type
+        self.part_list = part_list
+        self.spatialReference = spatial_reference
+
+    @classmethod
+    def from_shape(cls, shape_type, shape, spatial_reference=None):
+        """Geometry from a shapefile_io.read_shapefile record"""
+        if shape is None:
+            return None
+        elif shape_type == 'POINT':
+            return cls('point', [[np.array([shape], dtype=np.float64)]],
+                       spatial_reference)
+        elif shape_type == 'POLYLINE':
+            return cls('polyline', [[xy] for xy in shape], spatial_reference)
+        # Shapefile exterior rings are clockwise, interior rings follow
+        part_list = []
+        for xy in shape:
+            if ring_signed_area(xy) <= 0 or not part_list:
+                part_list.append([xy])
+            else:
+                part_list[-1].append(xy)
+        return cls('polygon', part_list, spatial_reference)
+
+    def __iter__(self):
+        for i in xrange(len(self.part_list)):
+            yield self.getPart(i)
+
+    def getPart(self, index=None):
+        if index is None:
+            if self.type in ['point', 'multipoint']:
+                return Array([
+                    Point(x, y) for part in self.part_list
+                    for x, y in part[0].tolist()])
+            return Array([self.getPart(i) for i in xrange(self.partCount)])
+        part = Array()
+        for i, xy in enumerate(self.part_list[index]):
+            if i:
+                part.append(None)
+            part.extend([Point(x, y) for x, y in xy.tolist()])
+        return part
+
+    def xy_array(self):
+        """All vertices as an (n, 2) array"""
+        return np.vstack([xy for part in self.part_list for xy in part])
+
+    @property
+    def partCount(self):
+        return len(self.part_list)
+
+    @property
+    def pointCount(self):
+        return sum(xy.shape[0] for part in self.part_list for xy in part)
+
+    @property
+    def isMultipart(self):
+        return self.partCount > 1
+
+    @property
+    def firstPoint(self):
+        return Point(*self.part_list[0][0][0])
+
+    @property
+    def lastPoint(self):
+        return Point(*self.part_list[-1][-1][-1])
+
+    @property
+    def extent(self):
+        xy = self.xy_array()
+        return Extent(xy[:, 0].min(), xy[:, 1].min(),
+                      xy[:, 0].max(), xy[:, 1].max(),
+                      spatial_reference=self.spatialReference)
+
+    @property
+    def area(self):
+        if self.type != 'polygon':
+            return 0.0
+        return -sum(ring_signed_area(xy)
+                    for part in self.part_list for xy in part)
+
+    @property
+    def length(self):
+        if self.type in ['point', 'multipoint']:
+            return 0.0
+        return sum(
+            float(np.sum(np.hypot(*np.diff(xy, axis=0).T)))
+            for part in self.part_list for xy in part)
+
+    @property
+    def centroid(self):
+        """Area weighted centroid (the first vertex for points)"""
+        if self.type != 'polygon' or not self.area:
+            return Point(*self.xy_array().mean(axis=0))
+        cx, cy, a = 0.0, 0.0, 0.0
+        for part in self.part_list:
+            for xy in part:
+                x0, y0 = xy[:, 0], xy[:, 1]
+                x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+                cross = x0 * y1 - x1 * y0
+                cx += float(np.sum((x0 + x1) * cross))
+                cy += float(np.sum((y0 + y1) * cross))
+                a += float(np.sum(cross))
+        return Point(cx / (3 * a), cy / (3 * a))
+
+    @property
+    def trueCentroid(self):
+        return self.centroid
+
+    def getArea(self, method=None, units=None):
+        return self.area
+
+    def projectAs(self, spatial_reference, transformation_name=None):
+        if (self.spatialReference is None or
+                self.spatialReference == spatial_reference):
+            return self
+        raise NotImplementedError('fake_arcpy can not project geometry')
+
+
+def array_parts(inputs):
+    """Parts (lists of (n, 2) arrays) from an Array of Points/Arrays"""
+    if inputs and isinstance(inputs[0], Point):
+        inputs = [inputs]
+    part_list = []
+    for part in inputs:
+        ring_list = [[]]
+        for pnt in part:
+            if pnt is None:
+                ring_list.append([])
+            else:
+                ring_list[-1].append((pnt.X, pnt.Y))
+        part_list.append([
+            np.array(ring, dtype=np.float64) for ring in ring_list if ring])
+    return part_list
+
+
+def Polygon(inputs, spatial_reference=None):
+    part_list = array_parts(inputs)
+    for part in part_list:
+        for i, xy in enumerate(part):
+            if np.any(xy[0] != xy[-1]):
+                part[i] = xy = np.vstack((xy, xy[:1]))
+            # Exterior rings are clockwise and interior rings counter
+            if (ring_signed_area(xy) > 0) == (i == 0):
+                part[i] = xy[::-1]
+    return Geometry('polygon', part_list, spatial_reference)
+
+
+def Polyline(inputs, spatial_reference=None):
+    return Geometry('polyline', array_parts(inputs), spatial_reference)
+
+
+def PointGeometry(inputs, spatial_reference=None):
+    return Geometry(
+        'point', [[np.array([[inputs.X, inputs.Y]], dtype=np.float64)]],
+        spatial_reference)
+
+
+def Multipoint(inputs, spatial_reference=None):
+    return Geometry(
+        'multipoint', [[np.array(
+            [(pnt.X, pnt.Y) for pnt in inputs], dtype=np.float64)]],
+        spatial_reference)
+
+
+class Field():
+    def __init__(self, name, type, length=0, precision=0, scale=0,
+                 editable=True, required=False):
+        self.name = self.baseName = self.aliasName = name
+        self.type = type
+        self.length = length
+        self.precision = precision
+        self.scale = scale
+        self.editable = editable
+        self.required = required
+        self.isNullable = not required
+        self.domain = ''
+
+    def __repr__(self):
+        return '<Field {0} ({1})>'.format(self.name, self.type)
+
+
+# DBF field definitions (type, width, decimals) for AddField types
+dbf_field_dict = {
+    'SHORT': ('N', 4, 0), 'LONG': ('N', 9, 0), 'FLOAT': ('N', 13, 11),
+    'DOUBLE': ('N', 19, 11), 'TEXT': ('C', 50, 0), 'DATE': ('D', 8, 0)}
+
+
+def dbf_field_type(field_type, width, decimals):
+    """arcpy field type of a DBF field"""
+    if field_type == 'C':
+        return 'String'
+    elif field_type == 'D':
+        return 'Date'
+    elif field_type == 'N' and not decimals and width <= 4:
+        return 'SmallInteger'
+    elif field_type == 'N' and not decimals and width <= 9:
+        return 'Integer'
+    elif field_type == 'F' and width <= 13:
+        return 'Single'
+    return 'Double'
+
+
+def catalog_path(path):
+    """Absolute dataset path (relative paths are in env.workspace)"""
+    path = str(path)
+    if not os.path.isabs(path) and env.workspace:
+        path = os.path.join(env.workspace, path)
+    return os.path.abspath(path)
+
+
+class Table():
+    """Shapefile or DBF table held in memory
+
+    Tables are cached and re-read if the DBF file is modified.
+    """
+    cache_dict = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.dbf_path = os.path.splitext(path)[0] + '.dbf'
+        self.shp_path = os.path.splitext(path)[0] + '.shp'
+        self.prj_path = os.path.splitext(path)[0] + '.prj'
+        if os.path.isfile(self.shp_path):
+            self.shape_type, self.shape_list = shapefile_io.read_shapefile(
+                self.shp_path)
+            self.oid_field, self.shape_field = 'FID', 'Shape'
+        else:
+            self.shape_type, self.shape_list = None, None
+            self.oid_field, self.shape_field = 'OID', None
+        if os.path.isfile(self.prj_path):
+            self.sr = SpatialReference(self.prj_path)
+        else:
+            self.sr = SpatialReference()
+        self.field_list, self.record_list = shapefile_io.read_dbf(
+            self.dbf_path)
+        self.mtime = os.path.getmtime(self.dbf_path)
+        self.geometry_list = None
+
+    @classmethod
+    def open(cls, path):
+        path = catalog_path(path)
+        if os.path.splitext(path)[1].lower() not in ['.shp', '.dbf']:
+            raise IOError('fake_arcpy only reads shapefiles and DBF ' +
+                          'tables: {0}'.format(path))
+        table = cls.cache_dict.get(path)
+        dbf_path = os.path.splitext(path)[0] + '.dbf'
+        if (table is None or not os.path.isfile(dbf_path) or
+                table.mtime != os.path.getmtime(dbf_path)):
+            table = cls(path)
+            cls.cache_dict[path] = table
+        return table
+
+    def save(self):
+        shapefile_io.write_dbf(self.dbf_path, self.field_list,
+                               self.record_list)
+        self.mtime = os.path.getmtime(self.dbf_path)
+
+    def __len__(self):
+        return len(self.record_list)
+
+    def geometry(self, fid):
+        if self.geometry_list is None:
+            self.geometry_list = [None] * len(self.shape_list)
+        if self.geometry_list[fid] is None:
+            self.geometry_list[fid] = Geometry.from_shape(
+                self.shape_type, self.shape_list[fid], self.sr)
+        return self.geometry_list[fid]
+
+    def fields(self):
+        field_list = [Field(self.oid_field, 'OID', 4, editable=False,
+                            required=True)]
+        if self.shape_field:
+            field_list.append(Field(self.shape_field, 'Geometry', 0,
+                                    required=True))
+        for name, field_type, width, decimals in self.field_list:
+            field_list.append(Field(
+                name, dbf_field_type(field_type, width, decimals), width,
+                width if field_type != 'C' else 0, decimals))
+        return field_list
+
+    def field_index(self, field_name):
+        """DBF column of a field (field names are not case sensitive)"""
+        for i, field in enumerate(self.field_list):
+            if field[0].upper() == field_name.upper():
+                return i
+        raise RuntimeError(
+            'Cannot find field \'{0}\' in {1}'.format(field_name, self.path))
+
+    def value_func(self, field_name):
+        """Function of (FID, record) that returns a field/token value"""
+        name = field_name.upper()
+        if name in ['OID@', self.oid_field.upper()]:
+            return lambda fid, record: fid
+        elif self.shape_field and name in ['SHAPE@', self.shape_field.upper()]:
+            return lambda fid, record: self.geometry(fid)
+        elif name == 'SHAPE@XY':
+            return lambda fid, record: self.centroid_xy(fid)
+        elif name == 'SHAPE@X':
+            return lambda fid, record: self.centroid_xy(fid)[0]
+        elif name == 'SHAPE@Y':
+            return lambda fid, record: self.centroid_xy(fid)[1]
+        elif name == 'SHAPE@AREA':
+            return lambda fid, record: self.geometry(fid).area
+        elif name == 'SHAPE@LENGTH':
+            return lambda fid, record: self.geometry(fid).length
+        elif name == 'SHAPE@TRUECENTROID':
+            return lambda fid, record: self.centroid_xy(fid)
+        i = self.field_index(field_name)
+        return lambda fid, record: record[i]
+
+    def centroid_xy(self, fid):
+        geom = self.geometry(fid)
+        if geom is None:
+            return (None, None)
+        pnt = geom.centroid
+        return (pnt.X, pnt.Y)
+
+    def expand_fields(self, field_names):
+        if isinstance(field_names, basestring):
+            field_names = [field_names]
+        if list(field_names) == ['*']:
+            return [field.name for field in self.fields()]
+        return list(field_names)
+
+    def check_sr(self, spatial_reference):
+        """Cursor spatial references must match (nothing is projected)"""
+        if spatial_reference is None:
+            return
+        if not isinstance(spatial_reference, SpatialReference):
+            spatial_reference = SpatialReference(spatial_reference)
+        if (spatial_reference.exportToString() and self.sr.exportToString() and
+                spatial_reference != self.sr):
+            raise NotImplementedError(
+                'fake_arcpy can not project {0}'.format(self.path))
+
+    def fid_list(self, where_clause=None):
+        """FIDs of the records that match a where clause"""
+        if not where_clause:
+            return range(len(self.record_list))
+        where_test = where_func(where_clause, self)
+        return [fid for fid, record in enumerate(self.record_list)
+                if where_test(fid, record)]
+
+
+# SQL operators and their Python equivalents in where clauses
+sql_operator_dict = {
+    'AND': 'and', 'OR': 'or', 'NOT': 'not', '=': '==', '<>': '!=',
+    'IS': 'is', 'NULL': 'None'}
+
+
+def where_func(where_clause, table):
+    """Python test function of (FID, record) from a simple SQL where clause
+
+    Supports (quoted or unquoted) field names, numbers, 'strings',
+    comparison operators, AND/OR/NOT, IS [NOT] NULL and parentheses.
+    """
+    value_list = []
+    expr_list = []
+    token_re = re.compile(
+        r'\s*(?:("[^"]+")|(\'[^\']*\')|([-+]?\d+\.?\d*(?:[Ee][-+]?\d+)?)|'
+        r'(<>|<=|>=|!=|=|<|>)|([A-Za-z_][A-Za-z_0-9@]*)|([()]))')
+    position = 0
+    where_clause = where_clause.strip()
+    while position < len(where_clause):
+        match = token_re.match(where_clause, position)
+        if not match or match.end() == position:
+            raise RuntimeError(
+                'Invalid where clause: {0}'.format(where_clause))
+        position = match.end()
+        quoted, string, number, operator, name, paren = match.groups()
+        if quoted or (name and name.upper() not in sql_operator_dict):
+            value_list.append(table.value_func((quoted or name).strip('"')))
+            expr_list.append('_v[{0}](_fid, _record)'.format(
+                len(value_list) - 1))
+        elif name:
+            expr_list.append(sql_operator_dict[name.upper()])
+        elif operator:
+            expr_list.append(sql_operator_dict.get(operator, operator))
+        else:
+            expr_list.append(string or number or paren)
+    return eval('lambda _fid, _record: ' + ' '.join(expr_list),
+                {'_v': value_list})
+
+
+def is_raster(path):
+    return os.path.isfile(path + '.json')
+
+
+class Describe():
+    """Describe properties of a shapefile, DBF table, raster or folder"""
+    def __init__(self, value):
+        if isinstance(value, Raster):
+            value = value.catalogPath
+        self.catalogPath = catalog_path(value)
+        self.path, self.name = os.path.split(self.catalogPath)
+        self.baseName = os.path.splitext(self.name)[0]
+        self.extension = os.path.splitext(self.name)[1].lstrip('.')
+        if is_raster(self.catalogPath):
+            raster = Raster(self.catalogPath)
+            self.dataType = 'RasterDataset'
+            self.format = 'NPY'
+            self.bandCount = 1
+            for name in ['extent', 'meanCellWidth', 'meanCellHeight',
+                         'width', 'height', 'noDataValue', 'pixelType',
+                         'spatialReference', 'isInteger']:
+                setattr(self, name, getattr(raster, name))
+        elif os.path.isdir(self.catalogPath):
+            self.dataType = 'Folder'
+        elif os.path.isfile(self.catalogPath):
+            table = Table.open(self.catalogPath)
+            self.fields = table.fields()
+            self.OIDFieldName = table.oid_field
+            self.hasOID = True
+            if table.shape_type:
+                self.dataType = 'ShapeFile'
+                self.shapeType = table.shape_type.title()
+                self.shapeFieldName = table.shape_field
+                self.featureType = 'Simple'
+                self.spatialReference = table.sr
+                self.extent = self.table_extent(table)
+            else:
+                self.dataType = 'DbaseTable'
+        else:
+            raise IOError('{0} does not exist'.format(value))
+
+    @staticmethod
+    def table_extent(table):
+        xy_list = [
+            geom.xy_array() for geom in [
+                table.geometry(fid) for fid in xrange(len(table))]
+            if geom is not None]
+        if not xy_list:
+            return Extent(0, 0, 0, 0, spatial_reference=table.sr)
+        xy = np.vstack(xy_list)
+        return Extent(xy[:, 0].min(), xy[:, 1].min(),
+                      xy[:, 0].max(), xy[:, 1].max(),
+                      spatial_reference=table.sr)
+
+
+def Exists(dataset):
+    if isinstance(dataset, Raster):
+        return True
+    path = catalog_path(dataset)
+    return os.path.exists(path) or is_raster(path)
+
+
+def ListFields(dataset, wild_card=None, field_type=None):
+    field_list = Table.open(dataset).fields()
+    if wild_card:
+        field_list = [
+            f for f in field_list
+            if fnmatch.fnmatch(f.name.upper(), wild_card.upper())]
+    if field_type and field_type.upper() != 'ALL':
+        field_list = [
+            f for f in field_list if f.type.upper() == field_type.upper()]
+    return field_list
+
+
+def AddField_management(in_table, field_name, field_type,
+                        field_precision=None, field_scale=None,
+                        field_length=None, field_alias=None,
+                        field_is_nullable=None, field_is_required=None,
+                        field_domain=None):
+    table = Table.open(in_table)
+    field_name = str(field_name)[:10]
+    if field_name.upper() in [f.name.upper() for f in table.fields()]:
+        logging.warning('  Field {0} already exists'.format(field_name))
+        return Result(in_table)
+    dbf_type, width, decimals = dbf_field_dict[field_type.upper()]
+    if dbf_type == 'C' and field_length:
+        width = int(field_length)
+    elif dbf_type == 'N' and field_precision:
+        width = int(field_precision)
+        if field_scale is not None and field_scale != '':
+            decimals = int(field_scale)
+    table.field_list.append((field_name, dbf_type, width, decimals))
+    for record in table.record_list:
+        record.append(None)
+    table.save()
+    return Result(in_table)
+
+AddField = AddField_management
+
+
+def DeleteField_management(in_table, drop_field):
+    table = Table.open(in_table)
+    if isinstance(drop_field, basestring):
+        drop_field = drop_field.split(';')
+    for field_name in drop_field:
+        i = table.field_index(field_name)
+        del table.field_list[i]
+        for record in table.record_list:
+            del record[i]
+    table.save()
+    return Result(in_table)
+
+DeleteField = DeleteField_management
+
+
+def CalculateField_management(in_table, field, expression,
+                              expression_type='PYTHON', code_block=''):
+    """Calculate a field from a Python expression with !FIELD! values"""
+    table = Table.open(in_table)
+    field_i = table.field_index(field)
+    value_list = []
+
+    def field_value(match):
+        value_list.append(table.value_func(match.group(1)))
+        return '_v[{0}](_fid, _record)'.format(len(value_list) - 1)
+    namespace = {'_v': value_list, 'math': __import__('math')}
+    if code_block:
+        exec code_block in namespace
+    calc_func = eval(
+        'lambda _fid, _record: ' + re.sub(
+            r'!([^!]+)!', field_value, str(expression)),
+        namespace)
+    for fid, record in enumerate(table.record_list):
+        record[field_i] = calc_func(fid, record)
+    table.save()
+    return Result(in_table)
+
+CalculateField = CalculateField_management
+
+
+def GetCount_management(in_rows):
+    return Result(len(Table.open(in_rows)))
+
+GetCount = GetCount_management
+
+
+class Raster(object):
+    """Single band raster held as a NumPy array
+
+    Rasters are saved as a .npy file at the raster path with a JSON
+    header (path + '.json').
+    """
+    def __init__(self, inRaster):
+        if isinstance(inRaster, Raster):
+            self.__dict__.update(inRaster.__dict__)
+            return
+        self.catalogPath = catalog_path(inRaster)
+        if not is_raster(self.catalogPath):
+            raise RuntimeError(
+                ('ERROR 000732: Input Raster: Dataset {0} does not ' +
+                 'exist or is not supported').format(inRaster))
+        with open(self.catalogPath + '.json', 'r') as header_f:
+            header = json.load(header_f)
+        self.array = None
+        self.x_min, self.y_min = header['xmin'], header['ymin']
+        self.cs_x, self.cs_y = header['cs_x'], header['cs_y']
+        self.rows, self.cols = header['rows'], header['cols']
+        self.dtype = np.dtype(str(header['dtype']))
+        self.noDataValue = header['nodata']
+        self.spatialReference = SpatialReference(header['sr'] or None)
+
+    @classmethod
+    def from_array(cls, array, x_min, y_min, cs_x, cs_y, nodata=None):
+        raster = cls.__new__(cls)
+        raster.catalogPath = None
+        raster.array = np.asarray(array)
+        raster.rows, raster.cols = raster.array.shape
+        raster.dtype = raster.array.dtype
+        raster.x_min, raster.y_min = float(x_min), float(y_min)
+        raster.cs_x, raster.cs_y = float(cs_x), float(cs_y)
+        raster.noDataValue = nodata
+        if isinstance(env.outputCoordinateSystem, SpatialReference):
+            raster.spatialReference = env.outputCoordinateSystem
+        else:
+            raster.spatialReference = SpatialReference()
+        return raster
+
+    def read(self):
+        """Raster array (read on first use)"""
+        if self.array is None:
+            self.array = np.load(self.catalogPath, mmap_mode='r')
+        return self.array
+
+    def save(self, name=None):
+        path = catalog_path(name) if name else self.catalogPath
+        array = self.read()
+        with open(path, 'wb') as npy_f:
+            np.save(npy_f, np.asarray(array))
+        header = {
+            'xmin': self.x_min, 'ymin': self.y_min,
+            'cs_x': self.cs_x, 'cs_y': self.cs_y,
+            'rows': self.rows, 'cols': self.cols,
+            'dtype': self.dtype.str, 'nodata': self.noDataValue,
+            'sr': self.spatialReference.exportToString()}
+        if isinstance(header['nodata'], np.generic):
+            header['nodata'] = header['nodata'].item()
+        with open(path + '.json', 'w') as header_f:
+            json.dump(header, header_f)
+        self.catalogPath = path
+        self.array = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.catalogPath or '')
+
+    @property
+    def path(self):
+        return os.path.dirname(self.catalogPath or '')
+
+    @property
+    def extent(self):
+        return Extent(
+            self.x_min, self.y_min, self.x_min + self.cols * self.cs_x,
+            self.y_min + self.rows * self.cs_y,
+            spatial_reference=self.spatialReference)
+
+    @property
+    def meanCellWidth(self):
+        return self.cs_x
+
+    @property
+    def meanCellHeight(self):
+        return self.cs_y
+
+    @property
+    def width(self):
+        return self.cols
+
+    @property
+    def height(self):
+        return self.rows
+
+    @property
+    def bandCount(self):
+        return 1
+
+    @property
+    def isInteger(self):
+        return self.dtype.kind in 'iub'
+
+    @property
+    def pixelType(self):
+        return '{0}{1}'.format(
+            {'i': 'S', 'u': 'U', 'b': 'U', 'f': 'F'}[self.dtype.kind],
+            8 * self.dtype.itemsize)
+
+    def valid_array(self):
+        array = np.asarray(self.read())
+        if self.noDataValue is None:
+            return array[~np.isnan(array)] if array.dtype.kind == 'f' else array
+        return array[array != self.noDataValue]
+
+    @property
+    def minimum(self):
+        return float(self.valid_array().min())
+
+    @property
+    def maximum(self):
+        return float(self.valid_array().max())
+
+    @property
+    def mean(self):
+        return float(self.valid_array().mean())
+
+    def __str__(self):
+        return self.catalogPath or ''
+
+
+def RasterToNumPyArray(in_raster, lower_left_corner=None, ncols=None,
+                       nrows=None, nodata_to_value=None):
+    """Raster (or a window of it) as a NumPy array
+
+    Cells outside the raster are set to nodata_to_value, or the raster
+    nodata value (NaN/0 if it is not set).
+    """
+    raster = in_raster if isinstance(in_raster, Raster) else Raster(in_raster)
+    array = raster.read()
+    if lower_left_corner is None:
+        col_min, row_bottom = 0, 0
+    else:
+        col_min = int(round(
+            (lower_left_corner.X - raster.x_min) / raster.cs_x))
+        row_bottom = int(round(
+            (lower_left_corner.Y - raster.y_min) / raster.cs_y))
+    ncols = int(ncols) if ncols else raster.cols - col_min
+    nrows = int(nrows) if nrows else raster.rows - row_bottom
+    row_min = raster.rows - row_bottom - nrows
+
+    if nodata_to_value is not None:
+        fill_value = nodata_to_value
+    elif raster.noDataValue is not None:
+        fill_value = raster.noDataValue
+    else:
+        fill_value = np.nan if array.dtype.kind == 'f' else 0
+    dtype = array.dtype
+    if dtype.kind in 'iub' and isinstance(fill_value, float):
+        dtype = np.float64
+    output_array = np.empty((nrows, ncols), dtype=dtype)
+    output_array.fill(fill_value)
+
+    # Copy the part of the window that overlaps the raster
+    src_row_i, src_row_j = max(row_min, 0), min(row_min + nrows, raster.rows)
+    src_col_i, src_col_j = max(col_min, 0), min(col_min + ncols, raster.cols)
+    if src_row_i < src_row_j and src_col_i < src_col_j:
+        src_array = np.array(array[src_row_i:src_row_j, src_col_i:src_col_j],
+                             dtype=dtype)
+        if nodata_to_value is not None and raster.noDataValue is not None:
+            src_array[src_array == raster.noDataValue] = nodata_to_value
+        output_array[src_row_i - row_min:src_row_j - row_min,
+                     src_col_i - col_min:src_col_j - col_min] = src_array
+    return output_array
+
+
+def NumPyArrayToRaster(in_array, lower_left_corner=None, x_cell_size=None,
+                       y_cell_size=None, value_to_nodata=None):
+    if lower_left_corner is None:
+        lower_left_corner = Point(0, 0)
+    if isinstance(x_cell_size, Raster):
+        x_cell_size = x_cell_size.meanCellWidth
+    x_cell_size = float(x_cell_size) if x_cell_size else 1.0
+    y_cell_size = float(y_cell_size) if y_cell_size else x_cell_size
+    return Raster.from_array(
+        np.array(in_array), lower_left_corner.X, lower_left_corner.Y,
+        x_cell_size, y_cell_size, value_to_nodata)
+
+
+def dataset_files(path):
+    """All files of a shapefile/table or raster dataset"""
+    if is_raster(path):
+        return [path, path + '.json']
+    base_path = os.path.splitext(path)[0]
+    return [
+        base_path + ext for ext in [
+            '.shp', '.shx', '.dbf', '.prj', '.cpg', '.sbn', '.sbx',
+            '.shp.xml']]
+
+
+def Delete_management(in_data, data_type=None):
+    path = catalog_path(in_data)
+    for file_path in dataset_files(path):
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+    Table.cache_dict.pop(path, None)
+    return Result(in_data)
+
+
+def DefineProjection_management(in_dataset, coor_system):
+    path = catalog_path(in_dataset)
+    if not isinstance(coor_system, SpatialReference):
+        coor_system = SpatialReference(coor_system)
+    if is_raster(path):
+        with open(path + '.json', 'r') as header_f:
+            header = json.load(header_f)
+        header['sr'] = coor_system.exportToString()
+        with open(path + '.json', 'w') as header_f:
+            json.dump(header, header_f)
+    else:
+        with open(os.path.splitext(path)[0] + '.prj', 'w') as prj_f:
+            prj_f.write(coor_system.exportToString())
+        Table.cache_dict.pop(path, None)
+    return Result(in_dataset)
+
+
+def CalculateStatistics_management(in_raster_dataset, *args):
+    return Result(in_raster_dataset)
+
+
+def BuildPyramids_management(in_raster_dataset, *args):
+    return Result(in_raster_dataset)
+
+
+def install():
+    """Use this module for "import arcpy" (and arcpy.da, arcpy.sa)"""
+    sys.modules['arcpy'] = sys.modules[__name__]
+    sys.modules['arcpy.da'] = da
+    sys.modules['arcpy.sa'] = sa
+
+
+from fake_arcpy import da, sa
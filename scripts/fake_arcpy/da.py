@@ -0,0 +1,171 @@
+#--------------------------------
+# Name:         fake_arcpy/da.py
+# Purpose:      Minimal arcpy.da stand-in (cursors and NumPy conversion)
+# Python:       2.7
+#--------------------------------
+
+import numpy as np
+
+from fake_arcpy import Table
+
+
+class SearchCursor(object):
+    """Read rows (tuples) from a shapefile or DBF table"""
+    def __init__(self, in_table, field_names, where_clause=None,
+                 spatial_reference=None, explode_to_points=False,
+                 sql_clause=(None, None)):
+        self.table = Table.open(in_table)
+        self.table.check_sr(spatial_reference)
+        self.fields = tuple(self.table.expand_fields(field_names))
+        self.value_funcs = [self.table.value_func(f) for f in self.fields]
+        self.where_clause = where_clause
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def reset(self):
+        self.fid_iter = iter(self.table.fid_list(self.where_clause))
+        self.fid = None
+
+    def row(self, fid):
+        record = self.table.record_list[fid]
+        return tuple(f(fid, record) for f in self.value_funcs)
+
+    def next(self):
+        self.fid = next(self.fid_iter)
+        return self.row(self.fid)
+
+    def close(self):
+        self.fid_iter = iter([])
+
+
+class UpdateCursor(SearchCursor):
+    """Read and update rows (lists) of a shapefile or DBF table
+
+    Only attribute values can be updated.  Edits are written to the DBF
+    when the cursor is closed or exhausted.
+    """
+    def __init__(self, *args, **kwargs):
+        super(UpdateCursor, self).__init__(*args, **kwargs)
+        self.field_index = [
+            self.table.field_index(f)
+            if f.upper() not in self.read_only_fields() else None
+            for f in self.fields]
+        self.edit_flag = False
+
+    def read_only_fields(self):
+        return [
+            self.table.oid_field.upper(), str(self.table.shape_field).upper(),
+            'OID@', 'SHAPE@', 'SHAPE@XY', 'SHAPE@X', 'SHAPE@Y',
+            'SHAPE@AREA', 'SHAPE@LENGTH', 'SHAPE@TRUECENTROID']
+
+    def row(self, fid):
+        return list(super(UpdateCursor, self).row(fid))
+
+    def next(self):
+        try:
+            return super(UpdateCursor, self).next()
+        except StopIteration:
+            self.close()
+            raise
+
+    def updateRow(self, row):
+        record = self.table.record_list[self.fid]
+        for i, value in zip(self.field_index, row):
+            if i is not None:
+                record[i] = value
+        self.edit_flag = True
+
+    def deleteRow(self):
+        raise NotImplementedError('fake_arcpy can not delete rows')
+
+    def close(self):
+        super(UpdateCursor, self).close()
+        if self.edit_flag:
+            self.table.save()
+            self.edit_flag = False
+
+    def __del__(self):
+        self.close()
+
+
+def numpy_dtype(table, field_names):
+    """Structured array dtype of table fields/tokens"""
+    field_type_dict = dict((f.name.upper(), f) for f in table.fields())
+    dtype_list = []
+    for name in field_names:
+        field = field_type_dict.get(name.upper())
+        if name.upper() in ['OID@'] or (field and field.type == 'OID'):
+            dtype_list.append((name, '<i4'))
+        elif name.upper() in ['SHAPE@XY', 'SHAPE@TRUECENTROID']:
+            dtype_list.append((name, '<f8', (2,)))
+        elif name.upper().startswith('SHAPE@'):
+            dtype_list.append((name, '<f8'))
+        elif field.type in ['SmallInteger', 'Integer']:
+            dtype_list.append((name, '<i4'))
+        elif field.type in ['Single', 'Double']:
+            dtype_list.append((name, '<f8'))
+        else:
+            dtype_list.append((name, '<U{0}'.format(max(field.length, 1))))
+    return np.dtype(dtype_list)
+
+
+def table_array(in_table, field_names, where_clause=None,
+                spatial_reference=None, explode_to_points=False,
+                skip_nulls=False, null_value=None):
+    table = Table.open(in_table)
+    table.check_sr(spatial_reference)
+    field_names = table.expand_fields(field_names)
+    value_funcs = [table.value_func(f) for f in field_names]
+    if isinstance(null_value, dict):
+        null_dict = dict((k.upper(), v) for k, v in null_value.items())
+        null_list = [null_dict.get(f.upper()) for f in field_names]
+    else:
+        null_list = [null_value] * len(field_names)
+
+    # Vertices replace the centroid when exploding to points
+    vertex_index = [
+        i for i, f in enumerate(field_names)
+        if f.upper() in ['SHAPE@XY', 'SHAPE@X', 'SHAPE@Y']]
+    row_list = []
+    for fid in table.fid_list(where_clause):
+        row = [f(fid, table.record_list[fid]) for f in value_funcs]
+        if None in row:
+            if skip_nulls:
+                continue
+            row = [n if v is None else v for v, n in zip(row, null_list)]
+            if None in row:
+                raise ValueError(
+                    'Null values in {0} (set null_value or skip_nulls)'.format(
+                        table.path))
+        if explode_to_points and table.shape_type:
+            for x, y in table.geometry(fid).xy_array().tolist():
+                for i in vertex_index:
+                    row[i] = {'SHAPE@XY': (x, y), 'SHAPE@X': x,
+                              'SHAPE@Y': y}[field_names[i].upper()]
+                row_list.append(tuple(row))
+        else:
+            row_list.append(tuple(row))
+    return np.array(row_list, dtype=numpy_dtype(table, field_names))
+
+
+def FeatureClassToNumPyArray(in_table, field_names, where_clause=None,
+                             spatial_reference=None, explode_to_points=False,
+                             skip_nulls=False, null_value=None):
+    return table_array(
+        in_table, field_names, where_clause, spatial_reference,
+        explode_to_points, skip_nulls, null_value)
+
+
+def TableToNumPyArray(in_table, field_names, where_clause=None,
+                      skip_nulls=False, null_value=None):
+    return table_array(
+        in_table, field_names, where_clause, skip_nulls=skip_nulls,
+        null_value=null_value)
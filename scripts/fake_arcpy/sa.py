@@ -0,0 +1,10 @@
+#--------------------------------
+# Name:         fake_arcpy/sa.py
+# Purpose:      Minimal arcpy.sa stand-in
+# Python:       2.7
+#--------------------------------
+"""Only Raster is available, none of the Spatial Analyst tools are"""
+
+from fake_arcpy import Raster
+
+__all__ = ['Raster']
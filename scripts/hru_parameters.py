@@ -17,15 +17,18 @@ import os
 # import re
 import sys
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
 # import numpy as np
 
+from coordinate_transforms import *
 from support_functions import *
 from _sqlite3 import Row
 
 
+@instrument('hru_parameters', stage_flag=True)
 def hru_parameters(config_path, overwrite_flag=False, debug_flag=False):
     """Calculate PRMS HRU Parameters
     
@@ -176,7 +179,10 @@ def hru_parameters(config_path, overwrite_flag=False, debug_flag=False):
     add_field_func(hru.polygon_path, hru.slope_rad_field, 'DOUBLE')
     add_field_func(hru.polygon_path, hru.slope_pct_field, 'DOUBLE')
     if hru.calc_topo_index_flag:
-        add_field_func(hru.polygon_path, hru.topo_index_field, 'LONG')
+        # Older projects have a LONG field that truncates the index
+        if add_field_func(hru.polygon_path, hru.topo_index_field, 'DOUBLE',
+                          replace_flag=True):
+            HRUChanges.clear(hru, 'dem_parameters')
 #     add_field_func(hru.polygon_path, hru.row_field, 'LONG')
 #     add_field_func(hru.polygon_path, hru.col_field, 'LONG')
     add_field_func(hru.polygon_path, hru.x_field, 'LONG')
@@ -304,12 +310,11 @@ def hru_parameters(config_path, overwrite_flag=False, debug_flag=False):
     logging.info('  Calculating HRU ID')
     cell_id_col_row_func(hru.polygon_path, hru.id_field)
 
-    # Cell Lat/Lon
-    logging.info('  Calculating HRU lat/lon')
-    cell_lat_lon_func(hru.polygon_path, hru.lat_field, hru.lon_field, hru.sr.GCS)
-    
-    logging.info('  Calculating HRU x/y')
-    cell_xy_func(hru.polygon_path, hru.x_field, hru.y_field)
+    # Cell Lat/Lon and Albers x/y
+    logging.info('  Calculating HRU lat/lon and x/y')
+    cell_lat_lon_xy_func(
+        hru.polygon_path, hru.lat_field, hru.lon_field,
+        hru.x_field, hru.y_field, hru.sr)
 
     # Cell Area
     logging.info('  Calculating HRU area (acres)')
@@ -399,20 +404,25 @@ def hru_parameters(config_path, overwrite_flag=False, debug_flag=False):
                 except:
                     pass
 
+        # Lake/HRU overlap areas are computed once for both fields
+        logging.info('  Calculating lake overlap areas')
+        lake_area_table = zone_area_table_func(
+            lake_clip_path, hru.polygon_path, hru, hru.area_field)
+
         # Set lake HRU_TYPE
         logging.info('  Setting lake {0}'.format(hru.type_in_field))
         zone_by_area_func(
             lake_clip_path, hru.type_in_field, 2,
             hru.polygon_path, hru, hru.area_field,
-            hru.lake_area_field, lake_area_pct)
+            hru.lake_area_field, lake_area_pct, lake_area_table)
         # Set lake ID
         logging.info('  Setting {0}'.format(hru.lake_id_field))
         zone_by_area_func(
             lake_clip_path, hru.lake_id_field, lake_zone_field,
             hru.polygon_path, hru, hru.area_field,
-            hru.lake_area_field, lake_area_pct)
+            hru.lake_area_field, lake_area_pct, lake_area_table)
         # Cleanup
-        del lake_layer, lake_desc, lake_sr
+        del lake_layer, lake_desc, lake_sr, lake_area_table
 
     # Copy HRUTYPE_IN for HRU_TYPE
     # HRU_TYPE can then be modified by later scripts
@@ -428,39 +438,57 @@ def hru_parameters(config_path, overwrite_flag=False, debug_flag=False):
     logging.info('Done!')
 
 
-def cell_xy_func(hru_param_path, x_field, y_field):
-    """
-    Converts the xy to albers projection which is
-    required for hru_x/y by prms.
-    """
-    sr = arcpy.SpatialReference("NAD 1983 USFS R9 Albers (Meters)")
-    s = "/"
-    seq = [str(d) for d in hru_param_path.split("\\")[0:-2]]
-    seq.append("albers.shp")
-    hru_albers = s.join(seq)
-        
-    arcpy.Project_management(hru_param_path, hru_albers, sr)
-    
-    fields = ('SHAPE@XY')
-    albers_c = arcpy.da.SearchCursor(hru_albers, fields) 
-    fields = (x_field, y_field)
-    with arcpy.da.UpdateCursor(hru_param_path, fields) as u_cursor:
-        for row in u_cursor:
-            alb_row = albers_c.next()
-            row[0], row[1] = alb_row[0]
-            u_cursor.updateRow(row)
-            del row
-    del u_cursor,albers_c
+def cell_lat_lon_xy_func(hru_param_path, lat_field, lon_field,
+                         x_field, y_field, hru_sr, datum_shift_flag=True):
+    """Calculate HRU centroid lat/lon and Albers x/y in one pass
 
+    Centroids are read once in the HRU geographic coordinate system.
+    The Albers x/y required for hru_x/y by PRMS are then projected
+    with NumPy instead of projecting a copy of the HRU shapefile.
 
-def cell_lat_lon_func(hru_param_path, lat_field, lon_field, gcs_sr):
-    """"""
-    fields = ('SHAPE@XY', lon_field, lat_field)
-    with arcpy.da.UpdateCursor(hru_param_path, fields, '', gcs_sr) as u_cursor:
+    Args:
+        hru_param_path (str):
+        lat_field (str):
+        lon_field (str):
+        x_field (str):
+        y_field (str):
+        hru_sr (:class:`arcpy.SpatialReference`): HRU spatial reference
+        datum_shift_flag (bool): if True, shift between NAD83 and WGS84
+            when transform_func would apply a transformation
+
+    Returns:
+        None
+    """
+    albers_sr = arcpy.SpatialReference("NAD 1983 USFS R9 Albers (Meters)")
+    centroid_array = arcpy.da.FeatureClassToNumPyArray(
+        hru_param_path, ['OID@', 'SHAPE@X', 'SHAPE@Y'],
+        spatial_reference=hru_sr.GCS)
+    lon_array = centroid_array['SHAPE@X'].astype(np.float64)
+    lat_array = centroid_array['SHAPE@Y'].astype(np.float64)
+
+    if datum_shift_flag:
+        transform_str = transform_func(hru_sr, albers_sr)
+    else:
+        transform_str = None
+    logging.debug('    Albers transform: {0}'.format(transform_str))
+    albers_lon, albers_lat = datum_shift_func(
+        lon_array, lat_array, hru_sr.GCS.name, albers_sr.GCS.name,
+        transform_str)
+    x_array, y_array = albers_forward(
+        albers_lon, albers_lat, **albers_params_func(albers_sr))
+    del albers_lon, albers_lat
+
+    cell_dict = dict(zip(
+        centroid_array['OID@'].tolist(),
+        zip(lat_array.tolist(), lon_array.tolist(),
+            x_array.tolist(), y_array.tolist())))
+    del centroid_array, lon_array, lat_array, x_array, y_array
+    fields = ('OID@', lat_field, lon_field, x_field, y_field)
+    with arcpy.da.UpdateCursor(hru_param_path, fields) as u_cursor:
         for row in u_cursor:
-            row[1], row[2] = row[0]
+            row[1:] = cell_dict[row[0]]
             u_cursor.updateRow(row)
-            del row
+    del cell_dict
 
 
 def cell_id_col_row_func(hru_param_path, id_field):
@@ -16,6 +16,7 @@ import os
 # import re
 import sys
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
@@ -24,6 +25,7 @@ from arcpy.sa import *
 from support_functions import *
 
 
+@instrument('impervious_parameters', stage_flag=True)
 def impervious_parameters(config_path, overwrite_flag=False, debug_flag=False):
     """Calculate PRMS Impervious Parameters
 
@@ -108,9 +110,15 @@ def impervious_parameters(config_path, overwrite_flag=False, debug_flag=False):
     # zs_imperv_dict[hru.carea_min_field] = [imperv_path, 'MEAN']
     # zs_imperv_dict[hru.carea_max_field] = [imperv_path, 'MEAN']
 
+    # Only HRUs that changed since the last run are recalculated
+    hru_changes = HRUChanges(
+        hru, 'impervious_parameters', zs_input_list(zs_imperv_dict))
+
     # Calculate zonal statistics
     logging.info('\nCalculating zonal statistics')
-    zonal_stats_func(zs_imperv_dict, hru.polygon_path, hru)
+    zonal_stats_func(
+        zs_imperv_dict, hru.polygon_path, hru,
+        fid_list=hru_changes.fid_list)
 
     # Calculate CAREA_MIN / CAREA_MAX
     logging.info('\nCalculating CAREA_MIN / CAREA_MAX')
@@ -132,6 +140,7 @@ def impervious_parameters(config_path, overwrite_flag=False, debug_flag=False):
             hru.polygon_path, hru.carea_max_field,
             '!{0}!'.format(hru.imperv_pct_field), 'PYTHON')
         
+    hru_changes.save()
     logging.info('Done!')
 
 
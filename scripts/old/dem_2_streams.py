@@ -467,66 +467,60 @@ def flow_parameters(config_path, overwrite_flag=False, debug_flag=False):
     #    logging.debug('    {0} {1}'.format(k,v))
 
     logging.info('\nBuilding all subbasin points')
-    # First calculate downstream cell for all cells
+    # Read the cells into arrays and build a dense HRU_TYPE_IN grid
+    #   with a 1 cell border so downstream cells never fall off the grid
+    # Cells that aren't in the fishnet are -1 (treated as inactive)
     logging.debug('  Calculating downstream cells')
-    out_cell_dict = dict()
-    hru_type_in_dict = dict()
-    cell_xy_dict = dict()
     fields = [
-        hru.type_in_field, hru.flow_dir_field, hru.id_field,
-        hru.col_field, hru.row_field, hru.x_field, hru.y_field]
-    for row in arcpy.da.SearchCursor(hru.polygon_path, fields):
-        cell = (int(row[3]), int(row[4]))
-        out_cell_dict[cell] = next_row_col(int(row[1]), cell)
-        hru_type_in_dict[cell] = int(row[0])
-        cell_xy_dict[cell] = (int(row[5]), int(row[6]))
-
+        hru.type_in_field, hru.flow_dir_field,
+        hru.col_field, hru.row_field, hru.x_field, hru.y_field, 'OID@']
+    cell_array = np.array(
+        [row for row in arcpy.da.SearchCursor(hru.polygon_path, fields)],
+        dtype=np.float64).reshape(-1, len(fields))
+    type_array = cell_array[:, 0].astype(np.int64)
+    col_array = cell_array[:, 2].astype(np.int64)
+    row_array = cell_array[:, 3].astype(np.int64)
+    col_array -= col_array.min() - 1
+    row_array -= row_array.min() - 1
+    type_grid = np.empty(
+        (row_array.max() + 2, col_array.max() + 2), dtype=np.int64)
+    type_grid.fill(-1)
+    type_grid[row_array, col_array] = type_array
+    out_col_array, out_row_array = next_row_col_array(
+        cell_array[:, 1], col_array, row_array)
 
     # Identify all active/lake cells that exit the model
     #   or flow to an inactive cell
     logging.debug('  Identifying active cells that exit the model')
-    out_cell_xy_list = []
-    for cell, cell_xy in cell_xy_dict.items():
-        #  DEADBEEF - This is finding exit cells that aren't already gauges
-        # if cell in input_xy_dict.keys():
-        #    continue
-        # elif cell not in hru_type_in_dict.keys():
-        if cell not in hru_type_in_dict.keys():
-            continue
-        elif hru_type_in_dict[cell] not in [1,2]:
-            continue
-        elif cell not in out_cell_dict.keys():
-            continue
-        elif out_cell_dict[cell] not in hru_type_in_dict.keys():
-            out_cell_xy_list.append(cell_xy)
-        elif (out_cell_dict[cell] in hru_type_in_dict.keys() and
-              hru_type_in_dict[out_cell_dict[cell]] not in [1,2]):
-            out_cell_xy_list.append(cell_xy)
+    active_mask = (type_array == 1) | (type_array == 2)
+    out_type_array = type_grid[out_row_array, out_col_array]
+    exit_mask = active_mask & (out_type_array != 1) & (out_type_array != 2)
+    del type_grid, out_col_array, out_row_array, out_type_array
+    exit_xy_list = sorted(set(zip(
+        cell_array[exit_mask, 4].astype(np.int64).tolist(),
+        cell_array[exit_mask, 5].astype(np.int64).tolist())))
+    logging.debug('  {0} exit cells'.format(len(exit_xy_list)))
     fields = ["SHAPE@XY", subbasin_zone_field]
     with arcpy.da.InsertCursor(subbasin_points_path, fields) as insert_c:
-        for out_cell_xy in sorted(out_cell_xy_list):
-            insert_c.insertRow([out_cell_xy, subbasin_input_count+1])
-    del fields
-
+        for exit_xy in exit_xy_list:
+            insert_c.insertRow([exit_xy, subbasin_input_count+1])
+    del fields, exit_xy_list
 
     # Outflow cells exit the model to inactive cells or out of the domain
     # These cells will be used to set the OUTFLOW_HRU.DAT for CRT
     #   in crt_fill_parameters and stream_parameters
     logging.info('  Flag outflow cells')
-    fields = [hru.type_in_field, hru.x_field, hru.y_field, hru.outflow_field]
+    exit_oid_set = set(cell_array[exit_mask, 6].astype(np.int64).tolist())
+    fields = ['OID@', hru.type_in_field, hru.outflow_field]
     with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
         for row in u_cursor:
-            cell_xy = (row[1], row[2])
             # Inactive cells can't be outflow cells
-            if int(row[0]) == 0:
+            if int(row[1]) == 0:
                 continue
-            elif out_cell_xy_list and cell_xy in out_cell_xy_list:
-                row[3] = 1
-            else:
-                row[3] = 0
+            row[2] = int(row[0] in exit_oid_set)
             u_cursor.updateRow(row)
-    del out_cell_dict, hru_type_in_dict, cell_xy_dict
-    del out_cell_xy_list
+    del cell_array, type_array, col_array, row_array
+    del active_mask, exit_mask, exit_oid_set
 
 
     # Flow Accumulation
@@ -19,8 +19,9 @@ import sys
 import arcpy
 from arcpy import env
 from arcpy.sa import *
-# import numpy as np
+import numpy as np
 
+from shapefile_io import ShapefileWriter
 from support_functions import *
 
 
@@ -152,35 +153,65 @@ def fishnet_func(config_path, overwrite_flag=False, debug_flag=False):
     # Build hru_param
     logging.info('\nBuilding HRU parameter fishnet')
     build_fishnet_func(
-        hru.polygon_path, hru.point_path, hru.extent, hru.cs, hru.sr)
+        hru.polygon_path, hru.point_path, hru.extent, hru.cs, hru.sr,
+        id_field=hru.id_field)
 
     # Write initial parameters to hru_param (X/Y, ROW/COL, Unique ID)
     # set_hru_id_func(hru.polygon_path, hru.extent, hru.cs)
 
 
-def build_fishnet_func(hru_polygon_path, hru_point_path, extent, cs, sr):
-    """"""
+def build_fishnet_func(hru_polygon_path, hru_point_path, extent, cs, sr,
+                       id_field='HRU_ID', row_field='HRU_ROW',
+                       col_field='HRU_COL', chunk_size=2**18):
+    """Build the fishnet cell polygons and centroid points
+
+    The cell corners, centroids, and ID/row/column attributes are
+    computed as arrays for blocks of rows and streamed to the shapefiles,
+    so memory is bounded by chunk_size cells instead of the grid size.
+    Cells are numbered row major from the upper left cell (1, 1).
+    """
     # Remove existing
     if arcpy.Exists(hru_polygon_path):
         arcpy.Delete_management(hru_polygon_path)
     if arcpy.Exists(hru_point_path):
         arcpy.Delete_management(hru_point_path)
-    # Calculate LL/UR corner points
-    origin_pnt = (extent.XMin, extent.YMin)
-    yaxis_pnt = (extent.XMin, extent.YMin+cs)
-    corner_pnt = (extent.XMax, extent.YMax)
-    origin_str = ' '.join(map(str, origin_pnt))
-    yaxis_str = ' '.join(map(str, yaxis_pnt))
-    corner_str = ' '.join(map(str, corner_pnt))
-    logging.debug('  Origin: {0}'.format(origin_str))
-    logging.debug('  Y-Axis: {0}'.format(yaxis_str))
-    logging.debug('  Corner: {0}'.format(corner_str))
-    # Build fishnet & labels
-    arcpy.CreateFishnet_management(
-        hru_polygon_path, origin_str, yaxis_str, cs, cs,
-        '0', '0', corner_str, 'LABELS', '#', 'POLYGON')
-    arcpy.DefineProjection_management(hru_polygon_path, sr)
-    arcpy.DefineProjection_management(hru_point_path, sr)
+    fishnet_rows = int(round((extent.YMax - extent.YMin) / cs))
+    fishnet_cols = int(round((extent.XMax - extent.XMin) / cs))
+    logging.debug('  Upper Left: {0} {1}'.format(extent.XMin, extent.YMax))
+    logging.debug('  Rows: {0}  Cols: {1}'.format(fishnet_rows, fishnet_cols))
+    id_width = max(len(str(fishnet_rows * fishnet_cols)), 9)
+    field_list = [
+        (id_field, id_width, 0), (row_field, 9, 0), (col_field, 9, 0)]
+    sr_wkt = sr.exportToString()
+
+    # Clockwise ring from the upper left corner (row/col offsets)
+    ring_row = np.array([0, 0, 1, 1, 0])
+    ring_col = np.array([0, 1, 1, 0, 0])
+    chunk_rows = max(chunk_size // fishnet_cols, 1)
+    polygon_writer = ShapefileWriter(
+        hru_polygon_path, 'POLYGON', field_list, sr_wkt)
+    point_writer = ShapefileWriter(
+        hru_point_path, 'POINT', field_list, sr_wkt)
+    try:
+        for row_i in xrange(0, fishnet_rows, chunk_rows):
+            row_j = min(row_i + chunk_rows, fishnet_rows)
+            row_array, col_array = np.mgrid[row_i:row_j, 0:fishnet_cols]
+            row_array, col_array = row_array.ravel(), col_array.ravel()
+            value_dict = {
+                id_field: row_array * fishnet_cols + col_array + 1,
+                row_field: row_array + 1,
+                col_field: col_array + 1}
+            ring_x = extent.XMin + (col_array[:, None] + ring_col) * cs
+            ring_y = extent.YMax - (row_array[:, None] + ring_row) * cs
+            polygon_writer.write(np.dstack((ring_x, ring_y)), value_dict)
+            point_writer.write(np.column_stack((
+                extent.XMin + (col_array + 0.5) * cs,
+                extent.YMax - (row_array + 0.5) * cs)), value_dict)
+            del row_array, col_array, ring_x, ring_y, value_dict
+    finally:
+        polygon_writer.close()
+        point_writer.close()
+    logging.debug('  Cells: {0}'.format(polygon_writer.count))
 
 
 def arg_parse():
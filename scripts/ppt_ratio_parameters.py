@@ -18,6 +18,7 @@ import os
 import sys
 # from time import clock
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
@@ -26,6 +27,7 @@ from arcpy.sa import *
 import support_functions
 
 
+@support_functions.instrument('ppt_ratio_parameters', stage_flag=True)
 def ppt_ratio_parameters(config_path, overwrite_flag=False, debug_flag=False):
     """Calculate GSFLOW PPT Ratio Parameters
 
@@ -254,7 +256,7 @@ def ppt_ratio_parameters(config_path, overwrite_flag=False, debug_flag=False):
         logging.info('  Setting {0}'.format(hru.ppt_zone_id_field))
         zone_by_centroid_func(
             ppt_zone_path, hru.ppt_zone_id_field, ppt_zone_field,
-            hru.polygon_path, hru.point_path, hru_param)
+            hru.polygon_path, hru.point_path, hru)
         # zone_by_area_func(
         #    ppt_zone_layer, hru.ppt_zone_id_field, ppt_zone_field,
         #    hru.polygon_path, hru_param, hru_area_field, None, 50)
@@ -18,6 +18,7 @@ import re
 import sys
 # from time import clock
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
@@ -26,6 +27,7 @@ from arcpy.sa import *
 import support_functions
 
 
+@support_functions.instrument('prism_4km_normals', stage_flag=True)
 def prism_4km_parameters(config_path, data_name='ALL',
                          overwrite_flag=False, debug_flag=False, ):
     """Calculate PRMS PRISM Parameters
@@ -133,6 +135,8 @@ def prism_4km_parameters(config_path, data_name='ALL',
         # Extract, project/resample, clip
         # Process images by month
         zs_prism_dict = dict()
+        input_raster_list = []
+        output_raster_list = []
         # env.extent = hru.extent
         for month in month_list:
             logging.info('  Month: {0}'.format(month))
@@ -146,18 +150,12 @@ def prism_4km_parameters(config_path, data_name='ALL',
                 data_name.lower(), month)
             output_raster = os.path.join(output_ws, output_name)
 
-            # Set preferred transforms
-            input_sr = Raster(input_raster).spatialReference
-            transform_str = support_functions.transform_func(hru.sr, input_sr)
-            if transform_str:
-                logging.debug('  Transform: {0}'.format(transform_str))
-
             # Project PRISM rasters to HRU coordinate system
             # DEADBEEF - Arc10.2 ProjectRaster does not extent
-            support_functions.project_raster_func(
-                input_raster, output_raster, hru.sr,
-                hru.prism_proj_method.upper(), hru.prism_cs, transform_str,
-                input_sr, hru)
+            # All months are projected together below, the transform
+            #   is set from each raster's spatial reference
+            input_raster_list.append(input_raster)
+            output_raster_list.append(output_raster)
             # arcpy.ProjectRaster_management(
             #    input_raster, output_raster, hru.sr,
             #    prism_proj_method.upper(), prism_cs, transform_str,
@@ -169,17 +167,31 @@ def prism_4km_parameters(config_path, data_name='ALL',
             zs_prism_dict[zs_field] = [output_raster, 'MEAN']
 
             # Cleanup
-            del input_raster, output_raster, output_name
-            del input_sr, transform_str, zs_field
+            del input_raster, output_raster, output_name, zs_field
 
         # Cleanup
         # arcpy.ClearEnvironment('extent')
 
+        # PRISM rasters are all on the same grid so the projection plan
+        #   is only built for the first month and reused for the rest
+        logging.info('\nProjecting PRISM rasters')
+        support_functions.project_raster_group_func(
+            input_raster_list, output_raster_list, hru.sr,
+            hru.prism_proj_method.upper(), hru.prism_cs, hru)
+        del input_raster_list, output_raster_list
+
+        # Only HRUs that changed since the last run are recalculated
+        hru_changes = support_functions.HRUChanges(
+            hru, 'prism_4km_{0}'.format(data_name.lower()),
+            support_functions.zs_input_list(zs_prism_dict))
+
         # Calculate zonal statistics
         logging.info('\nCalculating PRISM zonal statistics')
         support_functions.zonal_stats_func(
-            zs_prism_dict, hru.polygon_path, hru)
-        del zs_prism_dict
+            zs_prism_dict, hru.polygon_path, hru,
+            fid_list=hru_changes.fid_list)
+        hru_changes.save()
+        del zs_prism_dict, hru_changes
 
     # Jensen-Haise Potential ET air temperature coefficient
     # Update Jensen-Haise PET estimate using PRISM air temperature
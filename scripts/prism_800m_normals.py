@@ -18,6 +18,7 @@ import re
 import sys
 # from time import clock
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
@@ -26,6 +27,7 @@ from arcpy.sa import *
 import support_functions
 
 
+@support_functions.instrument('prism_800m_normals', stage_flag=True)
 def prism_800m_parameters(config_path, data_name='ALL',
                           overwrite_flag=False, debug_flag=False, ):
     """Calculate GSFLOW PRISM Parameters
@@ -209,11 +211,18 @@ def prism_800m_parameters(config_path, data_name='ALL',
         # Cleanup
         # arcpy.ClearEnvironment('extent')
 
+        # Only HRUs that changed since the last run are recalculated
+        hru_changes = support_functions.HRUChanges(
+            hru, 'prism_800m_{0}'.format(data_name.lower()),
+            support_functions.zs_input_list(zs_prism_dict))
+
         # Calculate zonal statistics
         logging.info('\nCalculating PRISM zonal statistics')
         support_functions.zonal_stats_func(
-            zs_prism_dict, hru.polygon_path, hru.point_path, hru)
-        del zs_prism_dict
+            zs_prism_dict, hru.polygon_path, hru,
+            fid_list=hru_changes.fid_list)
+        hru_changes.save()
+        del zs_prism_dict, hru_changes
 
     # Jensen-Haise Potential ET air temperature coefficient
     # Update Jensen-Haise PET estimate using PRISM air temperature
@@ -19,6 +19,7 @@ import os
 # import re
 import sys
 
+import select_arcpy
 import arcpy
 # from arcpy import env
 
@@ -26,6 +27,7 @@ from support_functions import *
 from string import upper
 
 
+@instrument('prms_template_fill', stage_flag=True)
 def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
     """
     Fill PRMS Parameter Template File
@@ -96,7 +98,8 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
         sys.exit()
     
     #If the file already exists, remove it
-    if os.path.isfile(prms_parameter_path):
+    #Incremental runs may patch the existing file instead
+    if os.path.isfile(prms_parameter_path) and not hru.incremental_flag:
         os.remove(prms_parameter_path)
         
     #Check is meterology location file is valid    
@@ -181,6 +184,9 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
     param_default_dict = dict()
     param_values_dict = defaultdict(dict)
 
+    # Parameters that are read from the stream shapefile fields
+    strm_field_list = [hru.tosegment, hru.k_coef, hru.x_coef]
+
     # Read in parameters from CSV
     logging.info('\nReading PRMS parameters CSV file')
     with open(prms_param_csv_path, 'r') as input_f:
@@ -223,7 +229,7 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
                 param_default = float(param_default)
             
             #Check for stream based parameters or is these are calculated.
-            elif param_default in ['CALCULATED',"TOSEGMENT"]:
+            elif param_default == 'CALCULATED' or param_default in strm_field_list:
                 pass
 
             elif arcpy.ListFields(hru.polygon_path, param_default):
@@ -362,7 +368,7 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
     for key,value in param_default_dict.items():
         
         #Stream parameters have to come from stream shapefile not hru, so collect the related params here and index later.
-        if type(value) is str and value in ["TOSEGMENT"]:
+        if type(value) is str and value in strm_field_list:
             strm_param_field_dict[key] = value
         # Add all string valued params except "calculated" 
         elif type(value) is str and value != "CALCULATED":
@@ -378,10 +384,14 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
         arc_value_fields.append(identifier)
     
     # Read in each cell parameter value
+    # The values of each HRU are hashed to find HRUs that changed
+    hru_hash_dict = dict()
     s_cursor = arcpy.da.SearchCursor(hru.polygon_path, arc_value_fields)
     for row in s_cursor:
         #Use the identifier to uniquely assign each value in cursor
         param_row_id = row[arc_value_fields.index(identifier)]
+        hru_hash_dict[param_row_id] = hashlib.md5(repr(row)).hexdigest()[:16]
+        run_report.add_rows(1)
 
         #Iterate through and add all values in the row to our dict
         for param_name,arc_param_name in param_field_dict.items():
@@ -431,6 +441,31 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
             tmax_field, param_values_dict['tmax_index'][i]))
         del tmax_values
 
+    # HRU cascades from cascade_parameters
+    if os.path.isfile(hru.cascade_path):
+        logging.info('\nReading HRU cascades')
+        with open(hru.cascade_path, 'r') as input_f:
+            cascade_lines = [l.strip().split(',') for l in input_f.readlines()]
+        input_f.close()
+        dimen_size_dict['ncascade'] = len(cascade_lines) - 1
+        logging.info('  ncascade = {0}'.format(dimen_size_dict['ncascade']))
+        for j, param_name in enumerate(cascade_lines[0]):
+            param_name_dict[param_name] = param_name
+            param_width_dict[param_name] = 0
+            param_dimen_count_dict[param_name] = 1
+            param_dimen_names_dict[param_name] = ['ncascade']
+            param_values_count_dict[param_name] = dimen_size_dict['ncascade']
+            if param_name == 'hru_pct_up':
+                param_type_dict[param_name] = 2
+            else:
+                param_type_dict[param_name] = 1
+            for i, line in enumerate(cascade_lines[1:]):
+                if param_type_dict[param_name] == 1:
+                    param_values_dict[param_name][i] = int(line[j])
+                else:
+                    param_values_dict[param_name][i] = float(line[j])
+        del cascade_lines
+
     cell_dict = dict()
     fields = [
         hru.type_field, hru.krch_field, hru.lake_id_field,
@@ -509,6 +544,37 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
     # logging.info('  ncascdgw = {0}'.format(dimen_size_dict['ncascdgw']))
     # raw_input('ENTER')
  
+    # If only HRU field values changed since the last run,
+    #   patch the values of those HRUs in the existing parameter file
+    fill_key = repr([
+        sorted(dimen_size_dict.items()),
+        [(param_name, param_width_dict[param_name],
+          param_dimen_names_dict[param_name],
+          param_values_count_dict[param_name], param_type_dict[param_name],
+          None if param_name in param_field_dict.keys() else
+          sorted(param_values_dict.get(param_name, {}).items()))
+         for param_name in sorted(param_name_dict.keys())]])
+    fill_changes = HRUChanges(
+        hru, 'prms_template_fill', [fill_key], hru_hash_dict)
+    if (fill_changes.fid_list is not None and
+            os.path.isfile(prms_parameter_path)):
+        logging.info('\nPatching parameter file')
+        patch_dict = dict()
+        for param_name in param_field_dict.keys():
+            value_index = dict(
+                (hru_id, i)
+                for i, hru_id in enumerate(param_values_dict[param_name].keys()))
+            patch_dict[param_name] = dict(
+                (value_index[hru_id], param_value_str(
+                    param_values_dict[param_name][hru_id],
+                    param_type_dict[param_name]))
+                for hru_id in fill_changes.fid_list
+                if hru_id in value_index.keys())
+        patch_parameter_file(prms_parameter_path, patch_dict)
+        fill_changes.save()
+        logging.info('\nDone!')
+        return
+
     # Write dimensions/parameters to PRMS param file
     logging.info('\nWriting parameter file')
     with open(prms_parameter_path, 'w') as output_f:
@@ -577,19 +643,54 @@ def prms_template_fill(config_path, overwrite_flag=False, debug_flag=False):
             param_type = param_type_dict[param_name]
             output_f.write(str(param_type) + '\n')
             for i, param_value in param_values_dict[param_name].items():
-                if param_type == 1:
-                    output_f.write('{0:d}'.format(int(param_value)) + '\n')
-                elif param_type == 2:
-                    output_f.write('{0:f}'.format(param_value) + '\n')
-                elif param_type == 3:
-                    output_f.write('{0:f}'.format(param_value) + '\n')
-                elif param_type == 4:
-                    output_f.write('{0}'.format(param_value) + '\n')
+                output_f.write(
+                    param_value_str(param_value, param_type) + '\n')
 
     # Close file
     output_f.close()
+    fill_changes.save()
     logging.info('\nDone!')
 
+
+def param_value_str(param_value, param_type):
+    """Format a parameter value for the PRMS parameter file"""
+    if param_type == 1:
+        return '{0:d}'.format(int(param_value))
+    elif param_type in [2, 3]:
+        return '{0:f}'.format(param_value)
+    return '{0}'.format(param_value)
+
+
+def patch_parameter_file(prms_parameter_path, patch_dict):
+    """Replace parameter values in an existing PRMS parameter file
+
+    Args:
+        prms_parameter_path (str): PRMS parameter file path
+        patch_dict (dict): parameter names and the value strings
+            to replace, keyed by the value index
+
+    Returns:
+        None
+    """
+    with open(prms_parameter_path, 'r') as input_f:
+        param_lines = input_f.readlines()
+    param_flag = False
+    patch_count = 0
+    for i, line in enumerate(param_lines):
+        if line.strip() == '** Parameters **':
+            param_flag = True
+        elif param_flag and line.strip() == '####':
+            # Name/width, dimension count, dimensions, value count, type
+            param_name = param_lines[i + 1].split()[0]
+            dimen_count = int(param_lines[i + 2])
+            value_i = i + dimen_count + 5
+            for j, value_str in patch_dict.get(param_name, {}).items():
+                param_lines[value_i + j] = value_str + '\n'
+                patch_count += 1
+    logging.info('  Values patched: {0}'.format(patch_count))
+    with open(prms_parameter_path, 'w') as output_f:
+        output_f.writelines(param_lines)
+
 def prod(iterable):
     #if len(iterable) > 0:
     return reduce(operator.mul, iterable, 1)
@@ -13,7 +13,9 @@ import datetime as dt
 import logging
 import os
 import sys
+import time
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
@@ -28,9 +30,39 @@ from impervious_parameters import impervious_parameters
 from prism_4km_normals import prism_4km_parameters
 from ppt_ratio_parameters import ppt_ratio_parameters
 from stream_parameters  import stream_parameters
+from cascade_parameters import cascade_parameters
 from prms_template_fill import prms_template_fill
 
-def calculate_all_parameters(config_path, data_name='ALL', overwrite_flag=False, debug_flag=False):
+# Parameter scripts in execution order
+# Stage name, log message, function, and extra keyword arguments
+stage_list = [
+    ('hru_parameters', 'Calculating PRMS HRU Parameters...',
+     hru_parameters, ()),
+    ('dem_parameters', 'Calculating PRMS DEM Parameters...',
+     dem_parameters, ()),
+    ('veg_parameters', 'Calculating PRMS Vegetation Parameters...',
+     veg_parameters, ()),
+    ('soil_raster_prep', 'Preparing Soil Rasters...',
+     soil_raster_prep, ()),
+    ('soil_parameters', 'Calculating PRMS Soil Parameters...',
+     soil_parameters, ()),
+    ('impervious_parameters', 'Calculating PRMS Impervious Parameters...',
+     impervious_parameters, ()),
+    ('prism_4km_normals', 'Calculating PRISM 4Km Parameters...',
+     prism_4km_parameters, ('data_name',)),
+    ('ppt_ratio_parameters', 'Calculating PPT Ratio Parameters...',
+     ppt_ratio_parameters, ()),
+    ('stream_parameters', 'Calculating PRMS Stream Parameters...',
+     stream_parameters, ()),
+    ('cascade_parameters', 'Calculating PRMS Cascade Parameters...',
+     cascade_parameters, ()),
+    ('prms_template_fill', ' Writing Parameters to Input File for PRMS...',
+     prms_template_fill, ()),
+]
+
+
+def calculate_all_parameters(config_path, data_name='ALL', overwrite_flag=False,
+                             debug_flag=False, time_list=None):
     """
     Calculate all PRMS Parameters
 
@@ -47,79 +79,47 @@ def calculate_all_parameters(config_path, data_name='ALL', overwrite_flag=False,
     prism_4km_normals  / prism_800m_normals
     ppt_ratio_parameters
     stream_parameters
+    cascade_parameters
     prms_template_fill
 
     Args:
         config_file (str): Project config file path
+        data_name (str): PRISM data type (TMAX, TMIN, PPT, ALL)
         ovewrite_flag (bool): if True, overwrite existing files
         debug_flag (bool): if True, enable debug level logging
+        time_list (list): if set, the name and run time (seconds) of each
+            stage are appended as it finishes
 
     Returns:
-        None
+        list: stage names and run times (seconds)
     """
-    logging.info('\nCalculating PRMS HRU Parameters...')
-    hru_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-
-    logging.info("\nFinished!")
-
-    logging.info("\nCalculating PRMS DEM Parameters...")
-    dem_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
-
-    logging.info("\nCalculating PRMS Vegetation Parameters...")
-    veg_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
-
-    logging.info("\nPreparing Soil Rasters...")
-    soil_raster_prep(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
-
-    logging.info("\nCalculating PRMS Soil Parameters...")
-    soil_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
-
-    logging.info("\nCalculating PRMS Impervious Parameters...")
-    impervious_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
-
-    logging.info("\nCalculating PRISM 4Km Parameters...")
-    prism_4km_parameters(
-        config_path=args.ini, data_name=args.type,
-        overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
-
-    logging.info("\nCalculating PPT Ratio Parameters...")
-    ppt_ratio_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
+    if time_list is None:
+        time_list = []
+    kwarg_dict = {'data_name': data_name}
+    root_logger = logging.getLogger('')
+    for stage_name, stage_msg, stage_func, stage_kwargs in stage_list:
+        logging.info('\n' + stage_msg)
+        stage_start = time.time()
+        root_handlers = list(root_logger.handlers)
+        try:
+            stage_func(
+                config_path=config_path, overwrite_flag=overwrite_flag,
+                debug_flag=debug_flag,
+                **dict((k, kwarg_dict[k]) for k in stage_kwargs))
+        finally:
+            # Each script adds a handler for its own log file
+            # Remove them so the process can run another project
+            for handler in list(root_logger.handlers):
+                if handler not in root_handlers:
+                    root_logger.removeHandler(handler)
+                    handler.close()
+        time_list.append((stage_name, time.time() - stage_start))
+        if stage_func is not prms_template_fill:
+            logging.info("\nFinished!")
+    logging.info("\nParameters are now written to file and can be used for PRMS Simulations.")
+    return time_list
 
-    logging.info("\nCalculating PRMS Stream Parameters...")
-    stream_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nFinished!")
 
-    logging.info("\n Writing Parameters to Input File for PRMS...")
-    prms_template_fill(
-        config_path=args.ini, overwrite_flag=args.overwrite,
-        debug_flag=args.loglevel==logging.DEBUG)
-    logging.info("\nParameters are now written to file and can be used for PRMS Simulations.")
-    
-    
 def arg_parse():
     """"""
     parser = argparse.ArgumentParser(
@@ -158,5 +158,6 @@ if __name__ == '__main__':
 
     # Calculate PRMS Parameters
     calculate_all_parameters(
-        config_path=args.ini, overwrite_flag=args.overwrite,
+        config_path=args.ini, data_name=args.type,
+        overwrite_flag=args.overwrite,
         debug_flag=args.loglevel==logging.DEBUG)
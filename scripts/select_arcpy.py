@@ -0,0 +1,40 @@
+#--------------------------------
+# Name:         select_arcpy.py
+# Purpose:      Select the ArcGIS arcpy or the fake_arcpy stand-in
+# Python:       2.7
+#--------------------------------
+"""Import this module before arcpy to select which arcpy is used
+
+The PRMS_ARCPY environment variable sets the arcpy type:
+    REAL: ArcGIS arcpy (default)
+    FAKE: fake_arcpy (NumPy/shapefile stand-in, runs without ArcGIS)
+"""
+
+import logging
+import os
+import sys
+
+
+def select_arcpy(arcpy_type=None):
+    """Make "import arcpy" load the real or the fake arcpy
+
+    Args:
+        arcpy_type (str): REAL or FAKE
+            If None, the PRMS_ARCPY environment variable is used
+    """
+    if arcpy_type is None:
+        arcpy_type = os.environ.get('PRMS_ARCPY', 'REAL')
+    arcpy_type = arcpy_type.upper()
+    if arcpy_type == 'REAL':
+        return
+    elif arcpy_type == 'FAKE':
+        import fake_arcpy
+        fake_arcpy.install()
+    else:
+        logging.error(
+            '\nERROR: PRMS_ARCPY must be REAL or FAKE, not {0}'.format(
+                arcpy_type))
+        sys.exit()
+
+
+select_arcpy()
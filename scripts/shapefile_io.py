@@ -0,0 +1,326 @@
+#--------------------------------
+# Name:         shapefile_io.py
+# Purpose:      Shapefile/DBF I/O with NumPy arrays (no ArcGIS)
+# Python:       2.7
+#--------------------------------
+
+import datetime as dt
+import logging
+import os
+import struct
+import sys
+
+import numpy as np
+
+
+shape_type_dict = {'POINT': 1, 'POLYGON': 5}
+# Shape types that can be read
+shape_name_dict = {0: 'NULL', 1: 'POINT', 3: 'POLYLINE', 5: 'POLYGON'}
+
+
+class ShapefileWriter():
+    """Stream point or single ring polygon records to a shapefile
+
+    Records are written a chunk of arrays at a time, so only the
+    current chunk is held in memory.  The record count and bounding
+    box in the .shp/.shx/.dbf headers are written on close.
+
+    All fields are numeric (DBF type N), defined as (name, width, decimals).
+    """
+    def __init__(self, shp_path, shape_type, field_list, sr_wkt=None):
+        self.shape_type = shape_type.upper()
+        if self.shape_type not in shape_type_dict.keys():
+            logging.error(
+                '\nERROR: Unsupported shape type: {0}'.format(shape_type))
+            sys.exit()
+        self.field_list = [
+            (str(name)[:10], int(width), int(decimals))
+            for name, width, decimals in field_list]
+        self.count = 0
+        self.shp_length = 100
+        self.bbox = [np.inf, np.inf, -np.inf, -np.inf]
+
+        base_path = os.path.splitext(shp_path)[0]
+        self.shp_f = open(base_path + '.shp', 'wb')
+        self.shx_f = open(base_path + '.shx', 'wb')
+        self.dbf_f = open(base_path + '.dbf', 'wb')
+        self.shp_f.write('\0' * 100)
+        self.shx_f.write('\0' * 100)
+        self.dbf_f.write(self.dbf_header())
+        if sr_wkt:
+            with open(base_path + '.prj', 'w') as prj_f:
+                prj_f.write(sr_wkt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record_dtype(self, vertex_count):
+        """Shape record (header + content) as a packed NumPy dtype"""
+        if self.shape_type == 'POINT':
+            return np.dtype([
+                ('number', '>i4'), ('length', '>i4'),
+                ('type', '<i4'), ('xy', '<f8', (2,))])
+        return np.dtype([
+            ('number', '>i4'), ('length', '>i4'),
+            ('type', '<i4'), ('box', '<f8', (4,)),
+            ('parts', '<i4'), ('points', '<i4'), ('part_0', '<i4'),
+            ('xy', '<f8', (vertex_count, 2))])
+
+    def write(self, geom_array, value_dict):
+        """Write a chunk of records
+
+        Args:
+            geom_array (:class:`numpy.array`): point coordinates (n, 2)
+                or closed polygon rings (n, vertices, 2) in clockwise order
+            value_dict (dict): field names and value arrays (length n)
+        """
+        geom_array = np.asarray(geom_array, dtype=np.float64)
+        n = geom_array.shape[0]
+        if not n:
+            return
+        vertex_count = 1 if geom_array.ndim == 2 else geom_array.shape[1]
+        record_array = np.zeros(n, dtype=self.record_dtype(vertex_count))
+        content_words = (record_array.dtype.itemsize - 8) // 2
+        record_array['number'] = np.arange(self.count + 1, self.count + n + 1)
+        record_array['length'] = content_words
+        record_array['type'] = shape_type_dict[self.shape_type]
+        record_array['xy'] = geom_array
+        if self.shape_type == 'POINT':
+            x_min = x_max = geom_array[:, 0]
+            y_min = y_max = geom_array[:, 1]
+        else:
+            x_min = geom_array[:, :, 0].min(axis=1)
+            y_min = geom_array[:, :, 1].min(axis=1)
+            x_max = geom_array[:, :, 0].max(axis=1)
+            y_max = geom_array[:, :, 1].max(axis=1)
+            record_array['box'] = np.column_stack((x_min, y_min, x_max, y_max))
+            record_array['parts'] = 1
+            record_array['points'] = vertex_count
+        self.bbox = [
+            min(self.bbox[0], x_min.min()), min(self.bbox[1], y_min.min()),
+            max(self.bbox[2], x_max.max()), max(self.bbox[3], y_max.max())]
+
+        # Index records are the offset and content length in 16 bit words
+        record_words = record_array.dtype.itemsize // 2
+        index_array = np.empty((n, 2), dtype='>i4')
+        index_array[:, 0] = (
+            self.shp_length // 2 + np.arange(n) * record_words)
+        index_array[:, 1] = content_words
+
+        self.shp_f.write(record_array.tostring())
+        self.shx_f.write(index_array.tostring())
+        self.dbf_f.write(self.dbf_records(value_dict, n))
+        self.shp_length += n * record_array.dtype.itemsize
+        self.count += n
+
+    def dbf_header(self):
+        """DBF file header and field descriptors"""
+        return dbf_header(
+            [(name, 'N', width, decimals)
+             for name, width, decimals in self.field_list],
+            self.count)
+
+    def dbf_records(self, value_dict, n):
+        """Format a chunk of DBF records (right justified numbers)"""
+        record_array = np.empty(
+            n, dtype=[('deleted', 'S1')] + [
+                (name, 'S{0}'.format(width))
+                for name, width, decimals in self.field_list])
+        record_array['deleted'] = ' '
+        for name, width, decimals in self.field_list:
+            if decimals:
+                value_fmt = '%{0}.{1}f'.format(width, decimals)
+                values = np.asarray(value_dict[name], dtype=np.float64)
+            else:
+                value_fmt = '%{0}d'.format(width)
+                values = np.asarray(value_dict[name], dtype=np.int64)
+            value_str = np.char.mod(value_fmt, values)
+            if np.any(np.char.str_len(value_str) > width):
+                logging.error(
+                    '\nERROR: Values for field {0} are wider than {1}'.format(
+                        name, width))
+                sys.exit()
+            record_array[name] = value_str
+        return record_array.tostring()
+
+    def close(self):
+        """Write the final headers and close the files"""
+        if self.shp_f.closed:
+            return
+        shape_type = shape_type_dict[self.shape_type]
+        if not self.count:
+            self.bbox = [0.0, 0.0, 0.0, 0.0]
+        for f, length in [
+                (self.shp_f, self.shp_length),
+                (self.shx_f, 100 + 8 * self.count)]:
+            f.seek(0)
+            f.write(struct.pack('>i20xi', 9994, length // 2))
+            f.write(struct.pack('<ii', 1000, shape_type))
+            f.write(struct.pack('<8d', *(self.bbox + [0, 0, 0, 0])))
+            f.close()
+        self.dbf_f.write('\x1a')
+        self.dbf_f.seek(0)
+        self.dbf_f.write(self.dbf_header())
+        self.dbf_f.close()
+
+
+def dbf_header(field_list, record_count):
+    """DBF file header and field descriptors
+
+    Args:
+        field_list (list): (name, type, width, decimals) of each field
+        record_count (int): number of records
+    """
+    today = dt.date.today()
+    record_length = 1 + sum([f[2] for f in field_list])
+    header_length = 32 + 32 * len(field_list) + 1
+    header = struct.pack(
+        '<BBBBIHH20x', 3, today.year - 1900, today.month, today.day,
+        record_count, header_length, record_length)
+    for name, field_type, width, decimals in field_list:
+        header += struct.pack(
+            '<11sc4xBB14x', str(name)[:10], field_type, width, decimals)
+    return header + '\r'
+
+
+def read_dbf(dbf_path):
+    """Read the fields and records of a DBF file
+
+    Numeric fields are read as int (no decimals) or float, character
+    fields as stripped strings and blank values as None.
+
+    Returns:
+        tuple: field list of (name, type, width, decimals) and a list of
+            records (one list of values per record)
+    """
+    with open(dbf_path, 'rb') as dbf_f:
+        record_count, header_length, record_length = struct.unpack(
+            '<4xIHH20x', dbf_f.read(32))
+        field_list = []
+        while True:
+            descriptor = dbf_f.read(32)
+            if not descriptor or descriptor[0] == '\r':
+                break
+            name, field_type, width, decimals = struct.unpack(
+                '<11sc4xBB14x', descriptor)
+            field_list.append(
+                (name.split('\0')[0], field_type.upper(), width, decimals))
+        dbf_f.seek(header_length)
+        record_data = dbf_f.read(record_count * record_length)
+
+    record_array = np.frombuffer(
+        record_data, count=record_count, dtype=[('deleted', 'S1')] + [
+            ('f{0}'.format(i), 'S{0}'.format(f[2]))
+            for i, f in enumerate(field_list)])
+    column_list = []
+    for i, (name, field_type, width, decimals) in enumerate(field_list):
+        value_list = [v.strip() for v in record_array['f{0}'.format(i)]]
+        if field_type == 'N' and decimals == 0:
+            column_list.append([dbf_number(v, int) for v in value_list])
+        elif field_type in ['N', 'F']:
+            column_list.append([dbf_number(v, float) for v in value_list])
+        else:
+            column_list.append([v if v else None for v in value_list])
+    if not column_list:
+        return field_list, [[] for i in xrange(record_count)]
+    return field_list, [list(record) for record in zip(*column_list)]
+
+
+def dbf_number(value_str, value_type):
+    """Convert a DBF numeric string, blank or invalid values are None"""
+    try:
+        return value_type(value_str)
+    except ValueError:
+        try:
+            return value_type(float(value_str))
+        except ValueError:
+            return None
+
+
+def write_dbf(dbf_path, field_list, record_list):
+    """Write a DBF file
+
+    Values that are too wide for a numeric field are written as '*'
+    (like dBase) and None is written as blanks.
+
+    Args:
+        dbf_path (str): DBF file path
+        field_list (list): (name, type, width, decimals) of each field
+        record_list (list): one list of values per record
+    """
+    with open(dbf_path, 'wb') as dbf_f:
+        dbf_f.write(dbf_header(field_list, len(record_list)))
+        for record in record_list:
+            record_str = ' '
+            for (name, field_type, width, decimals), value in zip(
+                    field_list, record):
+                if value is None:
+                    value_str = ''
+                elif field_type in ['N', 'F'] and decimals:
+                    value_str = '{0:>{1}.{2}f}'.format(
+                        float(value), width, decimals)
+                elif field_type in ['N', 'F']:
+                    value_str = '{0:>{1}d}'.format(int(round(value)), width)
+                elif field_type == 'L':
+                    value_str = 'T' if value else 'F'
+                else:
+                    value_str = str(value)[:width]
+                if len(value_str) > width:
+                    value_str = '*' * width
+                if field_type in ['N', 'F']:
+                    record_str += value_str.rjust(width)
+                else:
+                    record_str += value_str.ljust(width)
+            dbf_f.write(record_str)
+        dbf_f.write('\x1a')
+
+
+def read_shapefile(shp_path):
+    """Read the geometry of each record in a shapefile
+
+    Returns:
+        tuple: shape type name (POINT, POLYLINE, POLYGON) and a list
+            with the geometry of each record.  Points are (x, y) and
+            polylines/polygons are lists of (n, 2) part/ring arrays.
+            Null shapes are None.
+    """
+    with open(os.path.splitext(shp_path)[0] + '.shp', 'rb') as shp_f:
+        shp_data = shp_f.read()
+    file_type = struct.unpack('<i', shp_data[32:36])[0]
+    if file_type not in shape_name_dict.keys():
+        logging.error(
+            '\nERROR: Unsupported shape type: {0}'.format(file_type))
+        sys.exit()
+
+    shape_list = []
+    offset = 100
+    while offset + 8 <= len(shp_data):
+        content_words = struct.unpack('>i', shp_data[offset + 4:offset + 8])[0]
+        content = offset + 8
+        record_type = struct.unpack('<i', shp_data[content:content + 4])[0]
+        if record_type == 0:
+            shape_list.append(None)
+        elif record_type == 1:
+            shape_list.append(
+                struct.unpack('<2d', shp_data[content + 4:content + 20]))
+        elif record_type in [3, 5]:
+            part_count, point_count = struct.unpack(
+                '<2i', shp_data[content + 36:content + 44])
+            part_start = np.frombuffer(
+                shp_data, dtype='<i4', count=part_count, offset=content + 44)
+            xy_array = np.frombuffer(
+                shp_data, dtype='<f8', count=2 * point_count,
+                offset=content + 44 + 4 * part_count).reshape(-1, 2)
+            part_stop = np.append(part_start[1:], point_count)
+            shape_list.append([
+                xy_array[i:j].copy()
+                for i, j in zip(part_start.tolist(), part_stop.tolist())])
+        else:
+            logging.error(
+                '\nERROR: Unsupported shape type: {0}'.format(record_type))
+            sys.exit()
+        offset = content + 2 * content_words
+    return shape_name_dict[file_type], shape_list
@@ -17,6 +17,7 @@ import os
 import sys
 # import tempfile
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
@@ -25,6 +26,7 @@ from arcpy.sa import *
 from support_functions import *
 
 
+@instrument('soil_parameters', stage_flag=True)
 def soil_parameters(config_path, overwrite_flag=False, debug_flag=False):
     """Calculate PRMS Soil Parameters
 
@@ -202,9 +204,15 @@ def soil_parameters(config_path, overwrite_flag=False, debug_flag=False):
     # zs_soil_dict[hru.ssr2gw_rate_field] = [ssr2gw_rate_path, 'MEAN']
     # zs_soil_dict[hru.slowcoef_lin_field] = [slowcoef_lin_path, 'MEAN']
 
+    # Only HRUs that changed since the last run are recalculated
+    hru_changes = HRUChanges(
+        hru, 'soil_parameters', zs_input_list(zs_soil_dict))
+
     # Calculate zonal statistics
     logging.info('\nCalculating zonal statistics')
-    zonal_stats_func(zs_soil_dict, hru.polygon_path, hru)
+    zonal_stats_func(
+        zs_soil_dict, hru.polygon_path, hru,
+        fid_list=hru_changes.fid_list)
 
 
     # Make a fishnet layer for calculating fields
@@ -357,6 +365,7 @@ def soil_parameters(config_path, overwrite_flag=False, debug_flag=False):
     #    arcpy.Delete_management(hru_polygon_layer)
     #    del hru_polygon_layer
     
+    hru_changes.save()
     logging.info('Done!')
 
 
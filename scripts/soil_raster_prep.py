@@ -17,14 +17,16 @@ import os
 import sys
 # import tempfile
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
-# import numpy as np
+import numpy as np
 
 from support_functions import *
 
 
+@instrument('soil_raster_prep', stage_flag=True)
 def soil_raster_prep(config_path, overwrite_flag=False, debug_flag=False):
     """Prepare PRMS soil rasters
 
@@ -78,151 +80,39 @@ def soil_raster_prep(config_path, overwrite_flag=False, debug_flag=False):
     env.workspace = soil_temp_ws
     env.scratchWorkspace = hru.scratch_ws
 
-    # Available Water Capacity (AWC)
-    logging.info('\nProjecting/clipping AWC raster')
-    soil_orig_sr = Raster(hru.awc_orig_path).spatialReference
-    logging.debug('  AWC GCS:  {0}'.format(
-        soil_orig_sr.GCS.name))
-    
-    # Remove existing projected raster
-    if arcpy.Exists(awc_path):
-        arcpy.Delete_management(awc_path)
-        
-    # Set preferred transforms
-    transform_str = transform_func(hru.sr, soil_orig_sr)
-    logging.debug('  Transform: {0}'.format(transform_str))
-    logging.debug('  Projection method: NEAREST')
-    
-    # Project soil raster
-    # DEADBEEF - Arc10.2 ProjectRaster does not honor extent
-    project_raster_func(
-        hru.awc_orig_path, awc_path, hru.sr,
-        hru.soil_proj_method, hru.soil_cs, transform_str,
-        soil_orig_sr, hru)
-    # env.extent = hru.extent
-    # arcpy.ProjectRaster_management(
-    #    awc_orig_path, awc_path, hru.sr,
-    #    soil_proj_method, soil_cs, transform_str,
-    #    '{0} {1}'.format(hru.ref_x, hru.ref_y),
-    #    soil_orig_sr)
-    # arcpy.ClearEnvironment('extent')
-
-    # Percent clay
-    logging.info('Projecting/clipping clay raster')
-    soil_orig_sr = Raster(hru.clay_pct_orig_path).spatialReference
-    logging.debug('  Clay GCS: {0}'.format(
-        soil_orig_sr.GCS.name))
-    
-    # Remove existing projected raster
-    if arcpy.Exists(clay_pct_path):
-        arcpy.Delete_management(clay_pct_path)
-        
-    # Set preferred transforms
-    transform_str = transform_func(hru.sr, soil_orig_sr)
-    logging.debug('  Transform: {0}'.format(transform_str))
-    logging.debug('  Projection method: NEAREST')
-    
-    # Project soil raster
-    # DEADBEEF - Arc10.2 ProjectRaster does not extent
-    project_raster_func(
-        hru.clay_pct_orig_path, clay_pct_path, hru.sr,
-        hru.soil_proj_method, hru.soil_cs, transform_str,
-        soil_orig_sr, hru)
-    # env.extent = hru.extent
-    # arcpy.ProjectRaster_management(
-    #    clay_pct_orig_path, clay_pct_path, hru.sr,
-    #    soil_proj_method, soil_cs, transform_str,
-    #    '{0} {1}'.format(hru.ref_x, hru.ref_y),
-    #    soil_orig_sr)
-    # arcpy.ClearEnvironment('extent')
-
-    # Percent sand
-    logging.info('Projecting/clipping sand raster')
-    soil_orig_sr = Raster(hru.sand_pct_orig_path).spatialReference
-    logging.debug('  Sand GCS: {0}'.format(
-        soil_orig_sr.GCS.name))
-    
-    # Remove existing projected raster
-    if arcpy.Exists(sand_pct_path):
-        arcpy.Delete_management(sand_pct_path)
-        
-    # Set preferred transforms
-    transform_str = transform_func(hru.sr, soil_orig_sr)
-    logging.debug('  Transform: {0}'.format(transform_str))
-    logging.debug('  Projection method: NEAREST')
-    
-    # Project soil raster
-    # DEADBEEF - Arc10.2 ProjectRaster does not honor extent
-    project_raster_func(
-        hru.sand_pct_orig_path, sand_pct_path, hru.sr,
-        hru.soil_proj_method, hru.soil_cs, transform_str,
-        soil_orig_sr, hru)
-    # env.extent = hru.extent
-    # arcpy.ProjectRaster_management(
-    #    sand_pct_orig_path, sand_pct_path, hru.sr,
-    #    soil_proj_method, soil_cs, transform_str,
-    #    '{0} {1}'.format(hru.ref_x, hru.ref_y),
-    #    soil_orig_sr)
-    # arcpy.ClearEnvironment('extent')
-
-    # Hydraulic conductivity
-    # if calc_ssr2gw_rate_flag or calc_slowcoef_flag:
-    logging.info('Projecting/clipping ksat raster')
-    ksat_orig_sr = Raster(hru.ksat_orig_path).spatialReference
-    logging.debug('  Ksat GCS: {0}'.format(
-        soil_orig_sr.GCS.name))
-    
-    # Remove existing projected raster
-    if arcpy.Exists(ksat_path):
-        arcpy.Delete_management(ksat_path)
-        
-    # Set preferred transforms
-    transform_str = transform_func(hru.sr, ksat_orig_sr)
-    logging.debug('  Transform: {0}'.format(transform_str))
-    logging.debug('  Projection method: NEAREST')
-    
-    # Project ksat raster
-    # DEADBEEF - Arc10.2 ProjectRaster does not honor extent
-    project_raster_func(
-        hru.ksat_orig_path, ksat_path, hru.sr,
-        hru.soil_proj_method, hru.soil_cs, transform_str,
-        soil_orig_sr, hru)
-    # env.extent = hru.extent
-    # arcpy.ProjectRaster_management(
-    #    ksat_orig_path, ksat_path, hru.sr,
-    #    soil_proj_method, soil_cs, transform_str,
-    #    '{0} {1}'.format(hru.ref_x, hru.ref_y),
-    #    soil_orig_sr)
-    # arcpy.ClearEnvironment('extent')
-
+    # Available Water Capacity (AWC), percent clay, percent sand,
+    #   and hydraulic conductivity
     # Soil depth is only needed if clipping root depth
+    soil_list = [
+        ['AWC', hru.awc_orig_path, awc_path],
+        ['Clay', hru.clay_pct_orig_path, clay_pct_path],
+        ['Sand', hru.sand_pct_orig_path, sand_pct_path],
+        ['Ksat', hru.ksat_orig_path, ksat_path]]
     if hru.clip_root_depth_flag:
-        logging.info('\nProjecting/clipping depth raster')
-        soil_orig_sr = Raster(hru.soil_depth_orig_path).spatialReference
-        logging.debug('  Depth GCS: {0}'.format(
-            soil_orig_sr.GCS.name))
-        
+        soil_list.append(
+            ['Depth', hru.soil_depth_orig_path, soil_depth_path])
+
+    logging.info('\nProjecting/clipping soil rasters')
+    logging.debug('  Projection method: {0}'.format(hru.soil_proj_method))
+    for soil_name, soil_orig_path, soil_path in soil_list:
+        logging.info('  {0}'.format(soil_name))
+        soil_orig_sr = Raster(soil_orig_path).spatialReference
+        logging.debug('    GCS: {0}'.format(soil_orig_sr.GCS.name))
+        logging.debug('    Transform: {0}'.format(
+            transform_func(hru.sr, soil_orig_sr)))
+
         # Remove existing projected raster
-        if arcpy.Exists(soil_depth_path):
-            arcpy.Delete_management(soil_depth_path)
-            
-        # Set preferred transforms
-        transform_str = transform_func(hru.sr, soil_orig_sr)
-        logging.debug('  Transform: {0}'.format(transform_str))
-        logging.debug('  Projection method: NEAREST')
-        # Project soil raster
-        # DEADBEEF - Arc10.2 ProjectRaster does not honor extent
-        project_raster_func(
-            hru.soil_depth_orig_path, soil_depth_path, hru.sr,
-            hru.soil_proj_method, hru.soil_cs, transform_str,
-            soil_orig_sr, hru)
-        # env.extent = hru.extent
-        # arcpy.ProjectRaster_management(
-        #    soil_depth_orig_path, soil_depth_path, hru.sr,
-        #    soil_proj_method, soil_cs, transform_str,
-        #    '{0} {1}'.format(hru.ref_x, hru.ref_y),
-        #    soil_orig_sr)
-        # arcpy.ClearEnvironment('extent')
+        if arcpy.Exists(soil_path):
+            arcpy.Delete_management(soil_path)
+        del soil_orig_sr
+
+    # Project soil rasters
+    # Soil rasters on the same source grid share a projection plan
+    #   so the clip window and cell mapping are only computed once
+    project_raster_group_func(
+        [soil_orig_path for soil_name, soil_orig_path, soil_path in soil_list],
+        [soil_path for soil_name, soil_orig_path, soil_path in soil_list],
+        hru.sr, hru.soil_proj_method, hru.soil_cs, hru)
 
     # Clip root depth to soil depth
     # if clip_root_depth_flag:
@@ -235,22 +125,47 @@ def soil_raster_prep(config_path, overwrite_flag=False, debug_flag=False):
     #    root_depth_obj.save(root_depth_path)
     #    del root_depth_obj
 
-    # Fill soil nodata values using nibble
+    # Fill soil nodata values with the nearest valid cell (like Nibble)
+    # The nearest cell index is only computed once for all rasters
+    #   that share a nodata mask and values are not scaled to integers
     if hru.fill_soil_nodata_flag:
-        logging.info('\nFilling soil nodata values using Nibble')
+        logging.info('\nFilling soil nodata values from nearest valid cell')
         soil_raster_list = [
             awc_path, clay_pct_path, sand_pct_path, ksat_path]
         if hru.clip_root_depth_flag:
             soil_raster_list.append(soil_depth_path)
+        env.outputCoordinateSystem = hru.sr
+        nearest_list = []
         for soil_raster_path in soil_raster_list:
             logging.info('  {0}'.format(soil_raster_path))
-            # DEADBEEF - Check if there is any nodata to be filled first?
-            mask_obj = Int(1000 * SetNull(
-                Raster(soil_raster_path) < 0, Raster(soil_raster_path)))
-            input_obj = Con(IsNull(mask_obj), 0, mask_obj)
-            nibble_obj = 0.001 * Nibble(input_obj, mask_obj, 'ALL_VALUES')
-            nibble_obj.save(soil_raster_path)
+            soil_obj = Raster(soil_raster_path)
+            soil_pnt = arcpy.Point(soil_obj.extent.XMin, soil_obj.extent.YMin)
+            soil_cs = soil_obj.meanCellWidth
+            soil_array, soil_nodata = raster_obj_to_array(
+                soil_obj, return_nodata=True)
+            del soil_obj
+            soil_array = soil_array.astype(np.float64)
+            nodata_mask = np.isnan(soil_array) | (soil_array < 0)
+            if not np.isnan(soil_nodata):
+                nodata_mask |= (soil_array == soil_nodata)
+            if not np.any(nodata_mask):
+                logging.debug('    No nodata cells')
+                continue
+
+            # Reuse the nearest cell index if the nodata mask matches
+            for mask, nearest_index in nearest_list:
+                if np.array_equal(mask, nodata_mask):
+                    logging.debug('    Reusing nearest cell index')
+                    break
+            else:
+                nearest_index = nearest_valid_index(~nodata_mask)
+                nearest_list.append((nodata_mask, nearest_index))
+            soil_array[nodata_mask] = np.nan
+            soil_array = nearest_fill(soil_array, nearest_index)
+            array_to_raster(soil_array, soil_raster_path, soil_pnt, soil_cs)
             arcpy.BuildPyramids_management(soil_raster_path)
+            del soil_array, nodata_mask
+        arcpy.ClearEnvironment('outputCoordinateSystem')
             
     logging.info('Done!')
 
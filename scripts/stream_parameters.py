@@ -19,6 +19,7 @@ import subprocess
 import sys
 # from time import clock, sleep
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
@@ -34,6 +35,7 @@ max_iter = 1000
 w = 2
 max_seg = 10
 
+@instrument('stream_parameters', stage_flag=True)
 def stream_parameters(config_path, overwrite_flag=False, debug_flag=False):
     """Calculate PRMS Stream Parameters
 
@@ -221,8 +223,129 @@ def stream_parameters(config_path, overwrite_flag=False, debug_flag=False):
 #         hru[1] = hru_seg[hru[0]]+1
 #         all_hrus.updateRow(hru)
 
+    del stream_segments, all_hrus
+
+    # Network order, upstream area, and subbasins from the TOSEGMENT topology
+    # Segment IDs are the stream FID + 1
+    logging.info('\nCalculating stream network parameters')
+    add_field_func(hru.stream_path, hru.seg_order_field, 'LONG')
+    add_field_func(hru.stream_path, hru.strahler_field, 'LONG')
+    add_field_func(hru.stream_path, hru.up_area_field, 'DOUBLE')
+    add_field_func(hru.stream_path, hru.subbasin_field, 'LONG')
+    add_field_func(hru.polygon_path, hru.segbasin_field, 'LONG')
+    add_field_func(hru.polygon_path, hru.subbasin_field, 'LONG')
+    tosegment_dict = dict([
+        (int(row[0]) + 1, int(row[1] or 0))
+        for row in arcpy.da.SearchCursor(
+            hru.stream_path, ['FID', hru.tosegment])])
+    nseg = len(tosegment_dict)
+    tosegment_array = np.array(
+        [tosegment_dict[seg] for seg in xrange(1, nseg + 1)], dtype=np.int64)
+    del tosegment_dict
+    topo_order = segment_topo_order(tosegment_array)
+    seg_order_array = np.empty(nseg, dtype=np.int64)
+    seg_order_array[topo_order] = np.arange(1, nseg + 1)
+    strahler_array = segment_strahler_order(tosegment_array, topo_order)
+
+    # Upstream area is the area of the HRUs draining to each segment
+    #   and all of the segments above it
+    hru_seg_array, hru_area_array = np.array([
+        (int(row[0] or 0), float(row[1] or 0))
+        for row in arcpy.da.SearchCursor(
+            hru.polygon_path, [hru.hru_segment, hru.area_field])]).T
+    hru_seg_array = hru_seg_array.astype(np.int64)
+    hru_seg_mask = (hru_seg_array > 0) & (hru_seg_array <= nseg)
+    seg_area_array = np.bincount(
+        hru_seg_array[hru_seg_mask], weights=hru_area_array[hru_seg_mask],
+        minlength=nseg + 1)[1:]
+    up_area_array = segment_upstream_sum(
+        tosegment_array, topo_order, seg_area_array)
+    del hru_seg_array, hru_area_array, hru_seg_mask, seg_area_array
+
+    # Segment basins end at the network outlets,
+    #   subbasins can also end at the subbasin segments (i.e. gauges)
+    segbasin_array = segment_outlet(tosegment_array, topo_order)
+    outlet_mask = np.zeros(nseg, dtype=np.bool)
+    for seg in hru.subbasin_segment_list:
+        if seg < 1 or seg > nseg:
+            logging.error(
+                '\nERROR: Subbasin segment {0} is not a segment'.format(seg))
+            sys.exit()
+        outlet_mask[seg - 1] = True
+    subbasin_outlet_array = segment_outlet(
+        tosegment_array, topo_order, outlet_mask)
+    subbasin_array = np.searchsorted(
+        np.unique(subbasin_outlet_array), subbasin_outlet_array) + 1
+    logging.info('  Segments:  {0}'.format(nseg))
+    logging.info('  Outlets:   {0}'.format(np.unique(segbasin_array).size))
+    logging.info('  Subbasins: {0}'.format(subbasin_array.max()))
+    logging.info('  Maximum Strahler order: {0}'.format(strahler_array.max()))
+
+    logging.info('  Writing values to streams')
+    fields = [
+        'FID', hru.seg_order_field, hru.strahler_field,
+        hru.up_area_field, hru.subbasin_field]
+    with arcpy.da.UpdateCursor(hru.stream_path, fields) as u_cursor:
+        for row in u_cursor:
+            seg_i = int(row[0])
+            row[1:] = [
+                int(seg_order_array[seg_i]), int(strahler_array[seg_i]),
+                float(up_area_array[seg_i]), int(subbasin_array[seg_i])]
+            u_cursor.updateRow(row)
+    logging.info('  Writing values to HRUs')
+    fields = [hru.hru_segment, hru.segbasin_field, hru.subbasin_field]
+    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
+        for row in u_cursor:
+            seg = int(row[0] or 0)
+            if 0 < seg <= nseg:
+                row[1:] = [
+                    int(segbasin_array[seg - 1]), int(subbasin_array[seg - 1])]
+            else:
+                row[1:] = [0, 0]
+            u_cursor.updateRow(row)
+
+    # Muskingum routing coefficients from segment length and slope
+    # All stream vertices are read at once (in the HRU spatial reference)
+    #   and their elevations are sampled from the filled DEM array
+    logging.info('\nCalculating k_coef and x_coef')
+    dem_fill_path = os.path.join(hru.param_ws, 'dem_rasters', 'dem_fill.img')
+    if not arcpy.Exists(dem_fill_path):
+        logging.error(
+            ('\nERROR: Filled DEM raster does not exist' +
+             '\nERROR:   {0}' +
+             '\nERROR: Try re-running dem_parameters.py').format(
+                 dem_fill_path))
+        sys.exit()
+    dem_obj = Raster(dem_fill_path)
+    dem_array = arcpy.RasterToNumPyArray(dem_obj).astype(np.float64)
+    if dem_obj.noDataValue is not None:
+        dem_array[dem_array == dem_obj.noDataValue] = np.NaN
+    vertex_array = arcpy.da.FeatureClassToNumPyArray(
+        hru.stream_path, ['FID', 'SHAPE@X', 'SHAPE@Y'],
+        spatial_reference=hru.sr, explode_to_points=True)
+    vertex_z = array_sample_func(
+        dem_array, vertex_array['SHAPE@X'], vertex_array['SHAPE@Y'],
+        dem_obj.extent.XMin, dem_obj.extent.YMax, dem_obj.meanCellWidth)
+    seg_length_array, seg_slope_array = segment_length_slope(
+        vertex_array['FID'], vertex_array['SHAPE@X'],
+        vertex_array['SHAPE@Y'], vertex_z, nseg, hru.min_stream_slope)
+    del dem_obj, dem_array, vertex_array, vertex_z
+    k_coef_array, x_coef_array = muskingum_coef_func(
+        seg_length_array * hru.sr.metersPerUnit, seg_slope_array,
+        hru.mannings_n, hru.stream_depth)
+    logging.info('  k_coef: {0:.2f}-{1:.2f} hours'.format(
+        k_coef_array.min(), k_coef_array.max()))
+    logging.info('  x_coef: {0:.2f}-{1:.2f}'.format(
+        x_coef_array.min(), x_coef_array.max()))
+    fields = ['FID', hru.k_coef, hru.x_coef, hru.obsin_segment]
+    with arcpy.da.UpdateCursor(hru.stream_path, fields) as u_cursor:
+        for row in u_cursor:
+            seg_i = int(row[0])
+            row[1:] = [
+                float(k_coef_array[seg_i]), float(x_coef_array[seg_i]), 0]
+            u_cursor.updateRow(row)
+
     logging.info('\nDone!')
-    del stream_segments,all_hrus
 
 def average(lst):
     """
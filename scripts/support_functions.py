@@ -9,24 +9,207 @@
 
 from collections import defaultdict
 import ConfigParser
+import functools
+import hashlib
 import heapq
 import itertools
+import json
 import logging
 import math
-from operator import itemgetter
 import os
 import re
+import shutil
 import sys
+import tempfile
+import time
 from time import sleep
 
 import numpy as np
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
 
 from support_functions import *
 
+if os.name == 'nt':
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in [
+                'PeakWorkingSetSize', 'WorkingSetSize',
+                'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                'PagefileUsage', 'PeakPagefileUsage']]
+
+    class IO_COUNTERS(ctypes.Structure):
+        _fields_ = [(name, ctypes.c_ulonglong) for name in [
+            'ReadOperationCount', 'WriteOperationCount',
+            'OtherOperationCount', 'ReadTransferCount',
+            'WriteTransferCount', 'OtherTransferCount']]
+
+    ctypes.windll.kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+
+
+def cpu_time_func():
+    """User + system CPU time (seconds) of this process"""
+    cpu_times = os.times()
+    return cpu_times[0] + cpu_times[1]
+
+
+def peak_rss_func():
+    """Peak resident memory (bytes) of this process, None if unknown"""
+    try:
+        if os.name == 'nt':
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.psapi.GetProcessMemoryInfo(
+                ctypes.windll.kernel32.GetCurrentProcess(),
+                ctypes.byref(counters), counters.cb)
+            return int(counters.PeakWorkingSetSize)
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, OS X reports bytes
+        return int(peak_rss if sys.platform == 'darwin' else peak_rss * 1024)
+    except Exception:
+        return None
+
+
+def io_bytes_func():
+    """Bytes read and written by this process, (None, None) if unknown"""
+    try:
+        if os.name == 'nt':
+            counters = IO_COUNTERS()
+            ctypes.windll.kernel32.GetProcessIoCounters(
+                ctypes.windll.kernel32.GetCurrentProcess(),
+                ctypes.byref(counters))
+            return (int(counters.ReadTransferCount),
+                    int(counters.WriteTransferCount))
+        with open('/proc/self/io', 'r') as io_f:
+            io_dict = dict(
+                line.split(':') for line in io_f.read().splitlines())
+        return int(io_dict['rchar']), int(io_dict['wchar'])
+    except Exception:
+        return None, None
+
+
+class RunReport():
+    """Timing and memory records of the instrumented stages/operations
+
+    Records are kept in start order with their nesting depth.  When a
+    stage finishes, the records are written to a JSON report in the
+    log folder of the last HRUParameters and logged as a summary table.
+    """
+    def __init__(self):
+        self.record_list = []
+        self.stack = []
+        self.report_ws = None
+
+    def add_rows(self, rows):
+        """Add to the rows processed by the innermost open operation"""
+        if self.stack:
+            self.stack[-1]['rows'] += int(rows)
+
+    def summary_table(self):
+        """Human readable table of the records"""
+        header_fmt = '{0:<40s} {1:>9s} {2:>9s} {3:>9s} {4:>10s} {5:>9s} {6:>10s}'
+        line_fmt = '{0:<40s} {1:>9.2f} {2:>9.2f} {3:>9s} {4:>10d} {5:>9s} {6:>10s}'
+        header = header_fmt.format(
+            'Operation', 'Wall (s)', 'CPU (s)', 'Peak (MB)', 'Rows',
+            'Read (MB)', 'Write (MB)')
+        line_list = [header, '-' * len(header)]
+
+        def mb_str(value):
+            return '-' if value is None else '{0:.1f}'.format(value / 2.0 ** 20)
+        for record in self.record_list:
+            name = '  ' * record['depth'] + record['name']
+            if record['status'] != 'OK':
+                name += ' ({0})'.format(record['status'])
+            line_list.append(line_fmt.format(
+                name[:40], record['wall_time'], record['cpu_time'],
+                mb_str(record['peak_rss']), record['rows'],
+                mb_str(record['read_bytes']), mb_str(record['write_bytes'])))
+        return '\n'.join(line_list)
+
+    def write(self, stage_name):
+        """Write the JSON report and log the summary table"""
+        logging.info('\nRun Report\n' + self.summary_table())
+        if self.report_ws is None or not os.path.isdir(self.report_ws):
+            return
+        report_path = os.path.join(
+            self.report_ws, '{0}_report.json'.format(stage_name))
+        logging.debug('  {0}'.format(report_path))
+        with open(report_path, 'w') as report_f:
+            json.dump(
+                {'stage': stage_name, 'records': self.record_list},
+                report_f, indent=1, sort_keys=True)
+
+
+# Records for the current run (see instrument)
+run_report = RunReport()
+
+
+class instrument():
+    """Record the run time, memory and I/O of a stage or operation
+
+    Use as a context manager or a function decorator.  Wall time, CPU
+    time, bytes read/written and rows (see RunReport.add_rows) are
+    for the operation, peak RSS is the process peak when it finished.
+    A stage (stage_flag=True) starts a new report that is written when
+    the stage finishes.
+
+    Example:
+        @instrument('zonal_stats_func')
+        def zonal_stats_func(...):
+
+        with instrument('Read HRU values'):
+            ...
+    """
+    def __init__(self, name, stage_flag=False):
+        self.name = name
+        self.stage_flag = stage_flag
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrument(self.name, self.stage_flag):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        if self.stage_flag and not run_report.stack:
+            run_report.record_list = []
+        self.record = {
+            'name': self.name, 'depth': len(run_report.stack),
+            'start': time.strftime('%Y-%m-%d %H:%M:%S'), 'rows': 0}
+        run_report.record_list.append(self.record)
+        run_report.stack.append(self.record)
+        self.wall_start = time.time()
+        self.cpu_start = cpu_time_func()
+        self.read_start, self.write_start = io_bytes_func()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        read_bytes, write_bytes = io_bytes_func()
+        self.record.update({
+            'wall_time': time.time() - self.wall_start,
+            'cpu_time': cpu_time_func() - self.cpu_start,
+            'peak_rss': peak_rss_func(),
+            'read_bytes': (
+                None if read_bytes is None else read_bytes - self.read_start),
+            'write_bytes': (
+                None if write_bytes is None else
+                write_bytes - self.write_start),
+            'status': 'OK' if exc_type is None else 'ERROR'})
+        run_report.stack.pop()
+        if self.stage_flag and not run_report.stack:
+            run_report.write(self.name)
+        return False
+
 
 class HRUParameters():
     """"""
@@ -89,6 +272,7 @@ class HRUParameters():
         self.log_ws = os.path.join(self.param_ws, 'logs')
         if not os.path.isdir(self.log_ws):
             os.mkdir(self.log_ws)
+        run_report.report_ws = self.log_ws
 
         # Scratch workspace
         try:
@@ -251,8 +435,28 @@ class HRUParameters():
         self.obsin_segment    = fields_cfg.get('FIELDS', 'obsin_segment')
         self.tosegment        = fields_cfg.get('FIELDS', 'tosegment')
         self.x_coef           = fields_cfg.get('FIELDS', 'x_coef')
+        self.seg_order_field  = fields_cfg.get('FIELDS', 'seg_order_field')
+        self.strahler_field   = fields_cfg.get('FIELDS', 'strahler_field')
+        self.up_area_field    = fields_cfg.get('FIELDS', 'up_area_field')
         self.stream_path      = inputs_cfg.get('INPUTS', 'streams_path')
         self.flow_acc_raster  = inputs_cfg.get('INPUTS', 'flow_acc_raster')
+        # HRU cascades (hru_up_id, hru_down_id, ...) from cascade_parameters
+        self.cascade_path = os.path.join(self.param_ws, 'hru_cascades.csv')
+        self.cascade_min_pct = get_param('cascade_min_pct', 0.01, inputs_cfg)
+
+        # Only recalculate HRUs that changed since the last run (HRUChanges)
+        self.incremental_flag = get_param(
+            'incremental_flag', False, inputs_cfg)
+
+        # Shared cache of projected source raster tiles (see TileCache)
+        # batch_run.py can set one cache folder for all of its projects
+        if os.environ.get('PRMS_TILE_CACHE'):
+            self.tile_cache_ws = os.environ['PRMS_TILE_CACHE']
+        else:
+            self.tile_cache_ws = get_param(
+                'tile_cache_folder', None, inputs_cfg)
+        self.tile_cache_quota = get_param(
+            'tile_cache_quota_gb', 20.0, inputs_cfg)
 
 
         # if set_ppt_zones_flag:
@@ -412,6 +616,10 @@ class HRUParameters():
         # Landfire Vegetation Cover
         self.veg_cover_orig_path = self.inputs_cfg.get('INPUTS', 'veg_cover_orig_path')
         self.veg_cover_cs = self.inputs_cfg.getint('INPUTS', 'veg_cover_cellsize')
+
+        # Derived vegetation rasters are only saved if requested
+        self.save_veg_rasters_flag = get_param(
+            'save_veg_rasters_flag', False, self.inputs_cfg)
         
         # Check that either the original vegetation raster exist
         if not arcpy.Exists(self.veg_cover_orig_path):
@@ -612,6 +820,22 @@ class HRUParameters():
                      self.flow_acc_raster))
             sys.exit()
 
+        # Segments (other than the outlets) where subbasins end
+        self.subbasin_segment_list = map(int, get_param(
+            'subbasin_segment_list', [], self.inputs_cfg))
+
+        # Muskingum routing coefficients
+        self.mannings_n = get_param('mannings_n', 0.04, self.inputs_cfg)
+        self.stream_depth = get_param('stream_depth', 1.0, self.inputs_cfg)
+        self.min_stream_slope = get_param(
+            'min_stream_slope', 0.0001, self.inputs_cfg)
+
+
+# D8 flow direction codes and the row/column offset to the downstream cell
+d8_offset_dict = {
+    1: (0, 1), 2: (1, 1), 4: (1, 0), 8: (1, -1),
+    16: (0, -1), 32: (-1, -1), 64: (-1, 0), 128: (-1, 1)}
+
 
 def next_row_col(flow_dir, cell):
     """"""
@@ -628,6 +852,22 @@ def next_row_col(flow_dir, cell):
     return i_next, j_next
 
 
+def next_row_col_array(flow_dir_array, col_array, row_array):
+    """Vectorized next_row_col for arrays of cells
+
+    Invalid flow directions return the cell itself (like next_row_col)
+    """
+    flow_dir_array = np.asarray(flow_dir_array, dtype=np.int64)
+    flow_dir_array = np.where(
+        (flow_dir_array > 0) & (flow_dir_array <= 128), flow_dir_array, 0)
+    d8_row = np.zeros(129, dtype=np.int64)
+    d8_col = np.zeros(129, dtype=np.int64)
+    for d8_code, (row_offset, col_offset) in d8_offset_dict.items():
+        d8_row[d8_code], d8_col[d8_code] = row_offset, col_offset
+    return (np.asarray(col_array) + d8_col[flow_dir_array],
+            np.asarray(row_array) + d8_row[flow_dir_array])
+
+
 def field_stat_func(input_path, value_field, stat='MAXIMUM'):
     """"""
     value_list = []
@@ -642,14 +882,38 @@ def field_stat_func(input_path, value_field, stat='MAXIMUM'):
         return float(sum(value_list)) / count(value_list)
 
 
-def add_field_func(hru_param_path, field_name, field_type='DOUBLE'):
-    """"""
+# AddField field types and the matching Field.type values
+field_type_dict = {
+    'DOUBLE': 'Double', 'FLOAT': 'Single', 'LONG': 'Integer',
+    'SHORT': 'SmallInteger', 'TEXT': 'String', 'DATE': 'Date'}
+
+
+def add_field_func(hru_param_path, field_name, field_type='DOUBLE',
+                   replace_flag=False):
+    """Add a field if it doesn't exist
+
+    If replace_flag is True, an existing field of a different type is
+    deleted and added again (its values are lost).
+
+    Returns:
+        bool: True if an existing field was replaced
+    """
+    replace_result = False
+    field_list = arcpy.ListFields(hru_param_path, field_name)
+    if (replace_flag and field_list and
+            field_list[0].type != field_type_dict[field_type.upper()]):
+        logging.warning(
+            ('  Field {0} is {1}, replacing it with a {2} field').format(
+                field_name, field_list[0].type, field_type.upper()))
+        arcpy.DeleteField_management(hru_param_path, field_name)
+        replace_result = True
     while not arcpy.ListFields(hru_param_path, field_name):
         logging.info('  Field: {0}'.format(field_name))
 #         try:
         arcpy.AddField_management(hru_param_path, field_name, field_type)
 #         except:
 #             pass
+    return replace_result
 #         sleep(0.5)
 
 
@@ -709,14 +973,18 @@ def valid_raster_func(raster_path, raster_name, hru_param, cs=10):
         return True
 
 
+@instrument('zonal_stats_func')
 def zonal_stats_func(zs_dict, polygon_path, hru_param,
-                     nodata_value=-999, default_value=0):
+                     nodata_value=-999, default_value=0, fid_list=None):
     """
     Calculate zonal statistics for each HRU
     
     - Get subset of HRU polygons
     - Zonal stats by table based on polygons
     - Add the zonal stats back to the HRU polygons
+
+    If fid_list is set (i.e. from HRUChanges), only those HRUs are
+    calculated and written.
     """
     
     for zs_field, (raster_path, zs_stat) in sorted(zs_dict.items()):
@@ -755,17 +1023,17 @@ def zonal_stats_func(zs_dict, polygon_path, hru_param,
 
     # Check for duplicate ORIG_FID values
     hru_param_count = int(arcpy.GetCount_management(polygon_path).getOutput(0))
-    if field_duplicate_check(polygon_path, hru_param.fid_field, hru_param_count):
+    duplicate_list = field_duplicate_check(
+        polygon_path, hru_param.fid_field, hru_param_count)
+    if duplicate_list:
         logging.error(
-            ('\nERROR: There are duplicate {0} values\n').format(hru_param.fid_field))
+            ('\nERROR: There are duplicate {0} values' +
+             '\nERROR:   {1}{2}\n').format(
+                 hru_param.fid_field,
+                 ', '.join(map(str, duplicate_list[:10])),
+                 ', ...' if len(duplicate_list) > 10 else ''))
         sys.exit()
-        
-    # DEADBEEF - remove once field_duplicate_check() is full developed
-    # fid_list = [r[0] for r in arcpy.da.SearchCursor(point_path, [hru_param.fid_field])]
-    # if len(fid_list) != len(set(fid_list)):
-    #    logging.error(
-    #        ('\nERROR: There are duplicate {0} values\n').format(hru_param.fid_field))
-    #    sys.exit()
+    del duplicate_list
 
     # Create memory objects
     polygon_subset_path = os.path.join('in_memory', 'polygon_subset')
@@ -781,13 +1049,23 @@ def zonal_stats_func(zs_dict, polygon_path, hru_param,
 
     # Only ~65536 objects can be processed by zonal stats
     block_size = 65000
-    for i, x in enumerate(xrange(0, hru_param_count, block_size)):
-        logging.info('  FIDS: {0}-{1}'.format(x, x + block_size))
-        
+    if fid_list is None:
+        block_list = [
+            (x, x + block_size, '"{0}" >= {1} AND "{0}" < {2}'.format(
+                hru_param.fid_field, x, x + block_size))
+            for x in xrange(0, hru_param_count, block_size)]
+    else:
+        fid_list = sorted(set(fid_list))
+        logging.info('  Changed HRUs: {0}'.format(len(fid_list)))
+        block_list = [
+            (fid_list[x], fid_list[x:x + block_size][-1] + 1, fid_subset_str(
+                hru_param.fid_field, fid_list[x:x + block_size]))
+            for x in xrange(0, len(fid_list), block_size)]
+    for i, (fid_min, fid_max, subset_str) in enumerate(block_list):
+        logging.info('  FIDS: {0}-{1}'.format(fid_min, fid_max))
+
         # Select a subset of the cell centroids
         logging.debug('    Selecting FID subset')
-        subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
-            hru_param.fid_field, x, x + block_size)
         arcpy.Select_analysis(
             polygon_path, polygon_subset_path, subset_str)
         
@@ -833,8 +1111,10 @@ def zonal_stats_func(zs_dict, polygon_path, hru_param,
         logging.info('    Writing values to polygons')
         zs_fields = sorted(zs_dict.keys())
         fields = zs_fields + [hru_param.fid_field]
-        with arcpy.da.UpdateCursor(polygon_path, fields, subset_str) as u_cursor:
+        with instrument('zonal_stats_func update cursor'), \
+                arcpy.da.UpdateCursor(polygon_path, fields, subset_str) as u_cursor:
             for row in u_cursor:
+                run_report.add_rows(1)
                 # Create an empty dictionary if FID does not exist
                 # Missing FIDs did not have zonal stats calculated
                 row_dict = data_dict.get(int(row[-1]), None)
@@ -864,168 +1144,1028 @@ def zonal_stats_func(zs_dict, polygon_path, hru_param,
     arcpy.ClearEnvironment('cellSize')
 
 
-def field_duplicate_check(table_path, field_name, n=None):
-    """Check if there are duplicate values in a shapefile field
+def horn_slope_aspect(dem_array, cs):
+    """Horn slope and aspect of the interior cells of a DEM array
 
-    For now assume table_path is actually a shapefile that can be read
-        with arcpy.da.SearchCursor()
+    dem_array has a one cell halo on every side, so the outputs have
+    two fewer rows and columns.  Nodata (NaN) neighbors are replaced
+    with the center cell value, which is how the ArcGIS Slope and Aspect
+    tools handle nodata and raster edges (pad the halo with NaN).
 
     Args:
-        table_path (str): File path of the table to search
-        field_name (str): Field/column name to search
+        dem_array (:class:`numpy.array`): elevations with a 1 cell halo
+        cs (float): cellsize (in the same units as the elevations)
 
     Returns:
-        bool: True if there are duplicate values in the field, False otherwise
+        slope (degrees) and aspect (degrees clockwise from north,
+        -1 for flat cells) arrays, NaN where the center cell is nodata
     """
+    center = dem_array[1:-1, 1:-1]
+    rows, cols = dem_array.shape
+
+    def neighbor(dr, dc):
+        """Neighbor values, nodata is replaced with the center value"""
+        n = dem_array[1 + dr:rows - 1 + dr, 1 + dc:cols - 1 + dc]
+        return np.where(np.isnan(n), center, n)
+
+    # a b c
+    # d e f
+    # g h i
+    a, b, c = neighbor(-1, -1), neighbor(-1, 0), neighbor(-1, 1)
+    d, f = neighbor(0, -1), neighbor(0, 1)
+    g, h, i = neighbor(1, -1), neighbor(1, 0), neighbor(1, 1)
+    dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8.0 * cs)
+    dz_dy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8.0 * cs)
+    del a, b, c, d, f, g, h, i
+
+    slope = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+    aspect = np.degrees(np.arctan2(dz_dy, -dz_dx))
+    aspect = np.where(
+        aspect < 0, 90.0 - aspect,
+        np.where(aspect > 90, 450.0 - aspect, 90.0 - aspect))
+    aspect[(dz_dx == 0) & (dz_dy == 0)] = -1
+    nodata_mask = np.isnan(center)
+    slope[nodata_mask] = np.NaN
+    aspect[nodata_mask] = np.NaN
+    return slope, aspect
+
+
+def raster_halo_tiles(input_obj, tile_rows=None, halo=1):
+    """Yield row tiles of a raster padded with a halo
+
+    The halo rows come from the neighboring tiles so window operations
+    are exact across tile boundaries.  Cells outside the raster (and
+    nodata cells) are NaN.
 
-    # Eventually check that field is in table
-    field_obj = arcpy.ListFields(table_path, field_name)[0]
-
-    if n is None:
-        n = int(arcpy.GetCount_management(table_path).getOutput(0))
-    n32_max = 3000000
-    logging.debug('\n  Testing for duplicate values')
-    logging.debug('    field:    {}'.format(field_name))
-    logging.debug('    features: {}'.format(n))
-    logging.debug('    n32_max:  {}'.format(n32_max))
-    logging.debug('    2**32:    {}'.format(2**32))
-    logging.debug('    maxsize:  {}'.format(sys.maxsize))
-
-    if sys.maxsize > 2**32 or n < n32_max:
-        logging.debug('    Reading values')
-        # If 64-bit or row count is low, read all values into memory
-        fid_list = [r[0] for r in arcpy.da.SearchCursor(table_path, [field_name])]
-        if len(fid_list) != len(set(fid_list)):
-            return True
+    Yields:
+        first row, last row (exclusive), and the padded float array
+    """
+    input_extent = input_obj.extent
+    input_cs = input_obj.meanCellHeight
+    input_rows, input_cols = input_obj.height, input_obj.width
+    input_nodata = input_obj.noDataValue
+    # Process roughly 1 million cells per tile
+    if tile_rows is None:
+        tile_rows = max(int(2 ** 20 / input_cols), 1)
+    for row_i in xrange(0, input_rows, tile_rows):
+        row_j = min(row_i + tile_rows, input_rows)
+        read_i, read_j = max(row_i - halo, 0), min(row_j + halo, input_rows)
+        read_array = arcpy.RasterToNumPyArray(
+            input_obj,
+            arcpy.Point(input_extent.XMin,
+                        input_extent.YMax - read_j * input_cs),
+            input_cols, read_j - read_i).astype(np.float64)
+        if input_nodata is not None:
+            read_array[read_array == input_nodata] = np.NaN
+        tile_array = np.empty(
+            (row_j - row_i + 2 * halo, input_cols + 2 * halo),
+            dtype=np.float64)
+        tile_array.fill(np.NaN)
+        tile_array[read_i - row_i + halo:read_j - row_i + halo,
+                   halo:input_cols + halo] = read_array
+        del read_array
+        yield row_i, row_j, tile_array
+
+
+def raster_hash_func(raster_path):
+    """MD5 hash of a raster's grid and values
+
+    Used to check if cached intermediates (i.e. flow accumulation) were
+    calculated from the same raster.  Values are read in tiles.
+    """
+    raster_obj = Raster(raster_path)
+    raster_md5 = hashlib.md5()
+    raster_md5.update('{0} {1} {2} {3}'.format(
+        extent_string(raster_obj.extent), raster_obj.meanCellWidth,
+        raster_obj.width, raster_obj.height))
+    for row_i, row_j, tile_array in raster_halo_tiles(raster_obj, halo=0):
+        raster_md5.update(np.ascontiguousarray(tile_array).tostring())
+    del raster_obj
+    return raster_md5.hexdigest()
+
+
+def input_hash_func(input_list):
+    """MD5 hash of a list of stage inputs
+
+    Rasters are hashed with raster_hash_func, other files by their
+    contents, and anything else (i.e. field names and statistics)
+    by its string representation.
+    """
+    input_md5 = hashlib.md5()
+    for item in input_list:
+        if (isinstance(item, basestring) and arcpy.Exists(item) and
+                arcpy.Describe(item).dataType == 'RasterDataset'):
+            input_md5.update(raster_hash_func(item))
+        elif isinstance(item, basestring) and os.path.isfile(item):
+            with open(item, 'rb') as input_f:
+                for block in iter(lambda: input_f.read(2 ** 20), ''):
+                    input_md5.update(block)
         else:
-            logging.debug('    No duplicates')
-            return False
-    elif field_obj.type in ['Integer', 'SmallInteger']:
-        # This approach will only work with integers
-        block_size = 500000
-        fid_ranges = []
-        for i, x in enumerate(xrange(0, n, block_size)):
-            logging.debug('    FIDS: {0}-{1}'.format(x, x + block_size))
-            subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
-                arcpy.Describe(table_path).OIDFieldName, x, x + block_size)
+            input_md5.update(repr(item))
+    return input_md5.hexdigest()
 
-            # Don't sort here since it gets sorted in group_ranges()
-            fid_list = [r[0] for r in arcpy.da.SearchCursor(
-                table_path, [field_name], subset_str)]
 
-            # Return True if there are duplicates in a subset
-            if len(fid_list) != len(set(fid_list)):
-                return True
+def hru_geometry_hash_func(polygon_path, fid_field):
+    """MD5 hash of the vertices of each HRU polygon
 
-            # Group consecutive values into ranges
-            fid_new_ranges = list(group_ranges(fid_list))
+    Returns:
+        dict: HRU FID and the first 16 hex digits of its hash
+    """
+    vertex_array = arcpy.da.FeatureClassToNumPyArray(
+        polygon_path, [fid_field, 'SHAPE@X', 'SHAPE@Y'],
+        explode_to_points=True)
+    vertex_order = np.argsort(vertex_array[fid_field], kind='mergesort')
+    vertex_fid = vertex_array[fid_field][vertex_order].astype(np.int64)
+    vertex_xy = np.ascontiguousarray(np.column_stack((
+        vertex_array['SHAPE@X'][vertex_order],
+        vertex_array['SHAPE@Y'][vertex_order])).astype(np.float64))
+    del vertex_array, vertex_order
+    hru_start = np.where(np.diff(np.concatenate(([-1], vertex_fid))))[0]
+    hru_stop = np.append(hru_start[1:], vertex_fid.size)
+    return dict(
+        (fid, hashlib.md5(vertex_xy[start:stop].tostring()).hexdigest()[:16])
+        for fid, start, stop in zip(
+            vertex_fid[hru_start].tolist(), hru_start.tolist(),
+            hru_stop.tolist()))
+
+
+class HRUChanges():
+    """HRUs that changed since a stage last ran
+
+    A hash of each HRU is saved to a sidecar JSON file in the parameter
+    folder when the stage finishes.  On the next run, fid_list is the
+    HRUs with a new or different hash.  fid_list is None (all HRUs) if
+    incremental_flag is False, if there is no sidecar file, or if any
+    of the stage inputs changed.
+
+    By default the hash is of the HRU polygon vertices, keyed by FID.
+    Any other per HRU hashes can be passed in with hash_dict.
+
+    Stages that process rasters in tiles should only read the window
+    returned by raster_window so unchanged areas are skipped.
+    """
+    def __init__(self, hru_param, stage_name, input_list=(),
+                 hash_dict=None):
+        self.incremental_flag = hru_param.incremental_flag
+        self.polygon_path = hru_param.polygon_path
+        self.fid_field = hru_param.fid_field
+        self.hash_path = os.path.join(
+            hru_param.param_ws, '{0}_hru_hash.json'.format(stage_name))
+        self.fid_list = None
+        if not self.incremental_flag:
+            return
+        logging.info('\nChecking for changed HRUs')
+        self.input_hash = input_hash_func(input_list)
+        if hash_dict is None:
+            hash_dict = hru_geometry_hash_func(
+                hru_param.polygon_path, hru_param.fid_field)
+        self.hash_dict = hash_dict
+        if not os.path.isfile(self.hash_path):
+            logging.info('  No saved HRU hashes, processing all HRUs')
+            return
+        with open(self.hash_path, 'r') as hash_f:
+            saved_dict = json.load(hash_f)
+        if saved_dict['inputs'] != self.input_hash:
+            logging.info('  Inputs changed, processing all HRUs')
+            return
+        saved_hash_dict = dict(zip(saved_dict['fid'], saved_dict['hash']))
+        self.fid_list = sorted(
+            fid for fid, fid_hash in self.hash_dict.items()
+            if saved_hash_dict.get(fid, None) != fid_hash)
+        logging.info('  Changed HRUs: {0}'.format(len(self.fid_list)))
+
+    @staticmethod
+    def clear(hru_param, stage_name):
+        """Remove the saved hashes so the next run processes all HRUs"""
+        hash_path = os.path.join(
+            hru_param.param_ws, '{0}_hru_hash.json'.format(stage_name))
+        if os.path.isfile(hash_path):
+            os.remove(hash_path)
+
+    def save(self):
+        """Save the hashes once the stage has finished"""
+        if not self.incremental_flag:
+            return
+        fid_list = sorted(self.hash_dict.keys())
+        with open(self.hash_path, 'w') as hash_f:
+            json.dump({
+                'inputs': self.input_hash, 'fid': fid_list,
+                'hash': [self.hash_dict[fid] for fid in fid_list]}, hash_f)
+
+    def raster_window(self, raster_xmin, raster_ymax, raster_cs,
+                      raster_rows, raster_cols):
+        """Raster rows and columns that cover the changed HRUs
+
+        Args:
+            raster_xmin (float): raster left edge
+            raster_ymax (float): raster top edge
+            raster_cs (float): raster cellsize
+            raster_rows (int): number of raster rows
+            raster_cols (int): number of raster columns
+
+        Returns:
+            tuple: first/last+1 row and first/last+1 column
+                (the full raster if all HRUs are processed)
+        """
+        if self.fid_list is None:
+            return 0, raster_rows, 0, raster_cols
+        elif not self.fid_list:
+            return 0, 0, 0, 0
+        vertex_array = arcpy.da.FeatureClassToNumPyArray(
+            self.polygon_path, ['SHAPE@X', 'SHAPE@Y'],
+            fid_subset_str(self.fid_field, self.fid_list),
+            explode_to_points=True)
+        x_array = vertex_array['SHAPE@X'].astype(np.float64)
+        y_array = vertex_array['SHAPE@Y'].astype(np.float64)
+        del vertex_array
+        row_i = int(math.floor((raster_ymax - y_array.max()) / raster_cs))
+        row_j = int(math.ceil((raster_ymax - y_array.min()) / raster_cs))
+        col_i = int(math.floor((x_array.min() - raster_xmin) / raster_cs))
+        col_j = int(math.ceil((x_array.max() - raster_xmin) / raster_cs))
+        row_i, row_j = max(row_i, 0), min(row_j, raster_rows)
+        col_i, col_j = max(col_i, 0), min(col_j, raster_cols)
+        logging.debug('  Changed HRU window: rows {0}-{1}, cols {2}-{3}'.format(
+            row_i, row_j, col_i, col_j))
+        return row_i, max(row_j, row_i), col_i, max(col_j, col_i)
+
+
+def zs_input_list(zs_dict):
+    """Zonal statistics fields, stats, and rasters for HRUChanges"""
+    return [repr(sorted(zs_dict.items()))] + sorted(set(
+        raster_path for raster_path, zs_stat in zs_dict.values()))
+
+
+def fid_subset_str(fid_field, fid_list):
+    """Where clause for a list of FIDs, grouped into consecutive ranges"""
+    fid_array = np.unique(np.asarray(fid_list, dtype=np.int64))
+    if not fid_array.size:
+        return '"{0}" < 0'.format(fid_field)
+    breaks = np.where(np.diff(fid_array) != 1)[0] + 1
+    range_min = fid_array[np.concatenate(([0], breaks))]
+    range_max = fid_array[np.concatenate((breaks - 1, [-1]))]
+    return ' OR '.join(
+        '("{0}" >= {1} AND "{0}" <= {2})'.format(fid_field, x, y)
+        for x, y in zip(range_min.tolist(), range_max.tolist()))
+
+
+def topo_index_func(flow_acc_array, slope_array, cs, min_slope=0.01):
+    """Topographic wetness index, ln(a / tan(slope))
+
+    The specific catchment area (a) is the upslope area per unit contour
+    width, (flow accumulation + 1) * cellsize.  Slopes are clamped to
+    min_slope so flat cells (which are set to 0) have a finite index.
 
-            # Check if any of the new ranges overlap each other
-            # Skip for now since subset duplicates were checked above
-            # if ranges_overlap(fid_new_ranges):
-            #    return True
+    Args:
+        flow_acc_array (:class:`numpy.array`): flow accumulation (cells)
+        slope_array (:class:`numpy.array`): slope (degrees)
+        cs (float): cellsize
+        min_slope (float): minimum slope (degrees)
 
-            # Check if any of the new ranges overlap the existing ranges
-            if ranges_overlap(fid_ranges + fid_new_ranges):
-                return True
+    Returns:
+        :class:`numpy.array` (NaN where either input is nodata)
+    """
+    sca_array = (flow_acc_array + 1.0) * cs
+    tan_array = np.tan(np.radians(np.maximum(slope_array, min_slope)))
+    return np.log(sca_array / tan_array)
 
-            # Merge subset ranges into main range list
-            fid_ranges = list(merge_ranges(fid_ranges + fid_new_ranges))
-            del fid_new_ranges
 
-        logging.debug('    FID ranges: {}'.format(fid_ranges))
-        logging.debug('    No duplicates')
-        return False
-    else:
-        # For now, assume there are not duplicates if the values can't
-        #   all be read in
-        logging.debug(
-            '    Assuming no duplicates since field type is not integer, \n' +
-            '      table contains more than {} rows, and 32-bit Python is \n' +
-            '      limited to 2 GB of memory.')
-        return False
-    # DEADBEEF - I'm not sure this will actually work on a really large table
-    # else:
-    #    duplicate_flag = False
-    #    fid_prev = None
-    #    cursor = arcpy.SearchCursor(
-    #        table_path, fields=field_name, sort_fields=field_name+' A')
-    #    for row in cursor:
-    #        fid = row.getValue(field_name)
-    #        if fid == fid_prev and fid_prev is not None:
-    #            duplicate_flag = True
-    #            break
-    #        else:
-    #            fid_prev = fid
-    #    del cursor, row
-    #    logging.debug('    No duplicates')
-    #    return duplicate_flag
-
-
-def group_ranges(input_list):
-    """Group
-
-    Copied from:
-    http://stackoverflow.com/questions/2154249/identify-groups-of-continuous-numbers-in-a-list
+def zone_raster_func(polygon_path, zone_field, zone_path, snap_raster, cs):
+    """Convert the HRU polygons to a zone raster on another raster's grid
+
+    Cells are assigned by cell center, which is how
+    ZonalStatisticsAsTable assigns cells to polygon zones.
+    """
+    env.extent = snap_raster
+    env.snapRaster = snap_raster
+    env.outputCoordinateSystem = polygon_path
+    arcpy.PolygonToRaster_conversion(
+        polygon_path, zone_field, zone_path, 'CELL_CENTER', '', cs)
+    arcpy.ClearEnvironment('extent')
+    arcpy.ClearEnvironment('snapRaster')
+    arcpy.ClearEnvironment('outputCoordinateSystem')
+
+
+def raster_tile_func(input_obj, tile_xmin, tile_ymax, tile_cs,
+                     tile_rows, tile_cols):
+    """Read a tile of a raster on a target grid (nearest cell)
+
+    Only the window of the input raster that covers the tile is read.
+    If the input raster is on the target grid, this is a direct read.
 
     Args:
-        input_list (list): list of numbers to group into ranges
+        input_obj (:class:`arcpy.Raster`): input raster
+        tile_xmin (float): tile left edge
+        tile_ymax (float): tile top edge
+        tile_cs (float): target cellsize
+        tile_rows (int): number of tile rows
+        tile_cols (int): number of tile columns
 
-    Yields
-         tuple: pairs (min, max)
+    Returns:
+        array, nodata (float arrays use NaN for nodata)
     """
-    for k, g in itertools.groupby(enumerate(sorted(input_list)), lambda (i, x):i-x):
-        group = map(itemgetter(1), g)
-        yield group[0], group[-1]
+    input_extent = input_obj.extent
+    input_cs_x = input_obj.meanCellWidth
+    input_cs_y = input_obj.meanCellHeight
+    input_nodata = input_obj.noDataValue
 
+    # Input row/column of each tile cell center
+    tile_x = tile_xmin + (np.arange(tile_cols) + 0.5) * tile_cs
+    tile_y = tile_ymax - (np.arange(tile_rows) + 0.5) * tile_cs
+    input_col = np.floor(
+        (tile_x - input_extent.XMin) / input_cs_x).astype(np.int64)
+    input_row = np.floor(
+        (input_extent.YMax - tile_y) / input_cs_y).astype(np.int64)
+    col_mask = (input_col >= 0) & (input_col < input_obj.width)
+    row_mask = (input_row >= 0) & (input_row < input_obj.height)
+
+    # Tile is entirely outside the input raster
+    if not np.any(col_mask) or not np.any(row_mask):
+        output_array = np.empty((tile_rows, tile_cols), dtype=np.float64)
+        output_array.fill(np.NaN)
+        return output_array, np.NaN
+
+    col_min, col_max = input_col[col_mask].min(), input_col[col_mask].max()
+    row_min, row_max = input_row[row_mask].min(), input_row[row_mask].max()
+    window_array = arcpy.RasterToNumPyArray(
+        input_obj,
+        arcpy.Point(input_extent.XMin + col_min * input_cs_x,
+                    input_extent.YMax - (row_max + 1) * input_cs_y),
+        int(col_max - col_min + 1), int(row_max - row_min + 1))
 
-def merge_ranges(ranges):
-    """Merge overlapping and adjacent integer ranges
+    # Integer type raster can't have NaN values, will only set floats to NaN
+    if (window_array.dtype == np.float32 or
+        window_array.dtype == np.float64):
+        window_array = window_array.astype(np.float64)
+        if input_nodata is not None:
+            window_array[window_array == input_nodata] = np.NaN
+        output_nodata = np.NaN
+    elif input_nodata is None:
+        window_array = window_array.astype(np.int64)
+        output_nodata = remap_int_nodata
+    else:
+        output_nodata = int(input_nodata)
+
+    output_array = np.empty((tile_rows, tile_cols), dtype=window_array.dtype)
+    output_array.fill(output_nodata)
+    output_array[np.ix_(row_mask, col_mask)] = window_array[np.ix_(
+        input_row[row_mask] - row_min, input_col[col_mask] - col_min)]
+    return output_array, output_nodata
 
-    Yield the merged ranges in order
-    The argument must be an iterable of pairs (start, stop).
 
-    Copied from:
-    http://codereview.stackexchange.com/questions/21307/consolidate-list-of-ranges-that-overlap
+class ZonalAccumulator():
+    """Zonal statistics that are accumulated one tile at a time
 
-    >>> list(merge_ranges([(5,7), (3,5), (-1,3)]))
-    [(-1, 7)]
-    >>> list(merge_ranges([(5,6), (3,4), (1,2)]))
-    [(1, 2), (3, 4), (5, 6)]
-    >>> list(merge_ranges([]))
-    []
+    Only the running per zone statistics are kept (count, sum, minimum,
+    maximum, and for MAJORITY the zone/value counts), so zone and value
+    arrays can be streamed through in tiles instead of saving rasters
+    and calling ZonalStatisticsAsTable.  Zones are non-negative integers
+    (i.e. HRU FIDs).  MAJORITY ties are resolved to the lowest value.
+    """
+    zs_stat_list = ['MEAN', 'MINIMUM', 'MAXIMUM', 'MAJORITY', 'SUM']
+
+    def __init__(self, zs_stat):
+        self.zs_stat = zs_stat.upper()
+        if self.zs_stat not in self.zs_stat_list:
+            logging.error(
+                '\nERROR: Unsupported zonal statistic: {0}'.format(zs_stat))
+            sys.exit()
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.float64)
+        self.minimum = np.zeros(0, dtype=np.float64)
+        self.maximum = np.zeros(0, dtype=np.float64)
+        self.majority_list = []
+
+    def resize(self, n):
+        """Grow the per zone arrays to hold n zones"""
+        if n <= self.count.size:
+            return
+        pad = n - self.count.size
+        self.count = np.append(self.count, np.zeros(pad, dtype=np.int64))
+        self.total = np.append(self.total, np.zeros(pad))
+        self.minimum = np.append(self.minimum, np.zeros(pad) + np.inf)
+        self.maximum = np.append(self.maximum, np.zeros(pad) - np.inf)
+
+    def add(self, zone_array, value_array, value_nodata=np.NaN):
+        """Add a tile of zones and values (cells with nodata are skipped)"""
+        zone_array = np.asarray(zone_array).ravel()
+        value_array = np.asarray(value_array).ravel()
+        valid_mask = zone_array >= 0
+        if np.issubdtype(value_array.dtype, np.floating):
+            valid_mask &= np.isfinite(value_array)
+        if value_nodata is not None and not np.isnan(value_nodata):
+            valid_mask &= value_array != value_nodata
+        zones = zone_array[valid_mask].astype(np.int64)
+        values = value_array[valid_mask]
+        if not zones.size:
+            return
+        self.resize(int(zones.max()) + 1)
+        n = self.count.size
+        self.count += np.bincount(zones, minlength=n)
+        if self.zs_stat in ['MEAN', 'SUM']:
+            self.total += np.bincount(zones, weights=values, minlength=n)
+        elif self.zs_stat in ['MINIMUM', 'MAXIMUM']:
+            order = np.argsort(zones, kind='mergesort')
+            zones, values = zones[order], values[order]
+            starts = np.append(0, np.nonzero(np.diff(zones))[0] + 1)
+            unique_zones = zones[starts]
+            self.minimum[unique_zones] = np.minimum(
+                self.minimum[unique_zones],
+                np.minimum.reduceat(values, starts))
+            self.maximum[unique_zones] = np.maximum(
+                self.maximum[unique_zones],
+                np.maximum.reduceat(values, starts))
+        elif self.zs_stat == 'MAJORITY':
+            self.majority_list.append(self.pair_counts(
+                zones, values, np.ones(zones.size, dtype=np.int64)))
+
+    @staticmethod
+    def pair_counts(zones, values, counts):
+        """Sum counts for each unique zone/value pair"""
+        order = np.lexsort((values, zones))
+        zones, values, counts = zones[order], values[order], counts[order]
+        starts = np.append(0, np.nonzero(
+            (np.diff(zones) != 0) | (np.diff(values) != 0))[0] + 1)
+        return (zones[starts], values[starts],
+                np.add.reduceat(counts, starts))
+
+    def result(self):
+        """Return the zones that had valid cells and their statistic"""
+        zones = np.nonzero(self.count > 0)[0]
+        if self.zs_stat == 'MEAN':
+            return zones, self.total[zones] / self.count[zones]
+        elif self.zs_stat == 'SUM':
+            return zones, self.total[zones]
+        elif self.zs_stat == 'MINIMUM':
+            return zones, self.minimum[zones]
+        elif self.zs_stat == 'MAXIMUM':
+            return zones, self.maximum[zones]
+        # MAJORITY - Combine the tile counts, then take the most common
+        #   value of each zone (lowest value for ties)
+        if not self.majority_list:
+            return zones, np.zeros(0)
+        pair_zones, pair_values, pair_counts = self.pair_counts(
+            *[np.concatenate(x) for x in zip(*self.majority_list)])
+        order = np.lexsort((pair_values, -pair_counts, pair_zones))
+        pair_zones, pair_values = pair_zones[order], pair_values[order]
+        first_mask = np.append(True, np.diff(pair_zones) != 0)
+        return pair_zones[first_mask], pair_values[first_mask].astype(np.float64)
+
+
+@instrument('zonal_stats_update_func')
+def zonal_stats_update_func(zs_result_dict, polygon_path, hru_param,
+                            nodata_value=-999, default_value=0,
+                            fid_list=None):
+    """Write accumulated zonal statistics to the HRU polygons
+
+    Missing values are set the same way as zonal_stats_func: nodata_value
+    if only some of the statistics were calculated for an HRU, and
+    default_value if none of them were.
+
+    Args:
+        zs_result_dict (dict): field names and (zones, values) results
+            from :meth:`ZonalAccumulator.result`
+        polygon_path (str): HRU polygon path
+        hru_param (:class:`support_functions.HRUParameters`)
+        fid_list (list): if set, only write these HRU FIDs
+    """
+    data_dict = defaultdict(dict)
+    for zs_field, (zones, values) in zs_result_dict.items():
+        for zone, value in zip(zones.tolist(), values.tolist()):
+            data_dict[zone][zs_field] = value
+
+    logging.info('  Writing values to polygons')
+    zs_fields = sorted(zs_result_dict.keys())
+    fields = zs_fields + [hru_param.fid_field]
+    if fid_list is None:
+        subset_str = ''
+    else:
+        subset_str = fid_subset_str(hru_param.fid_field, fid_list)
+    with instrument('zonal_stats_update_func update cursor'), \
+            arcpy.da.UpdateCursor(polygon_path, fields, subset_str) as u_cursor:
+        for row in u_cursor:
+            run_report.add_rows(1)
+            row_dict = data_dict.get(int(row[-1]), None)
+            for i, zs_field in enumerate(zs_fields):
+                if row_dict:
+                    row[i] = row_dict.get(zs_field, nodata_value)
+                else:
+                    row[i] = default_value
+            u_cursor.updateRow(row)
+    del data_dict
+
+
+def cascade_pair_func(flow_dir_array, hru_array, seg_array=None):
+    """Count the cells that cascade out of each HRU
+
+    Inputs are float arrays with a 1 cell halo (see raster_halo_tiles)
+    where nodata is NaN.  Only the interior cells are routed, the halo is
+    only used to look up the downstream cell.  Stream cells cascade to
+    their own segment.  Other cells cascade if their D8 downstream cell
+    is in a different HRU, to the segment if the downstream cell is a
+    stream cell, otherwise to that HRU.  Flow within an HRU and flow off
+    of the active grid are not counted.
 
     Args:
-        ranges (list): Iterable of pairs (min, max)
+        flow_dir_array (:class:`numpy.array`): D8 flow direction codes
+        hru_array (:class:`numpy.array`): HRU IDs (> 0)
+        seg_array (:class:`numpy.array`): stream segment IDs (> 0)
 
-    Yields:
-        tuple: pairs (min, max)
+    Returns:
+        up HRU, downstream key, and cell count arrays
+        (the key is the down HRU ID, or -segment ID for stream cascades)
+    """
+    def int_grid(input_array):
+        input_array = np.asarray(input_array)
+        if np.issubdtype(input_array.dtype, np.floating):
+            input_array = np.where(np.isfinite(input_array), input_array, 0)
+        return input_array.astype(np.int64)
+    hru_grid = int_grid(hru_array)
+    flow_dir_grid = int_grid(flow_dir_array)
+    flow_dir_grid[(flow_dir_grid < 0) | (flow_dir_grid > 128)] = 0
+    if seg_array is None:
+        seg_grid = np.zeros(hru_grid.shape, dtype=np.int64)
+    else:
+        seg_grid = int_grid(seg_array)
+
+    # Invalid codes have no offset and will look like flow within the HRU
+    d8_row = np.zeros(129, dtype=np.int64)
+    d8_col = np.zeros(129, dtype=np.int64)
+    for d8_code, (row_offset, col_offset) in d8_offset_dict.items():
+        d8_row[d8_code], d8_col[d8_code] = row_offset, col_offset
+
+    cell_mask = np.zeros(hru_grid.shape, dtype=np.bool)
+    cell_mask[1:-1, 1:-1] = hru_grid[1:-1, 1:-1] > 0
+    cell_rows, cell_cols = np.nonzero(cell_mask)
+    del cell_mask
+    cell_dir = flow_dir_grid[cell_rows, cell_cols]
+    down_rows = cell_rows + d8_row[cell_dir]
+    down_cols = cell_cols + d8_col[cell_dir]
+    up_hru = hru_grid[cell_rows, cell_cols]
+    cell_seg = seg_grid[cell_rows, cell_cols]
+    down_hru = hru_grid[down_rows, down_cols]
+    down_seg = seg_grid[down_rows, down_cols]
+    del cell_dir, down_rows, down_cols, cell_rows, cell_cols
+
+    strm_mask = cell_seg > 0
+    cross_mask = (down_hru > 0) & (down_hru != up_hru) & ~strm_mask
+    down_key = np.where(
+        strm_mask, -cell_seg, np.where(down_seg > 0, -down_seg, down_hru))
+    casc_mask = strm_mask | cross_mask
+    if not np.any(casc_mask):
+        empty_array = np.zeros(0, dtype=np.int64)
+        return empty_array, empty_array, empty_array
+    return ZonalAccumulator.pair_counts(
+        up_hru[casc_mask], down_key[casc_mask],
+        np.ones(int(casc_mask.sum()), dtype=np.int64))
+
+
+def cascade_cycle_mask(up_hru, down_hru, n):
+    """Flag the HRUs that are on (or between) cascade cycles
+
+    Kahn's algorithm is run downstream and upstream.  HRUs that can not
+    be ordered either way have a cycle both upslope and downslope.
+
+    Args:
+        up_hru (:class:`numpy.array`): up HRU ID of each HRU cascade
+        down_hru (:class:`numpy.array`): down HRU ID of each HRU cascade
+        n (int): number of HRU IDs (maximum ID + 1)
+
+    Returns:
+        :class:`numpy.array` of bool, indexed by HRU ID
+    """
+    def unordered_mask(from_id, to_id):
+        inflow_count = np.bincount(to_id, minlength=n).tolist()
+        order = np.argsort(from_id, kind='mergesort')
+        to_list = to_id[order].tolist()
+        starts = np.searchsorted(from_id[order], np.arange(n + 1)).tolist()
+        hru_list = [i for i in xrange(n) if inflow_count[i] == 0]
+        for hru_i in hru_list:
+            for down_i in to_list[starts[hru_i]:starts[hru_i + 1]]:
+                inflow_count[down_i] -= 1
+                if inflow_count[down_i] == 0:
+                    hru_list.append(down_i)
+        output_mask = np.ones(n, dtype=np.bool)
+        output_mask[hru_list] = False
+        return output_mask
+    return unordered_mask(up_hru, down_hru) & unordered_mask(down_hru, up_hru)
+
+
+def cascade_pct_func(pair_list, hru_id=None, hru_elev=None, min_pct=0.0):
+    """Convert cascade cell counts to the PRMS cascade parameters
+
+    The fraction of each cascade is its share of the cells that cascade
+    out of the upslope HRU, so the fractions of each HRU sum to 1.
+
+    PRMS does not allow circular HRU cascades, so cycles are removed:
+    if two HRUs cascade to each other only the direction with more cells
+    is kept, then in any remaining (longer) cycles the cascades to a
+    higher HRU are removed.  HRUs are ordered by mean elevation (then by
+    ID), or only by ID if hru_elev is not set, so no cycles can remain.
+
+    Cascades with a fraction below min_pct are removed, except for the
+    largest cascade of each HRU.  The fractions are computed again after
+    cascades are removed.
+
+    Args:
+        pair_list (list): up HRU, key, and count arrays
+            from :func:`cascade_pair_func` (one item per tile)
+        hru_id (:class:`numpy.array`): HRU IDs
+        hru_elev (:class:`numpy.array`): mean elevation of each HRU ID
+        min_pct (float): minimum cascade fraction [0-1]
+
+    Returns:
+        hru_up_id, hru_down_id, hru_strmseg_down_id, hru_pct_up arrays
+        (hru_down_id is 0 for cascades to a stream segment)
+    """
+    def up_fraction(up_hru, casc_count):
+        starts = np.append(0, np.nonzero(np.diff(up_hru))[0] + 1)
+        up_total = np.add.reduceat(casc_count, starts)
+        up_total = np.repeat(up_total, np.diff(np.append(starts, up_hru.size)))
+        return casc_count.astype(np.float64) / up_total
+
+    pair_list = [p for p in pair_list if p[0].size]
+    if not pair_list:
+        empty_array = np.zeros(0, dtype=np.int64)
+        return (empty_array, empty_array, empty_array,
+                np.zeros(0, dtype=np.float64))
+    up_hru, down_key, casc_count = ZonalAccumulator.pair_counts(
+        *[np.concatenate(x) for x in zip(*pair_list)])
+
+    # Remove small cascades, but keep the largest cascade of each HRU
+    if min_pct > 0:
+        order = np.lexsort((-casc_count, up_hru))
+        largest_mask = np.zeros(up_hru.size, dtype=np.bool)
+        largest_mask[order[np.append(True, np.diff(up_hru[order]) != 0)]] = True
+        casc_mask = (up_fraction(up_hru, casc_count) >= min_pct) | largest_mask
+        if not np.all(casc_mask):
+            logging.info('  Small cascades removed: {0}'.format(
+                int(np.sum(~casc_mask))))
+            up_hru, down_key, casc_count = (
+                up_hru[casc_mask], down_key[casc_mask], casc_count[casc_mask])
+
+    # HRU rank (elevation then ID) for breaking ties and longer cycles
+    n = int(max(up_hru.max(), down_key.max())) + 1
+    if hru_id is not None:
+        n = max(n, int(np.max(hru_id)) + 1)
+    hru_rank = np.arange(n, dtype=np.int64)
+    if hru_id is not None and hru_elev is not None:
+        hru_id = np.asarray(hru_id, dtype=np.int64)
+        order = np.lexsort((hru_id, np.asarray(hru_elev, dtype=np.float64)))
+        hru_rank[hru_id[order]] = n + np.arange(hru_id.size)
+
+    # Keep the direction with more cells (or the downslope direction)
+    #   when two HRUs cascade to each other
+    hru_mask = down_key > 0
+    pair_key = up_hru * n + np.where(hru_mask, down_key, 0)
+    reverse_key = np.where(hru_mask, down_key * n + up_hru, -1)
+    reverse_i = np.clip(np.searchsorted(pair_key, reverse_key), 0, up_hru.size - 1)
+    reverse_mask = hru_mask & (pair_key[reverse_i] == reverse_key)
+    reverse_count = np.where(reverse_mask, casc_count[reverse_i], 0)
+    up_rank = hru_rank[up_hru]
+    down_rank = hru_rank[np.where(hru_mask, down_key, 0)]
+    casc_mask = ~(reverse_mask & (
+        (reverse_count > casc_count) |
+        ((reverse_count == casc_count) & (up_rank < down_rank))))
+
+    # Remove cascades to a higher HRU in the remaining cycles
+    hru_mask &= casc_mask
+    cycle_mask = cascade_cycle_mask(up_hru[hru_mask], down_key[hru_mask], n)
+    casc_mask &= ~(
+        hru_mask & cycle_mask[up_hru] &
+        cycle_mask[np.where(hru_mask, down_key, 0)] & (up_rank < down_rank))
+    if not np.all(casc_mask):
+        logging.info('  Circular cascades removed: {0}'.format(
+            int(np.sum(~casc_mask))))
+        up_hru, down_key, casc_count = (
+            up_hru[casc_mask], down_key[casc_mask], casc_count[casc_mask])
+
+    hru_down_id = np.where(down_key > 0, down_key, 0)
+    hru_strmseg_down_id = np.where(down_key < 0, -down_key, 0)
+    hru_pct_up = up_fraction(up_hru, casc_count)
+    return up_hru, hru_down_id, hru_strmseg_down_id, hru_pct_up
+
+
+def segment_topo_order(tosegment_array):
+    """Order the stream segments so every segment is before its tosegment
+
+    Segments are numbered 1 to nseg and a tosegment of 0 is an outlet.
+    Kahn's algorithm visits each segment once.
+
+    Args:
+        tosegment_array (:class:`numpy.array`): tosegment of segments 1..nseg
+
+    Returns:
+        :class:`numpy.array` of 0 based segment indices (upstream first)
     """
-    ranges = iter(sorted(ranges))
-    current_start, current_stop = next(ranges)
-    for start, stop in ranges:
-        if start > (current_stop + 1):
-            # Gap between segments: output current segment and start a new one.
-            yield current_start, current_stop
-            current_start, current_stop = start, stop
+    tosegment_array = np.asarray(tosegment_array, dtype=np.int64)
+    nseg = tosegment_array.size
+    bad_mask = (tosegment_array < 0) | (tosegment_array > nseg)
+    bad_mask |= tosegment_array == np.arange(1, nseg + 1)
+    if np.any(bad_mask):
+        logging.error(
+            ('\nERROR: Invalid tosegment values for segments: {0}').format(
+                ', '.join(map(str, (np.nonzero(bad_mask)[0] + 1).tolist()))))
+        sys.exit()
+    down_list = (tosegment_array - 1).tolist()
+    inflow_count = np.bincount(
+        tosegment_array, minlength=nseg + 1)[1:].tolist()
+    seg_list = [i for i in xrange(nseg) if inflow_count[i] == 0]
+    for seg_i in seg_list:
+        down_i = down_list[seg_i]
+        if down_i < 0:
+            continue
+        inflow_count[down_i] -= 1
+        if inflow_count[down_i] == 0:
+            seg_list.append(down_i)
+    if len(seg_list) < nseg:
+        cycle_segs = sorted(set(xrange(nseg)) - set(seg_list))
+        logging.error(
+            ('\nERROR: The stream network has a loop, check the tosegment ' +
+             'values for segments: {0}').format(
+                 ', '.join([str(i + 1) for i in cycle_segs])))
+        sys.exit()
+    return np.array(seg_list, dtype=np.int64)
+
+
+def segment_strahler_order(tosegment_array, topo_order):
+    """Strahler stream order of each segment"""
+    down_list = (np.asarray(tosegment_array, dtype=np.int64) - 1).tolist()
+    nseg = len(down_list)
+    # Highest inflow order and how many inflows have that order
+    up_max = [0] * nseg
+    up_count = [0] * nseg
+    order_list = [0] * nseg
+    for seg_i in topo_order.tolist():
+        if up_max[seg_i] == 0:
+            order_list[seg_i] = 1
+        elif up_count[seg_i] > 1:
+            order_list[seg_i] = up_max[seg_i] + 1
         else:
-            # Segments adjacent or overlapping: merge.
-            current_stop = max(current_stop, stop)
-    yield current_start, current_stop
+            order_list[seg_i] = up_max[seg_i]
+        down_i = down_list[seg_i]
+        if down_i < 0:
+            continue
+        if order_list[seg_i] > up_max[down_i]:
+            up_max[down_i] = order_list[seg_i]
+            up_count[down_i] = 1
+        elif order_list[seg_i] == up_max[down_i]:
+            up_count[down_i] += 1
+    return np.array(order_list, dtype=np.int64)
 
 
-def ranges_overlap(ranges):
-    """Test if ranges overlap
+def segment_upstream_sum(tosegment_array, topo_order, seg_values):
+    """Accumulate segment values (i.e. HRU area) downstream"""
+    down_list = (np.asarray(tosegment_array, dtype=np.int64) - 1).tolist()
+    sum_list = np.asarray(seg_values, dtype=np.float64).tolist()
+    for seg_i in topo_order.tolist():
+        down_i = down_list[seg_i]
+        if down_i >= 0:
+            sum_list[down_i] += sum_list[seg_i]
+    return np.array(sum_list, dtype=np.float64)
+
+
+def segment_outlet(tosegment_array, topo_order, outlet_mask=None):
+    """Segment ID of the outlet that each segment drains to
 
     Args:
-        ranges (list): Iterable of pairs (min, max)
+        tosegment_array (:class:`numpy.array`): tosegment of segments 1..nseg
+        topo_order (:class:`numpy.array`): from :func:`segment_topo_order`
+        outlet_mask (:class:`numpy.array`): additional segments that are
+            treated as outlets (i.e. gauges at subbasin outlets)
+
     Returns:
-         bool: True if ranges overlap each other, False otherwise
+        :class:`numpy.array` of segment IDs
     """
-    for r1, r2 in itertools.combinations(ranges, 2):
-        if r1[1] > r2[0] and r1[0] < r2[1]:
-            return True
-    return False
+    tosegment_array = np.asarray(tosegment_array, dtype=np.int64)
+    outlet_list = np.where(
+        tosegment_array == 0, np.arange(1, tosegment_array.size + 1), 0)
+    if outlet_mask is not None:
+        outlet_list[outlet_mask] = np.nonzero(outlet_mask)[0] + 1
+    outlet_list = outlet_list.tolist()
+    down_list = (tosegment_array - 1).tolist()
+    # Work down to up so the tosegment is always set first
+    for seg_i in topo_order[::-1].tolist():
+        if outlet_list[seg_i] == 0:
+            outlet_list[seg_i] = outlet_list[down_list[seg_i]]
+    return np.array(outlet_list, dtype=np.int64)
+
+
+def array_sample_func(input_array, x_array, y_array, xmin, ymax, cs):
+    """Sample a raster array at points (cell containing each point)
+
+    Points outside the array are NaN.  The array should be a float array
+    with NaN for nodata.
+    """
+    rows = np.floor((ymax - np.asarray(y_array)) / cs).astype(np.int64)
+    cols = np.floor((np.asarray(x_array) - xmin) / cs).astype(np.int64)
+    valid_mask = (
+        (rows >= 0) & (rows < input_array.shape[0]) &
+        (cols >= 0) & (cols < input_array.shape[1]))
+    output_array = np.empty(rows.shape, dtype=np.float64)
+    output_array.fill(np.NaN)
+    output_array[valid_mask] = input_array[rows[valid_mask], cols[valid_mask]]
+    return output_array
+
+
+def segment_length_slope(seg_array, x_array, y_array, z_array, nseg,
+                         min_slope=0.0001):
+    """Length and slope of each segment from its vertices
+
+    Vertices of a segment must be consecutive and in order
+    (i.e. from FeatureClassToNumPyArray with explode_to_points).
+    Slope is the elevation range of the segment's vertices over its
+    length, so it doesn't depend on the digitized direction.
+
+    Args:
+        seg_array (:class:`numpy.array`): 0 based segment index of each vertex
+        x_array, y_array (:class:`numpy.array`): vertex coordinates
+        z_array (:class:`numpy.array`): vertex elevations (NaN for nodata)
+        nseg (int): number of segments
+        min_slope (float): minimum slope
+
+    Returns:
+        length and slope arrays (length is in the coordinate units)
+    """
+    seg_array = np.asarray(seg_array, dtype=np.int64)
+    edge_mask = seg_array[1:] == seg_array[:-1]
+    edge_length = np.hypot(np.diff(x_array), np.diff(y_array))[edge_mask]
+    length_array = np.bincount(
+        seg_array[1:][edge_mask], weights=edge_length, minlength=nseg)
+
+    # Elevation range of the vertices with elevations
+    z_mask = np.isfinite(z_array)
+    z_seg, z_values = seg_array[z_mask], np.asarray(z_array)[z_mask]
+    order = np.argsort(z_seg, kind='mergesort')
+    z_seg, z_values = z_seg[order], z_values[order]
+    drop_array = np.zeros(nseg, dtype=np.float64)
+    if z_seg.size:
+        starts = np.append(0, np.nonzero(np.diff(z_seg))[0] + 1)
+        drop_array[z_seg[starts]] = (
+            np.maximum.reduceat(z_values, starts) -
+            np.minimum.reduceat(z_values, starts))
+    slope_array = np.zeros(nseg, dtype=np.float64)
+    length_mask = length_array > 0
+    slope_array[length_mask] = drop_array[length_mask] / length_array[length_mask]
+    return length_array, np.maximum(slope_array, min_slope)
+
+
+def muskingum_coef_func(length_array, slope_array, mannings_n=0.04,
+                        depth=1.0):
+    """Muskingum k_coef and x_coef from segment length and slope
+
+    Velocity is from Manning's equation for a wide channel with a fixed
+    flow depth (hydraulic radius ~ depth).  Both coefficients use the
+    kinematic wave celerity c = 5/3 * v.  k_coef is the Muskingum-Cunge
+    travel time L / c and x_coef is the weighting
+    0.5 * (1 - q / (S * c * L)), with unit discharge q = v * depth.
+
+    Args:
+        length_array (:class:`numpy.array`): segment length (meters)
+        slope_array (:class:`numpy.array`): segment slope (must be > 0)
+        mannings_n (float): Manning's roughness coefficient
+        depth (float): flow depth (meters)
+
+    Returns:
+        k_coef (hours) and x_coef arrays, limited to the ranges
+        PRMS accepts (0.01-24 and 0-0.5)
+    """
+    length_array = np.maximum(np.asarray(length_array, dtype=np.float64), 1.0)
+    slope_array = np.asarray(slope_array, dtype=np.float64)
+    velocity_array = depth ** (2.0 / 3) * np.sqrt(slope_array) / mannings_n
+    celerity_array = 5.0 / 3 * velocity_array
+    k_coef_array = length_array / celerity_array / 3600
+    x_coef_array = 0.5 * (1 - velocity_array * depth / (
+        slope_array * celerity_array * length_array))
+    return (np.clip(k_coef_array, 0.01, 24.0),
+            np.clip(x_coef_array, 0.0, 0.5))
+
+
+def field_duplicate_check(table_path, field_name, n=None,
+                          block_size=500000, bitmap_max_bytes=2**27):
+    """Find duplicate values in a shapefile field
+
+    For now assume table_path is actually a shapefile that can be read
+        with arcpy.da.TableToNumPyArray()
+
+    Values are read in blocks of block_size rows.  Integer values are
+    marked in a bitmap spanning the field range if the bitmap is smaller
+    than bitmap_max_bytes.  Otherwise each block is sorted and saved to
+    a temporary file, and the sorted blocks are merged (heapq.merge) and
+    adjacent values are compared.  Memory use is the bitmap size or one
+    block of values.
+
+    Args:
+        table_path (str): File path of the table to search
+        field_name (str): Field/column name to search
+        n (int): number of rows in the table
+        block_size (int): number of rows to read at a time
+        bitmap_max_bytes (int): maximum size of the integer bitmap
+
+    Returns:
+        list: sorted duplicate values (empty if there are no duplicates)
+    """
+
+    # Eventually check that field is in table
+    field_obj = arcpy.ListFields(table_path, field_name)[0]
+    oid_field = arcpy.Describe(table_path).OIDFieldName
+
+    if n is None:
+        n = int(arcpy.GetCount_management(table_path).getOutput(0))
+    logging.debug('\n  Testing for duplicate values')
+    logging.debug('    field:    {}'.format(field_name))
+    logging.debug('    features: {}'.format(n))
+
+    def block_values():
+        for x in xrange(0, n, block_size):
+            subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
+                oid_field, x, x + block_size)
+            yield arcpy.da.TableToNumPyArray(
+                table_path, [field_name], subset_str)[field_name]
+
+    def adjacent_duplicates(sorted_array):
+        return sorted_array[1:][sorted_array[1:] == sorted_array[:-1]]
+
+    # Integer range is needed to size the bitmap
+    bitmap_flag = False
+    if field_obj.type in ['Integer', 'SmallInteger', 'OID']:
+        value_range_list = [
+            (int(value_array.min()), int(value_array.max()))
+            for value_array in block_values() if value_array.size]
+        if not value_range_list:
+            return []
+        value_min = min(r[0] for r in value_range_list)
+        value_max = max(r[1] for r in value_range_list)
+        bitmap_bytes = (value_max - value_min) // 8 + 1
+        bitmap_flag = bitmap_bytes <= bitmap_max_bytes
+        logging.debug('    range:    {0} - {1}'.format(value_min, value_max))
+
+    duplicate_list = []
+    if bitmap_flag:
+        logging.debug('    Bitmap:   {} bytes'.format(bitmap_bytes))
+        bitmap = np.zeros(bitmap_bytes, dtype=np.uint8)
+        for value_array in block_values():
+            offset_array = np.sort(value_array.astype(np.int64) - value_min)
+            duplicate_list.append(adjacent_duplicates(offset_array) + value_min)
+
+            # Values that were set by a previous block are duplicates
+            offset_array = np.unique(offset_array)
+            byte_array = offset_array >> 3
+            bit_array = np.left_shift(1, offset_array & 7).astype(np.uint8)
+            seen_mask = (bitmap[byte_array] & bit_array) > 0
+            duplicate_list.append(offset_array[seen_mask] + value_min)
+
+            # Combine the bits of values in the same byte before setting
+            byte_start = np.where(np.diff(np.concatenate((
+                [-1], byte_array))))[0]
+            bitmap[byte_array[byte_start]] |= np.bitwise_or.reduceat(
+                bit_array, byte_start)
+        del bitmap
+    else:
+        def sorted_block_values(block_path, chunk_size=2**16):
+            block_array = np.load(block_path, mmap_mode='r')
+            for i in xrange(0, block_array.size, chunk_size):
+                for value in block_array[i:i + chunk_size].tolist():
+                    yield value
+
+        block_ws = tempfile.mkdtemp()
+        try:
+            block_path_list = []
+            merge_dtype = None
+            for value_array in block_values():
+                value_array = np.sort(value_array)
+                duplicate_list.append(adjacent_duplicates(value_array))
+                block_path = os.path.join(
+                    block_ws, 'block_{0}.npy'.format(len(block_path_list)))
+                np.save(block_path, value_array)
+                block_path_list.append(block_path)
+                merge_dtype = value_array.dtype
+                del value_array
+            logging.debug('    Sorted blocks: {}'.format(len(block_path_list)))
+
+            # Duplicates within a block were already found, but merging all
+            #   the blocks also finds the duplicates between blocks
+            if len(block_path_list) > 1:
+                merge_duplicates = []
+                previous_value = None
+                for i, value in enumerate(heapq.merge(*[
+                        sorted_block_values(block_path)
+                        for block_path in block_path_list])):
+                    if i and value == previous_value:
+                        merge_duplicates.append(value)
+                    previous_value = value
+                if merge_duplicates:
+                    duplicate_list.append(
+                        np.array(merge_duplicates, dtype=merge_dtype))
+        finally:
+            shutil.rmtree(block_ws, ignore_errors=True)
+
+    if duplicate_list:
+        duplicate_list = np.unique(np.concatenate(duplicate_list)).tolist()
+    if duplicate_list:
+        logging.debug('    Duplicates: {}'.format(len(duplicate_list)))
+    else:
+        logging.debug('    No duplicates')
+    return duplicate_list
 
 
 def extent_string(extent_obj):
@@ -1280,38 +2420,726 @@ def project_raster_func(input_raster, output_raster, output_sr,
                         proj_method, input_cs, transform_str,
                         input_sr, hru_param):
     """"""
-    # Input raster can be a raster object or a raster path
-    # print isinstance(input_raster, Raster), isinstance(input_raster, str)
-    try:
-        input_extent = Raster(input_raster).extent
-    except:
-        input_extent = input_raster.extent
-        
     # DEADBEEF - Arc10.2 ProjectRaster does not honor extent
-    # Clip the input raster with the projected HRU extent first
-    # Project extent from "output" to "input" to get clipping extent
-    proj_extent = project_hru_extent_func(
-        hru_param.extent, output_sr,
-        input_extent, input_cs, input_sr)
-    # clip_path = output_raster.replace('.img', '_clip.img')
-    clip_path = os.path.join('in_memory', 'clip_raster')
-#     clip_path = os.path.join(hru_param.param_ws, 'clip_raster')
-    env.extent = proj_extent
-    arcpy.Clip_management(
-        input_raster, ' '.join(str(proj_extent).split()[:4]), clip_path)
-    arcpy.ClearEnvironment('extent')
-    
-    # Then project the clipped raster
-#     arcpy.ProjectRaster_management(
-#         clip_path, output_raster, output_sr, proj_method.upper(), input_cs,
-#         transform_str, reg_point, input_sr)
-    arcpy.ProjectRaster_management(in_raster=clip_path, out_raster=output_raster, 
-                                   out_coor_system=output_sr, resampling_type=proj_method.upper(),
-                                   cell_size=input_cs, geographic_transform=transform_str, 
-                                   in_coor_system=input_sr)
-    
-    # Cleanup
-    arcpy.Delete_management(clip_path)
+    # Project through a projection plan instead of Clip/ProjectRaster
+    # The plan is built once per source grid and is cached on disk
+    #   so the clip window and cell mapping are only computed once
+    project_raster_group_func(
+        [input_raster], [output_raster], output_sr, proj_method, input_cs,
+        hru_param, transform_str, input_sr)
+
+
+# Projection plans that have already been built/loaded in this process
+projection_plan_dict = dict()
+
+
+@instrument('project_raster_group_func')
+def project_raster_group_func(input_list, output_list, output_sr,
+                              proj_method, output_cs, hru_param,
+                              transform_str=None, input_sr=None):
+    """Project/clip a group of rasters to the HRU extent
+
+    Rasters are grouped by source grid (spatial reference, snap point,
+    cellsize and shape) and all rasters in a group share one
+    ProjectionPlan.  If transform_str or input_sr are not set, they are
+    read from each input raster.  If tile_cache_folder is set, rasters
+    on disk are built from the shared TileCache instead and projection
+    plans are saved in the cache folder, so projects on the same grid
+    share them.
+
+    Args:
+        input_list (list): input raster paths or raster objects
+        output_list (list): output raster paths
+        output_sr (:class:`arcpy.SpatialReference`): output spat. ref.
+        proj_method (str): NEAREST, BILINEAR, or CUBIC
+        output_cs (float): output cellsize
+        hru_param (:class:`support_functions.HRUParameters`)
+        transform_str (str): geographic transformation
+        input_sr (:class:`arcpy.SpatialReference`): input spat. ref.
+
+    Returns:
+        None
+    """
+    if hru_param.tile_cache_ws:
+        tile_cache = TileCache(
+            hru_param.tile_cache_ws, hru_param.tile_cache_quota)
+        plan_ws = os.path.join(hru_param.tile_cache_ws, 'projection_plans')
+    else:
+        tile_cache = None
+        plan_ws = None
+    for input_raster, output_raster in zip(input_list, output_list):
+        # Input raster can be a raster object or a raster path
+        if isinstance(input_raster, basestring):
+            input_obj = Raster(input_raster)
+        else:
+            input_obj = input_raster
+        if input_sr is None:
+            raster_sr = input_obj.spatialReference
+        else:
+            raster_sr = input_sr
+        if transform_str is None:
+            raster_transform = transform_func(output_sr, raster_sr)
+            if raster_transform:
+                logging.debug('  Transform: {0}'.format(raster_transform))
+        else:
+            raster_transform = transform_str
+
+        if tile_cache is not None and tile_cache.project(
+                input_obj, output_raster, raster_sr, output_sr, output_cs,
+                raster_transform, proj_method, hru_param):
+            del input_obj, raster_sr, raster_transform
+            continue
+        plan_key = projection_plan_key(
+            input_obj, raster_sr, output_sr, output_cs, raster_transform,
+            hru_param)
+        try:
+            plan = projection_plan_dict[plan_key]
+            logging.debug('  Reusing projection plan: {0}'.format(plan_key))
+        except KeyError:
+            plan = ProjectionPlan(
+                input_obj, raster_sr, output_sr, output_cs,
+                raster_transform, hru_param, plan_ws)
+            projection_plan_dict[plan_key] = plan
+        plan.project(input_obj, output_raster, proj_method)
+        del input_obj, raster_sr, raster_transform, plan_key, plan
+
+
+def projection_output_extent(hru_param, output_cs):
+    """HRU extent expanded to the output cellsize"""
+    return adjust_extent_to_snap(
+        hru_param.extent, hru_param.extent.lowerLeft, output_cs,
+        'EXPAND', False)
+
+
+def projection_plan_key(input_obj, input_sr, output_sr, output_cs,
+                        transform_str, hru_param):
+    """Hash of the source grid and the output grid of a projection"""
+    input_extent = input_obj.extent
+    key_list = [
+        input_sr.exportToString(),
+        repr(round(input_extent.XMin, 6)), repr(round(input_extent.YMax, 6)),
+        repr(input_obj.meanCellWidth), repr(input_obj.meanCellHeight),
+        str(input_obj.width), str(input_obj.height),
+        output_sr.exportToString(), repr(float(output_cs)),
+        extent_string(projection_output_extent(hru_param, output_cs)),
+        str(transform_str)]
+    return hashlib.md5('\n'.join(key_list)).hexdigest()
+
+
+def resample_array(input_array, src_row, src_col, method='NEAREST',
+                   nodata=np.NaN):
+    """Resample an array at fractional row/column locations
+
+    src_row/src_col are in cell units from the upper left corner of
+    input_array, so the center of cell (i, j) is at (i + 0.5, j + 0.5).
+    BILINEAR and CUBIC only use valid (non-NaN) cells and cells that
+    fall outside input_array are set to nodata.
+
+    Args:
+        input_array (:class:`numpy.array`): input values
+        src_row (:class:`numpy.array`): fractional input rows
+        src_col (:class:`numpy.array`): fractional input columns
+        method (str): NEAREST, BILINEAR, or CUBIC
+        nodata: value for cells outside input_array
+
+    Returns:
+        :class:`numpy.array` with the shape of src_row
+    """
+    input_rows, input_cols = input_array.shape
+    method = method.upper()
+
+    # Nearest cell, also used to flag cells outside the input array
+    finite_mask = np.isfinite(src_row) & np.isfinite(src_col)
+    near_row = np.where(finite_mask, np.floor(src_row), -1).astype(np.int64)
+    near_col = np.where(finite_mask, np.floor(src_col), -1).astype(np.int64)
+    inside_mask = (
+        (near_row >= 0) & (near_row < input_rows) &
+        (near_col >= 0) & (near_col < input_cols))
+    if method == 'NEAREST':
+        output_array = np.empty(src_row.shape, dtype=input_array.dtype)
+        output_array.fill(nodata)
+        output_array[inside_mask] = input_array[
+            near_row[inside_mask], near_col[inside_mask]]
+        return output_array
+    elif method not in ['BILINEAR', 'CUBIC']:
+        logging.error(
+            '\nERROR: Unsupported projection method: {0}'.format(method))
+        sys.exit()
+
+    # Distance from the cell center above/left of each location
+    row_u = np.where(finite_mask, src_row, 0) - 0.5
+    col_u = np.where(finite_mask, src_col, 0) - 0.5
+    row_i = np.floor(row_u).astype(np.int64)
+    col_i = np.floor(col_u).astype(np.int64)
+    row_f = row_u - row_i
+    col_f = col_u - col_i
+
+    def weighted_sum(offsets, row_weights, col_weights):
+        """Sum of weighted valid taps, the weights and a nodata flag"""
+        value_sum = np.zeros(src_row.shape, dtype=np.float64)
+        weight_sum = np.zeros(src_row.shape, dtype=np.float64)
+        nodata_mask = np.zeros(src_row.shape, dtype=np.bool)
+        for offset_r, weight_r in zip(offsets, row_weights):
+            tap_row = np.clip(row_i + offset_r, 0, input_rows - 1)
+            for offset_c, weight_c in zip(offsets, col_weights):
+                tap_col = np.clip(col_i + offset_c, 0, input_cols - 1)
+                tap_value = input_array[tap_row, tap_col]
+                tap_mask = np.isfinite(tap_value)
+                tap_weight = np.where(tap_mask, weight_r * weight_c, 0)
+                value_sum += np.where(tap_mask, tap_value, 0) * tap_weight
+                weight_sum += tap_weight
+                nodata_mask |= ~tap_mask
+        return value_sum, weight_sum, nodata_mask
+
+    # Bilinear weights are positive so missing taps can be dropped
+    value_sum, weight_sum, nodata_mask = weighted_sum(
+        [0, 1], [1 - row_f, row_f], [1 - col_f, col_f])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        output_array = np.where(
+            weight_sum > 0, value_sum / weight_sum, np.NaN)
+
+    # Cubic convolution (Keys, a=-0.5)
+    # Fall back to bilinear where any of the 16 taps are nodata
+    if method == 'CUBIC':
+        def cubic_weight(d, a=-0.5):
+            d = np.abs(d)
+            return np.where(
+                d <= 1, ((a + 2) * d - (a + 3)) * d * d + 1,
+                np.where(d < 2, ((a * d - 5 * a) * d + 8 * a) * d - 4 * a, 0))
+        value_sum, weight_sum, nodata_mask = weighted_sum(
+            [-1, 0, 1, 2],
+            [cubic_weight(row_f + 1), cubic_weight(row_f),
+             cubic_weight(1 - row_f), cubic_weight(2 - row_f)],
+            [cubic_weight(col_f + 1), cubic_weight(col_f),
+             cubic_weight(1 - col_f), cubic_weight(2 - col_f)])
+        output_array = np.where(nodata_mask, output_array, value_sum)
+    output_array[~inside_mask] = nodata
+    return output_array
+
+
+def interpolate_control_grid(ctrl_array, ctrl_rows, ctrl_cols, rows, cols):
+    """Bilinearly interpolate values from a control grid to rows/columns"""
+    def interp_weights(ctrl, full):
+        """Index of the control point before each location and weight"""
+        if len(ctrl) == 1:
+            return (np.zeros(len(full), dtype=np.int64),
+                    np.zeros(len(full), dtype=np.int64),
+                    np.zeros(len(full), dtype=np.float64))
+        i = np.clip(np.searchsorted(ctrl, full, side='right') - 1,
+                    0, len(ctrl) - 2)
+        w = (full - ctrl[i]) / (ctrl[i + 1] - ctrl[i]).astype(np.float64)
+        return i, i + 1, w
+    r0, r1, rw = interp_weights(ctrl_rows, rows)
+    c0, c1, cw = interp_weights(ctrl_cols, cols)
+    # Interpolate along columns first, then along rows
+    col_array = (ctrl_array[:, c0] * (1 - cw) + ctrl_array[:, c1] * cw)
+    return (col_array[r0, :] * (1 - rw)[:, None] +
+            col_array[r1, :] * rw[:, None])
+
+
+class ProjectionPlan():
+    """Mapping from the HRU output grid to a source raster grid
+
+    The HRU extent is projected to the source grid once to get a clip
+    window, and the fractional source row/column of every output cell is
+    computed once and saved as index arrays.  Every raster on the same
+    source grid is then projected by indexing into its clip window
+    instead of calling Clip/ProjectRaster for each raster.
+
+    Output cell centers are only projected on a coarse control grid and
+    interpolated in between.  The control grid spacing is halved until
+    the interpolation error is below max_error source cells.
+
+    If output_extent is set, the plan is for one TileCache tile and
+    is not saved, since the projected tile is cached instead.
+    """
+    def __init__(self, input_obj, input_sr, output_sr, output_cs,
+                 transform_str, hru_param, plan_ws=None,
+                 ctrl_step=16, max_error=0.125, block_rows=512,
+                 output_extent=None):
+        self.input_sr = input_sr
+        self.output_sr = output_sr
+        self.output_cs = float(output_cs)
+        self.transform_str = transform_str
+        self.block_rows = block_rows
+        self.tile_flag = output_extent is not None
+
+        # Output grid is the HRU extent snapped to the output cellsize
+        if output_extent is None:
+            self.output_extent = projection_output_extent(
+                hru_param, output_cs)
+        else:
+            self.output_extent = output_extent
+        self.output_rows = int(round(
+            self.output_extent.height / self.output_cs))
+        self.output_cols = int(round(
+            self.output_extent.width / self.output_cs))
+        if self.tile_flag:
+            self.build(input_obj, ctrl_step, max_error)
+            return
+
+        self.key = projection_plan_key(
+            input_obj, input_sr, output_sr, output_cs, transform_str,
+            hru_param)
+        if plan_ws is None:
+            plan_ws = os.path.join(hru_param.param_ws, 'projection_plans')
+        if not os.path.isdir(plan_ws):
+            try:
+                os.mkdir(plan_ws)
+            except OSError:
+                # Another process may have just made the folder
+                if not os.path.isdir(plan_ws):
+                    raise
+        self.plan_path = os.path.join(plan_ws, self.key)
+        if os.path.isfile(self.plan_path + '.json'):
+            logging.debug('  Loading projection plan: {0}'.format(self.key))
+            self.load()
+        else:
+            logging.debug('  Building projection plan: {0}'.format(self.key))
+            self.build(input_obj, ctrl_step, max_error)
+            self.save()
+
+    def build(self, input_obj, ctrl_step=16, max_error=0.125):
+        """Compute the clip window and output to input cell mapping"""
+        input_extent = input_obj.extent
+        self.input_cs_x = float(input_obj.meanCellWidth)
+        self.input_cs_y = float(input_obj.meanCellHeight)
+
+        # Project the output extent to the input spatial reference
+        # Buffer 2 cells for the cubic kernel and snap to the input cells
+        proj_extent = project_hru_extent_func(
+            self.output_extent, self.output_sr,
+            input_extent, self.input_cs_x, self.input_sr)
+        proj_extent = buffer_extent_func(
+            proj_extent, 2 * max(self.input_cs_x, self.input_cs_y))
+        input_x, input_y = input_extent.XMin, input_extent.YMax
+        window_xmin = max(input_extent.XMin, input_x + self.input_cs_x *
+            math.floor((proj_extent.XMin - input_x) / self.input_cs_x))
+        window_xmax = min(input_extent.XMax, input_x + self.input_cs_x *
+            math.ceil((proj_extent.XMax - input_x) / self.input_cs_x))
+        window_ymax = min(input_extent.YMax, input_y - self.input_cs_y *
+            math.floor((input_y - proj_extent.YMax) / self.input_cs_y))
+        window_ymin = max(input_extent.YMin, input_y - self.input_cs_y *
+            math.ceil((input_y - proj_extent.YMin) / self.input_cs_y))
+        outside_flag = window_xmin >= window_xmax or window_ymin >= window_ymax
+        if outside_flag and not self.tile_flag:
+            logging.error(
+                '\nERROR: The HRU extent does not intersect the ' +
+                'input raster\n  {0}'.format(extent_string(input_extent)))
+            sys.exit()
+        elif outside_flag:
+            # Tiles past the edge of the input raster are all nodata
+            # Read one input cell so the tile still has the input type
+            window_xmin = input_extent.XMin
+            window_xmax = input_extent.XMin + self.input_cs_x
+            window_ymax = input_extent.YMax
+            window_ymin = input_extent.YMax - self.input_cs_y
+        self.window_xmin = window_xmin
+        self.window_ymin = window_ymin
+        self.window_ymax = window_ymax
+        self.window_rows = int(round(
+            (window_ymax - window_ymin) / self.input_cs_y))
+        self.window_cols = int(round(
+            (window_xmax - window_xmin) / self.input_cs_x))
+        logging.debug('  Clip window: {0} {1} {2} {3}'.format(
+            window_xmin, window_ymin, window_xmax, window_ymax))
+        if outside_flag:
+            self.ctrl_step = ctrl_step
+            self.src_row = np.empty(
+                (self.output_rows, self.output_cols), dtype=np.float32)
+            self.src_row.fill(np.NaN)
+            self.src_col = self.src_row.copy()
+            return
+
+        # Project a control grid of output cell centers
+        # Check the interpolation error at the control cell midpoints
+        while True:
+            ctrl_rows = np.unique(np.append(
+                np.arange(0, self.output_rows, ctrl_step),
+                self.output_rows - 1))
+            ctrl_cols = np.unique(np.append(
+                np.arange(0, self.output_cols, ctrl_step),
+                self.output_cols - 1))
+            ctrl_x, ctrl_y = self.project_cells(ctrl_rows, ctrl_cols)
+            if ctrl_step == 1:
+                break
+            mid_rows = 0.5 * (ctrl_rows[:-1] + ctrl_rows[1:])
+            mid_cols = 0.5 * (ctrl_cols[:-1] + ctrl_cols[1:])
+            if not mid_rows.size or not mid_cols.size:
+                break
+            mid_x, mid_y = self.project_cells(mid_rows, mid_cols)
+            ctrl_error = max(
+                np.nanmax(np.abs(interpolate_control_grid(
+                    ctrl_x, ctrl_rows, ctrl_cols, mid_rows, mid_cols) -
+                    mid_x)) / self.input_cs_x,
+                np.nanmax(np.abs(interpolate_control_grid(
+                    ctrl_y, ctrl_rows, ctrl_cols, mid_rows, mid_cols) -
+                    mid_y)) / self.input_cs_y)
+            logging.debug('  Control step {0}: {1:.4f} cell error'.format(
+                ctrl_step, ctrl_error))
+            if ctrl_error <= max_error:
+                break
+            ctrl_step = max(ctrl_step // 2, 1)
+        self.ctrl_step = ctrl_step
+
+        # Interpolate fractional input rows/columns for all output cells
+        # Float32 is precise to well under a cell for any realistic window
+        self.src_row = np.empty(
+            (self.output_rows, self.output_cols), dtype=np.float32)
+        self.src_col = np.empty(
+            (self.output_rows, self.output_cols), dtype=np.float32)
+        output_cols = np.arange(self.output_cols)
+        for row_i in xrange(0, self.output_rows, self.block_rows):
+            row_j = min(row_i + self.block_rows, self.output_rows)
+            block_rows = np.arange(row_i, row_j)
+            block_x = interpolate_control_grid(
+                ctrl_x, ctrl_rows, ctrl_cols, block_rows, output_cols)
+            block_y = interpolate_control_grid(
+                ctrl_y, ctrl_rows, ctrl_cols, block_rows, output_cols)
+            self.src_col[row_i:row_j] = (
+                (block_x - self.window_xmin) / self.input_cs_x)
+            self.src_row[row_i:row_j] = (
+                (self.window_ymax - block_y) / self.input_cs_y)
+            del block_x, block_y
+
+    def project_cells(self, rows, cols):
+        """Project output cell centers to the input spatial reference
+
+        Returns:
+            x and y arrays with shape (len(rows), len(cols))
+        """
+        output_x = (self.output_extent.XMin +
+                    (np.asarray(cols, dtype=np.float64) + 0.5) * self.output_cs)
+        output_y = (self.output_extent.YMax -
+                    (np.asarray(rows, dtype=np.float64) + 0.5) * self.output_cs)
+        grid_x, grid_y = np.meshgrid(output_x, output_y)
+        # Project all points at once as a single multipoint
+        output_geom = arcpy.Multipoint(
+            arcpy.Array([
+                arcpy.Point(x, y)
+                for x, y in zip(grid_x.ravel(), grid_y.ravel())]),
+            self.output_sr)
+        if self.transform_str:
+            input_geom = output_geom.projectAs(
+                self.input_sr, self.transform_str)
+        else:
+            input_geom = output_geom.projectAs(self.input_sr)
+        input_xy = np.array(
+            [(pnt.X, pnt.Y) for pnt in input_geom.getPart()],
+            dtype=np.float64)
+        return (input_xy[:, 0].reshape(grid_x.shape),
+                input_xy[:, 1].reshape(grid_y.shape))
+
+    def save(self):
+        """Save the index arrays and the window/grid properties
+
+        Files are written to a temporary file and renamed, since other
+        processes (i.e. batch_run.py workers) may share the plan folder.
+        The .json file is saved last since it marks a finished plan.
+        """
+        def save_file(output_path, save_func):
+            temp_path = '{0}_{1}.tmp'.format(output_path, os.getpid())
+            with open(temp_path, 'wb') as temp_f:
+                save_func(temp_f)
+            try:
+                os.rename(temp_path, output_path)
+            except OSError:
+                # Another process already saved the file
+                os.remove(temp_path)
+
+        save_file(self.plan_path + '_row.npy',
+                  lambda f: np.save(f, self.src_row))
+        save_file(self.plan_path + '_col.npy',
+                  lambda f: np.save(f, self.src_col))
+        plan_dict = {
+            'window_xmin': self.window_xmin,
+            'window_ymin': self.window_ymin,
+            'window_ymax': self.window_ymax,
+            'window_rows': self.window_rows,
+            'window_cols': self.window_cols,
+            'input_cs_x': self.input_cs_x,
+            'input_cs_y': self.input_cs_y,
+            'ctrl_step': self.ctrl_step}
+        save_file(self.plan_path + '.json',
+                  lambda f: json.dump(plan_dict, f, indent=1, sort_keys=True))
+
+    def load(self):
+        """Load a saved plan, index arrays are memory mapped"""
+        with open(self.plan_path + '.json', 'r') as plan_f:
+            plan_dict = json.load(plan_f)
+        for k, v in plan_dict.items():
+            setattr(self, str(k), v)
+        self.src_row = np.load(self.plan_path + '_row.npy', mmap_mode='r')
+        self.src_col = np.load(self.plan_path + '_col.npy', mmap_mode='r')
+
+    def project(self, input_obj, output_raster, proj_method='NEAREST'):
+        """Read the clip window of a raster, resample it and save it"""
+        output_array, output_nodata = self.resample(input_obj, proj_method)
+        save_projected_raster(
+            output_array, output_nodata, output_raster, self.output_extent,
+            self.output_cs, self.output_sr)
+
+    def resample(self, input_obj, proj_method='NEAREST'):
+        """Read the clip window of a raster and resample it
+
+        Returns:
+            tuple: output array and nodata value
+        """
+        proj_method = proj_method.upper()
+        input_array = arcpy.RasterToNumPyArray(
+            input_obj, arcpy.Point(self.window_xmin, self.window_ymin),
+            self.window_cols, self.window_rows)
+        input_nodata = input_obj.noDataValue
+
+        # Only nearest keeps the input type, all other methods are float
+        if (proj_method == 'NEAREST' and
+            input_array.dtype != np.float32 and
+            input_array.dtype != np.float64):
+            output_array = np.empty(
+                (self.output_rows, self.output_cols), dtype=input_array.dtype)
+        else:
+            input_array = input_array.astype(np.float64)
+            if input_nodata is not None:
+                input_array[input_array == input_nodata] = np.NaN
+            output_array = np.empty(
+                (self.output_rows, self.output_cols), dtype=np.float64)
+        output_nodata = projection_nodata(input_obj, output_array.dtype)
+
+        for row_i in xrange(0, self.output_rows, self.block_rows):
+            row_j = min(row_i + self.block_rows, self.output_rows)
+            output_array[row_i:row_j] = resample_array(
+                input_array,
+                np.asarray(self.src_row[row_i:row_j], dtype=np.float64),
+                np.asarray(self.src_col[row_i:row_j], dtype=np.float64),
+                proj_method, output_nodata)
+        del input_array
+        return output_array, output_nodata
+
+
+def projection_nodata(input_obj, output_type):
+    """Nodata value of a projected array
+
+    Float arrays use NaN, integer arrays (nearest only) keep the input
+    nodata value or use the largest value of the type.
+    """
+    if np.dtype(output_type).kind == 'f':
+        return np.NaN
+    elif input_obj.noDataValue is None:
+        return np.iinfo(output_type).max
+    else:
+        return int(input_obj.noDataValue)
+
+
+def save_projected_raster(output_array, output_nodata, output_raster,
+                          output_extent, output_cs, output_sr):
+    """Save a projected array as a raster"""
+    # Float arrays have to have nodata set to some value (-9999)
+    if output_array.dtype == np.float64:
+        output_nodata = -9999
+        output_array[np.isnan(output_array)] = output_nodata
+    output_obj = arcpy.NumPyArrayToRaster(
+        output_array, arcpy.Point(output_extent.XMin, output_extent.YMin),
+        output_cs, output_cs, output_nodata)
+    output_obj.save(output_raster)
+    del output_obj
+    arcpy.DefineProjection_management(output_raster, output_sr)
+    arcpy.CalculateStatistics_management(output_raster)
+
+
+class TileCache():
+    """Shared disk cache of projected source raster tiles
+
+    The output grid is split into square tiles of tile_cells cells that
+    are aligned to the grid snap point, so projects on the same grid
+    (spatial reference, cellsize and snap point) share the tiles where
+    they overlap.  Each tile is saved as a .npy file named by a hash of
+    the source raster, the output grid, the projection method and
+    transformation, and the tile row/column.
+
+    Source rasters are identified by their grid and by the size and
+    modified time of their data files (see source_key) instead of a hash
+    of their values, since reading a national raster would take longer
+    than projecting it.
+
+    Reading a tile updates its modified time and the least recently
+    used tiles are removed when the cache is larger than quota_gb.
+    """
+    def __init__(self, cache_ws, quota_gb=20.0, tile_cells=512):
+        self.cache_ws = cache_ws
+        self.quota_bytes = int(float(quota_gb) * 2 ** 30)
+        self.tile_cells = int(tile_cells)
+        if not os.path.isdir(cache_ws):
+            os.makedirs(cache_ws)
+
+    def source_key(self, input_obj, input_sr):
+        """Hash of a source raster, None if it isn't a file on disk
+
+        ESRI GRID rasters are folders and rewriting a grid doesn't change
+        the size or modified time of the folder, so the data files in
+        the folder (w001001.adf, hdr.adf, ...) are used instead.
+        """
+        try:
+            source_path = input_obj.catalogPath
+            if os.path.isdir(source_path):
+                stat_path_list = [
+                    os.path.join(source_path, item)
+                    for item in sorted(os.listdir(source_path))
+                    if item.lower().endswith('.adf')]
+                if not stat_path_list:
+                    return None
+            else:
+                stat_path_list = [source_path]
+            stat_list = [
+                (os.path.basename(stat_path), os.stat(stat_path))
+                for stat_path in stat_path_list]
+        except (AttributeError, OSError, TypeError):
+            return None
+        input_extent = input_obj.extent
+        return hashlib.md5('\n'.join(
+            [os.path.abspath(source_path)] +
+            ['{0} {1} {2!r}'.format(
+                stat_name, stat_obj.st_size, stat_obj.st_mtime)
+             for stat_name, stat_obj in stat_list] +
+            [input_sr.exportToString(), extent_string(input_extent),
+             repr(input_obj.meanCellWidth),
+             repr(input_obj.meanCellHeight)])).hexdigest()
+
+    def project(self, input_obj, output_raster, input_sr, output_sr,
+                output_cs, transform_str, proj_method, hru_param):
+        """Build a projected raster from cached tiles
+
+        Missing tiles are projected with a ProjectionPlan for the tile
+        and added to the cache.
+
+        Returns:
+            bool: False if the input raster can't be cached
+        """
+        source_key = self.source_key(input_obj, input_sr)
+        if source_key is None:
+            return False
+        proj_method = proj_method.upper()
+        output_cs = float(output_cs)
+        output_extent = projection_output_extent(hru_param, output_cs)
+        output_rows = int(round(output_extent.height / output_cs))
+        output_cols = int(round(output_extent.width / output_cs))
+
+        # Cells are counted up/right from the snap point
+        snap_x = round(output_extent.XMin % output_cs, 6) % output_cs
+        snap_y = round(output_extent.YMin % output_cs, 6) % output_cs
+        col_0 = int(round((output_extent.XMin - snap_x) / output_cs))
+        row_0 = int(round((output_extent.YMin - snap_y) / output_cs))
+        tile_n = self.tile_cells
+        tile_size = tile_n * output_cs
+        key_str = '\n'.join([
+            source_key, output_sr.exportToString(), repr(output_cs),
+            repr(snap_x), repr(snap_y), proj_method, str(transform_str),
+            str(tile_n)])
+
+        output_array = None
+        tile_count, build_count = 0, 0
+        for tile_row in xrange(
+                row_0 // tile_n, (row_0 + output_rows - 1) // tile_n + 1):
+            for tile_col in xrange(
+                    col_0 // tile_n, (col_0 + output_cols - 1) // tile_n + 1):
+                tile_key = hashlib.md5('{0}\n{1} {2}'.format(
+                    key_str, tile_row, tile_col)).hexdigest()
+                tile_array = self.get(tile_key)
+                if tile_array is None:
+                    tile_extent = arcpy.Extent(
+                        snap_x + tile_col * tile_size,
+                        snap_y + tile_row * tile_size,
+                        snap_x + (tile_col + 1) * tile_size,
+                        snap_y + (tile_row + 1) * tile_size)
+                    tile_plan = ProjectionPlan(
+                        input_obj, input_sr, output_sr, output_cs,
+                        transform_str, hru_param, output_extent=tile_extent)
+                    tile_array = tile_plan.resample(input_obj, proj_method)[0]
+                    self.put(tile_key, tile_array)
+                    del tile_plan, tile_extent
+                    build_count += 1
+                tile_count += 1
+                if output_array is None:
+                    output_array = np.empty(
+                        (output_rows, output_cols), dtype=tile_array.dtype)
+
+                # Copy the overlap, array rows are counted from the top
+                col_i = max(col_0, tile_col * tile_n)
+                col_j = min(col_0 + output_cols, (tile_col + 1) * tile_n)
+                row_i = max(row_0, tile_row * tile_n)
+                row_j = min(row_0 + output_rows, (tile_row + 1) * tile_n)
+                output_top = row_0 + output_rows
+                tile_top = (tile_row + 1) * tile_n
+                output_array[
+                    output_top - row_j:output_top - row_i,
+                    col_i - col_0:col_j - col_0] = tile_array[
+                        tile_top - row_j:tile_top - row_i,
+                        col_i - tile_col * tile_n:col_j - tile_col * tile_n]
+                del tile_array
+        logging.debug('  Cached tiles: {0} ({1} projected)'.format(
+            tile_count, build_count))
+
+        save_projected_raster(
+            output_array, projection_nodata(input_obj, output_array.dtype),
+            output_raster, output_extent, output_cs, output_sr)
+        del output_array
+        if build_count:
+            self.evict()
+        return True
+
+    def tile_path(self, tile_key):
+        """"""
+        return os.path.join(self.cache_ws, tile_key + '.npy')
+
+    def get(self, tile_key):
+        """Load a tile and mark it as recently used, None if missing"""
+        try:
+            tile_array = np.load(self.tile_path(tile_key))
+            os.utime(self.tile_path(tile_key), None)
+        except (IOError, OSError, ValueError):
+            return None
+        return tile_array
+
+    def put(self, tile_key, tile_array):
+        """Save a tile
+
+        Tiles are written to a temporary file and renamed, since other
+        processes (i.e. batch_run.py workers) may be reading the cache.
+        """
+        temp_path = os.path.join(
+            self.cache_ws, '{0}_{1}.tmp'.format(tile_key, os.getpid()))
+        with open(temp_path, 'wb') as temp_f:
+            np.save(temp_f, tile_array)
+        try:
+            os.rename(temp_path, self.tile_path(tile_key))
+        except OSError:
+            # Another process already saved the tile
+            os.remove(temp_path)
+
+    def evict(self):
+        """Remove the least recently used tiles until under the quota"""
+        tile_list = []
+        for item in os.listdir(self.cache_ws):
+            if not item.endswith('.npy'):
+                continue
+            try:
+                item_stat = os.stat(os.path.join(self.cache_ws, item))
+            except OSError:
+                continue
+            tile_list.append((item_stat.st_mtime, item_stat.st_size, item))
+        cache_bytes = sum(tile[1] for tile in tile_list)
+        remove_count = 0
+        for tile_mtime, tile_bytes, item in sorted(tile_list):
+            if cache_bytes <= self.quota_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_ws, item))
+            except OSError:
+                continue
+            cache_bytes -= tile_bytes
+            remove_count += 1
+        if remove_count:
+            logging.debug('  Removed {0} tiles from the cache'.format(
+                remove_count))
 
 
 def cell_area_func(hru_param_path, area_field):
@@ -1322,7 +3150,8 @@ def cell_area_func(hru_param_path, area_field):
 
 def zone_by_area_func(zone_path, zone_field, zone_value, hru_param_path,
                       hru_param, hru_area_field='HRU_AREA',
-                      zone_area_field=None, area_pct=50):
+                      zone_area_field=None, area_pct=50,
+                      zone_area_table=None):
     """Flag cells that are inside a feature based on an area weighting
 
     Set values that are in zone, but don't reset values that are out of zone
@@ -1336,83 +3165,272 @@ def zone_by_area_func(zone_path, zone_field, zone_value, hru_param_path,
         hru_area_field (str):
         zone_area_field (str):
         area_pct ():
+        zone_area_table (:class:`numpy.array`): HRU/zone overlap areas
+            from zone_area_table_func.  Pass the same table to each call
+            with the same zones so the overlaps are only computed once.
 
     Returns:
         None
     """
-    zone_value_field = 'ZONE_VALUE'
-    int_area_field = 'INT_AREA'
-    int_pct_field = 'INT_PCT'
-    # Need to set zone value into a field before intersect
-    # If zone_value is FID, add 1 so that only non-lake cells are 0
-    arcpy.AddField_management(zone_path, zone_value_field, 'LONG')
-    arcpy.AddField_management(zone_path, int_area_field, 'DOUBLE')
-    arcpy.AddField_management(zone_path, int_pct_field, 'DOUBLE')
-    if zone_value == arcpy.Describe(zone_path).OIDFieldName:
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field,
-            '!{0}! + 1'.format(zone_value), 'PYTHON')
+    logging.debug('\nzone_by_area_func')
+    logging.debug('  {}'.format(zone_path))
+    if zone_area_table is None:
+        zone_area_table = zone_area_table_func(
+            zone_path, hru_param_path, hru_param, hru_area_field)
 
-    # If zone value is an INT, save it into a field first
+    # Zone value of each zone feature
+    # If zone_value is FID, add 1 so that only non-lake cells are 0
+    zone_oid_field = arcpy.Describe(zone_path).OIDFieldName
+    if zone_value == zone_oid_field:
+        zone_value_dict = dict(
+            (int(oid), int(oid) + 1)
+            for oid in zone_area_table['ZONE_FID'].tolist())
     elif type(zone_value) is int:
-        # zone_value = int(zone_value)
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field, zone_value, 'PYTHON')
-    # Use zone_value field directly
+        zone_value_dict = defaultdict(lambda: zone_value)
     else:
-        # zone_value_field = zone_value
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field,
-            '!{0}!'.format(zone_value), 'PYTHON')
+        fields = ['OID@', zone_value]
+        with arcpy.da.SearchCursor(zone_path, fields) as s_cursor:
+            zone_value_dict = dict((int(row[0]), row[1]) for row in s_cursor)
+
+    # Table is sorted by zone, so later zones overwrite earlier ones
+    hru_cell_dict = dict()
+    pct_mask = zone_area_table['INT_PCT'] >= area_pct
+    for hru_fid, zone_fid, int_area in zip(
+            zone_area_table['HRU_FID'][pct_mask].tolist(),
+            zone_area_table['ZONE_FID'][pct_mask].tolist(),
+            zone_area_table['INT_AREA'][pct_mask].tolist()):
+        hru_cell_dict[hru_fid] = [zone_value_dict[zone_fid], int_area]
+    logging.debug('    HRUs in zone: {0}'.format(len(hru_cell_dict)))
+
+    # Set value of selected HRU cells
+    fields = [hru_param.fid_field, zone_field]
+    if zone_area_field:
+        fields.append(zone_area_field)
+    with arcpy.da.UpdateCursor(hru_param_path, fields) as u_cursor:
+        for row in u_cursor:
+            try:
+                if len(fields) == 3:
+                    row[1], row[2] = hru_cell_dict[int(row[0])]
+                elif len(fields) == 2:
+                    row[1] = hru_cell_dict[int(row[0])][0]
+                u_cursor.updateRow(row)
+            except KeyError:
+                pass
+    del hru_cell_dict
+
+
+def zone_area_table_func(zone_path, hru_param_path, hru_param,
+                         hru_area_field='HRU_AREA'):
+    """Intersection area of each HRU cell with each zone polygon
 
-    # Calculate area of HRU cell if necessary
-    # if not arcpy.ListFields(zone_path, area_field):
-    #    arcpy.AddField_management(zone_path, area_field, 'DOUBLE')
-    #    cell_area_func(zone_path, area_field)
-
-    # Intersect the zone layer with the HRU
-    # zone_int_path = os.path.join('in_memory', 'hru_lakes')
-    zone_int_path = zone_path.replace('.shp', '_intersect.shp')
-    arcpy.Intersect_analysis(
-        (hru_param_path, zone_path), zone_int_path)
-
-    # Calculate using cell_area_func to force units to match
-    cell_area_func(zone_int_path, int_area_field)
-
-    n = int(arcpy.GetCount_management(zone_int_path).getOutput(0))
-    block_size = 200000
-    for i, x in enumerate(range(0, n, block_size)):
-        logging.debug('    FIDS: {0}-{1}'.format(x, x + block_size))
-        subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
-            hru_param.fid_field, x, x + block_size)
-            # arcpy.Describe(zone_int_path).OIDFieldName, x, x + block_size)
-
-        # Read in FID of selected cells
-        hru_cell_dict = dict()
-        fields = [
-            hru_param.fid_field, hru_area_field,
-            int_area_field, zone_value_field]
-        with arcpy.da.SearchCursor(zone_int_path, fields, subset_str) as s_cursor:
+    HRU/zone pairs are found with a bounding box grid index.  The overlap
+    area of rectangular HRU cells is computed directly from the zone
+    polygon edges (rectangle_overlap_area).  Any other HRU shape falls
+    back to intersecting the geometries.
+
+    Args:
+        zone_path (str):
+        hru_param_path (str):
+        hru_param: class:`support_functions.HRUParameters`
+        hru_area_field (str):
+
+    Returns:
+        :class:`numpy.array`: structured array of HRU_FID, ZONE_FID,
+            INT_AREA (acres), and INT_PCT (percent of HRU area),
+            sorted by ZONE_FID
+    """
+    logging.debug('\nzone_area_table_func')
+    acres_per_unit = hru_param.sr.metersPerUnit ** 2 / 4046.8564224
+    table_dtype = [
+        ('HRU_FID', np.int64), ('ZONE_FID', np.int64),
+        ('INT_AREA', np.float64), ('INT_PCT', np.float64)]
+
+    # Zone polygons in the HRU spatial reference
+    zone_fid_list, zone_geom_list, edge_list = [], [], []
+    with arcpy.da.SearchCursor(
+            zone_path, ['OID@', 'SHAPE@'],
+            spatial_reference=hru_param.sr) as s_cursor:
+        for row in s_cursor:
+            if row[1] is None:
+                continue
+            edge_array = polygon_edge_func(row[1])
+            if not edge_array.shape[0]:
+                continue
+            zone_fid_list.append(int(row[0]))
+            zone_geom_list.append(row[1])
+            edge_list.append(edge_array)
+    logging.debug('  Zone polygons: {0}'.format(len(edge_list)))
+    if not edge_list:
+        return np.zeros(0, dtype=table_dtype)
+    zone_bbox = np.array([polygon_bbox_func(e) for e in edge_list])
+
+    # HRU cell extents from the polygon vertices
+    # A cell is a rectangle if it has exactly 4 distinct vertices and all
+    #   of its vertices are on the extent corners (a right triangle also
+    #   has all of its vertices on the corners)
+    vertex_array = arcpy.da.FeatureClassToNumPyArray(
+        hru_param_path, [hru_param.fid_field, 'SHAPE@X', 'SHAPE@Y'],
+        explode_to_points=True)
+    vertex_fid = vertex_array[hru_param.fid_field].astype(np.int64)
+    vertex_x = vertex_array['SHAPE@X'].astype(np.float64)
+    vertex_y = vertex_array['SHAPE@Y'].astype(np.float64)
+    del vertex_array
+    vertex_order = np.argsort(vertex_fid, kind='mergesort')
+    vertex_fid = vertex_fid[vertex_order]
+    vertex_x, vertex_y = vertex_x[vertex_order], vertex_y[vertex_order]
+    del vertex_order
+    hru_start = np.where(np.diff(np.concatenate(([-1], vertex_fid))))[0]
+    hru_fid = vertex_fid[hru_start]
+    hru_bbox = np.column_stack((
+        np.minimum.reduceat(vertex_x, hru_start),
+        np.minimum.reduceat(vertex_y, hru_start),
+        np.maximum.reduceat(vertex_x, hru_start),
+        np.maximum.reduceat(vertex_y, hru_start)))
+    vertex_hru = np.repeat(
+        np.arange(hru_fid.size), np.diff(np.append(hru_start, vertex_fid.size)))
+    corner_mask = (
+        ((vertex_x == hru_bbox[vertex_hru, 0]) |
+         (vertex_x == hru_bbox[vertex_hru, 2])) &
+        ((vertex_y == hru_bbox[vertex_hru, 1]) |
+         (vertex_y == hru_bbox[vertex_hru, 3])))
+    hru_rect_mask = np.logical_and.reduceat(corner_mask, hru_start)
+    distinct_order = np.lexsort((vertex_y, vertex_x, vertex_hru))
+    distinct_mask = np.ones(distinct_order.size, dtype=np.bool)
+    distinct_mask[1:] = (
+        (np.diff(vertex_hru[distinct_order]) != 0) |
+        (np.diff(vertex_x[distinct_order]) != 0) |
+        (np.diff(vertex_y[distinct_order]) != 0))
+    hru_rect_mask &= np.bincount(
+        vertex_hru[distinct_order][distinct_mask],
+        minlength=hru_fid.size) == 4
+    del distinct_order, distinct_mask
+    del vertex_fid, vertex_x, vertex_y, vertex_hru, corner_mask, hru_start
+
+    # Candidate HRU/zone pairs from the bounding box index
+    pair_hru, pair_zone = bbox_grid_pairs(hru_bbox, zone_bbox)
+    logging.debug('  Candidate HRU/zone pairs: {0}'.format(pair_hru.size))
+    pair_area = np.zeros(pair_hru.size, dtype=np.float64)
+
+    # Rectangular cells are grouped by zone and row so that only the
+    # zone edges in the y range of the row are used
+    rect_i = np.where(hru_rect_mask[pair_hru])[0]
+    rect_order = np.lexsort((
+        hru_bbox[pair_hru[rect_i], 3], hru_bbox[pair_hru[rect_i], 1],
+        pair_zone[rect_i]))
+    rect_i = rect_i[rect_order]
+    group_key = np.column_stack((
+        pair_zone[rect_i], hru_bbox[pair_hru[rect_i], 1],
+        hru_bbox[pair_hru[rect_i], 3]))
+    group_start = np.where(np.any(
+        np.diff(group_key, axis=0) != 0, axis=1))[0] + 1
+    group_bounds = np.concatenate(([0], group_start, [rect_i.size]))
+    for start, stop in zip(group_bounds[:-1], group_bounds[1:]):
+        if start == stop:
+            continue
+        group_i = rect_i[start:stop]
+        edge_array = edge_list[pair_zone[group_i[0]]]
+        row_ymin, row_ymax = group_key[start, 1], group_key[start, 2]
+        edge_array = edge_array[
+            (np.maximum(edge_array[:, 1], edge_array[:, 3]) > row_ymin) &
+            (np.minimum(edge_array[:, 1], edge_array[:, 3]) < row_ymax)]
+        pair_area[group_i] = rectangle_overlap_area(
+            edge_array, hru_bbox[pair_hru[group_i]]) * acres_per_unit
+    del rect_i, rect_order, group_key, group_bounds
+
+    # Fall back on the geometry intersection for all other cells
+    other_i = np.where(~hru_rect_mask[pair_hru])[0]
+    if other_i.size:
+        logging.debug('  Non-rectangular HRU pairs: {0}'.format(other_i.size))
+        other_fid_set = set(hru_fid[pair_hru[other_i]].tolist())
+        hru_geom_dict = dict()
+        fields = [hru_param.fid_field, 'SHAPE@']
+        with arcpy.da.SearchCursor(hru_param_path, fields) as s_cursor:
             for row in s_cursor:
-                if (100 * float(row[2]) / float(row[1])) >= area_pct:
-                    hru_cell_dict[int(row[0])] = [float(row[3]), float(row[2])]
-
-        # Set value of selected HRU cells
-        fields = [hru_param.fid_field, zone_field]
-        if zone_area_field:
-            fields.append(zone_area_field)
-        with arcpy.da.UpdateCursor(hru_param_path, fields, subset_str) as u_cursor:
-            for row in u_cursor:
-                # Remove items to speed up subsequent searches
-                try:
-                    if len(fields) == 3:
-                        row[1], row[2] = hru_cell_dict.pop(int(row[0]))
-                    elif len(fields) == 2:
-                        row[1] = hru_cell_dict.pop(int(row[0]))
-                    u_cursor.updateRow(row)
-                except KeyError:
-                    pass
-        del hru_cell_dict
+                if int(row[0]) in other_fid_set:
+                    hru_geom_dict[int(row[0])] = row[1]
+        for i in other_i.tolist():
+            int_geom = hru_geom_dict[int(hru_fid[pair_hru[i]])].intersect(
+                zone_geom_list[pair_zone[i]], 4)
+            pair_area[i] = int_geom.getArea('PLANAR', 'ACRES')
+        del hru_geom_dict
+
+    # HRU area is read from the HRU area field (acres)
+    hru_area_dict = dict()
+    fields = [hru_param.fid_field, hru_area_field]
+    with arcpy.da.SearchCursor(hru_param_path, fields) as s_cursor:
+        for row in s_cursor:
+            hru_area_dict[int(row[0])] = float(row[1])
+
+    area_mask = pair_area > 0
+    zone_area_table = np.zeros(int(area_mask.sum()), dtype=table_dtype)
+    zone_area_table['HRU_FID'] = hru_fid[pair_hru[area_mask]]
+    zone_area_table['ZONE_FID'] = np.array(
+        zone_fid_list, dtype=np.int64)[pair_zone[area_mask]]
+    zone_area_table['INT_AREA'] = pair_area[area_mask]
+    hru_area_array = np.array([
+        hru_area_dict[fid]
+        for fid in zone_area_table['HRU_FID'].tolist()], dtype=np.float64)
+    zone_area_table['INT_PCT'] = np.where(
+        hru_area_array > 0,
+        100 * zone_area_table['INT_AREA'] / np.maximum(hru_area_array, 1E-12),
+        0)
+    logging.debug('  HRU/zone overlaps: {0}'.format(zone_area_table.size))
+    return zone_area_table[np.argsort(
+        zone_area_table['ZONE_FID'], kind='mergesort')]
+
+
+def rectangle_overlap_area(edge_array, rect_array, max_pairs=2**22):
+    """Area of a polygon inside each of a set of axis aligned rectangles
+
+    The area is the boundary integral of x dy, with x clipped to the
+    rectangle columns and y clipped to the rectangle rows.  Along each
+    edge the clipped x is piecewise linear, so the integral is exact.
+
+    Args:
+        edge_array (:class:`numpy.array`): (n, 4) array of x0, y0, x1, y1
+        rect_array (:class:`numpy.array`): (m, 4) array of
+            xmin, ymin, xmax, ymax
+        max_pairs (int): maximum number of rectangle/edge pairs per chunk
+
+    Returns:
+        :class:`numpy.array`: overlap area of each rectangle
+    """
+    area_array = np.zeros(rect_array.shape[0], dtype=np.float64)
+    if not edge_array.shape[0] or not rect_array.shape[0]:
+        return area_array
+    xa, ya, xb, yb = [edge_array[:, i][np.newaxis, :] for i in range(4)]
+    dx, dy = xb - xa, yb - ya
+    flat_mask = dy == 0
+    dy = np.where(flat_mask, 1, dy)
+    chunk_rows = max(1, max_pairs // edge_array.shape[0])
+    for i in xrange(0, rect_array.shape[0], chunk_rows):
+        rect_xmin, rect_ymin, rect_xmax, rect_ymax = [
+            rect_array[i:i + chunk_rows, j][:, np.newaxis] for j in range(4)]
+        width = rect_xmax - rect_xmin
+
+        # Part of each edge inside the rectangle rows
+        t0 = (rect_ymin - ya) / dy
+        t1 = (rect_ymax - ya) / dy
+        t_lo = np.clip(np.minimum(t0, t1), 0, 1)
+        t_hi = np.clip(np.maximum(t0, t1), 0, 1)
+        del t0, t1
+        dy_clip = np.where(flat_mask, 0, (t_hi - t_lo) * dy)
+        u0 = xa + t_lo * dx - rect_xmin
+        u1 = xa + t_hi * dx - rect_xmin
+        del t_lo, t_hi
+
+        # Mean of the clipped x along the edge from its antiderivative
+        s0 = np.clip(u0, 0, width)
+        s1 = np.clip(u1, 0, width)
+        g0 = 0.5 * s0 * s0 + width * np.maximum(u0 - width, 0)
+        g1 = 0.5 * s1 * s1 + width * np.maximum(u1 - width, 0)
+        du = u1 - u0
+        slope_mask = np.abs(du) > 1E-9 * width
+        x_mean = np.where(
+            slope_mask, (g1 - g0) / np.where(slope_mask, du, 1),
+            0.5 * (s0 + s1))
+        area_array[i:i + chunk_rows] = np.abs(np.sum(x_mean * dy_clip, axis=1))
+    return area_array
 
 
 def zone_by_centroid_func(zone_path, zone_field, zone_value,
@@ -1434,7 +3452,8 @@ def zone_by_centroid_func(zone_path, zone_field, zone_value,
     """
     logging.debug('\nzone_by_centroid_func')
     logging.debug('  {}'.format(zone_path))
-    # Need to set zone value into a field before intersect
+    # Need to set zone value into a field before reading the zones
+    # ZONE_VALUE is also read back by ppt_ratio_parameters
     # If zone_value is FID, add 1 so that only zone cells are 0
     zone_value_field = 'ZONE_VALUE'
     arcpy.AddField_management(zone_path, zone_value_field, 'LONG')
@@ -1457,47 +3476,266 @@ def zone_by_centroid_func(zone_path, zone_field, zone_value,
         # Use zone_value field directly
         # zone_value_field = zone_value
 
-    # Intersect the zone layer with the HRU
-    # zone_int_path = os.path.join('in_memory', 'hru_ppt_zones')
-    zone_int_path = zone_path.replace('.shp', '_intersect.shp')
-    arcpy.Intersect_analysis(
-        (hru_point_path, zone_path), zone_int_path)
-
-    # DEADBEEF - Why do I make a layer and select all features?
-    zone_int_layer = 'zone_int_layer'
-    arcpy.MakeFeatureLayer_management(zone_int_path, zone_int_layer)
-    arcpy.SelectLayerByAttribute_management(zone_int_layer, 'CLEAR_SELECTION')
-    arcpy.SelectLayerByAttribute_management(zone_int_layer, 'SWITCH_SELECTION')
-
-    n = int(arcpy.GetCount_management(zone_int_layer).getOutput(0))
-    block_size = 200000
-    for i, x in enumerate(range(0, n, block_size)):
-        logging.debug('    FIDS: {0}-{1}'.format(x, x + block_size))
-        subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
-            hru_param.fid_field, x, x + block_size)
-            # arcpy.Describe(zone_int_layer).OIDFieldName, x, x + block_size)
-
-        # Read in FID of selected cells
-        hru_point_dict = dict()
-        fields = (hru_param.fid_field, zone_value_field)
-        with arcpy.da.SearchCursor(zone_int_layer, fields, subset_str) as s_cursor:
-            for row in s_cursor:
-                hru_point_dict[int(row[0])] = row[1]
+    # Read the zone polygon edges in the HRU spatial reference
+    edge_list = []
+    zone_value_list = []
+    fields = ['SHAPE@', zone_value_field]
+    with arcpy.da.SearchCursor(
+            zone_path, fields, spatial_reference=hru_param.sr) as s_cursor:
+        for row in s_cursor:
+            if row[0] is None:
+                continue
+            edge_list.append(polygon_edge_func(row[0]))
+            zone_value_list.append(row[1])
+    logging.debug('    Zone polygons: {0}'.format(len(edge_list)))
+
+    # Test all HRU centroids at once
+    fields = [hru_param.fid_field, 'SHAPE@X', 'SHAPE@Y']
+    point_array = arcpy.da.FeatureClassToNumPyArray(
+        hru_point_path, fields, spatial_reference=hru_param.sr)
+    zone_index = points_in_polygons_func(
+        point_array['SHAPE@X'], point_array['SHAPE@Y'], edge_list)
+    in_zone_mask = zone_index >= 0
+    hru_point_dict = dict(zip(
+        point_array[hru_param.fid_field][in_zone_mask].tolist(),
+        [zone_value_list[i] for i in zone_index[in_zone_mask]]))
+    logging.debug('    Centroids in zone: {0}'.format(len(hru_point_dict)))
+    del point_array, zone_index, in_zone_mask, edge_list
+
+    # Set value of selected HRU cells
+    fields = (hru_param.fid_field, zone_field)
+    with arcpy.da.UpdateCursor(hru_param_path, fields) as u_cursor:
+        for row in u_cursor:
+            try:
+                row[1] = hru_point_dict[int(row[0])]
+                u_cursor.updateRow(row)
+            except KeyError:
+                pass
+    del hru_point_dict
 
-        # Set value of selected HRU cells
-        fields = (hru_param.fid_field, zone_field)
-        with arcpy.da.UpdateCursor(hru_param_path, fields, subset_str) as u_cursor:
-            for row in u_cursor:
-                # Remove items to speed up subsequent searches
-                try:
-                    row[1] = hru_point_dict.pop(int(row[0]))
-                    u_cursor.updateRow(row)
-                except KeyError:
-                    pass
-        del hru_point_dict
 
-    # Cleanup
-    arcpy.Delete_management(zone_int_layer)
+def polygon_edge_func(polygon_geom):
+    """Edge coordinates of all rings in a polygon geometry
+
+    Interior rings follow a None separator in the part array.
+    Holes are handled by the even-odd rule in point_in_polygon_func,
+    so all rings of a polygon can be stacked together.
+
+    Args:
+        polygon_geom (:class:`arcpy.Polygon`):
+
+    Returns:
+        :class:`numpy.array`: (n, 4) array of x0, y0, x1, y1
+    """
+    edge_list = []
+    for part in polygon_geom:
+        ring_list = [[]]
+        for pnt in part:
+            if pnt is None:
+                ring_list.append([])
+            else:
+                ring_list[-1].append((pnt.X, pnt.Y))
+        for ring in ring_list:
+            if len(ring) < 3:
+                continue
+            ring_array = np.array(ring, dtype=np.float64)
+            if np.any(ring_array[0] != ring_array[-1]):
+                ring_array = np.vstack((ring_array, ring_array[:1]))
+            edge_list.append(np.hstack((ring_array[:-1], ring_array[1:])))
+    if not edge_list:
+        return np.empty((0, 4), dtype=np.float64)
+    return np.vstack(edge_list)
+
+
+def point_in_polygon_func(x_array, y_array, edge_array, max_pairs=2**22):
+    """Crossing number test of many points against one polygon
+
+    Points are sorted by y so the points in the half open y range of each
+    edge are found with searchsorted.  Only those point/edge pairs are
+    tested, and they are built max_pairs at a time.
+
+    Args:
+        x_array (:class:`numpy.array`):
+        y_array (:class:`numpy.array`):
+        edge_array (:class:`numpy.array`): (n, 4) array of x0, y0, x1, y1
+        max_pairs (int): maximum number of point/edge pairs per chunk
+
+    Returns:
+        :class:`numpy.array`: boolean array, True if point is inside
+    """
+    point_count = x_array.size
+    crossings = np.zeros(point_count, dtype=np.int64)
+    if not point_count or not edge_array.shape[0]:
+        return crossings.astype(np.bool)
+    y_order = np.argsort(y_array, kind='mergesort')
+    y_sorted = y_array[y_order]
+    x0, y0, x1, y1 = [edge_array[:, i] for i in range(4)]
+
+    # A point is in the y range of an edge if y0 <= y < y1
+    # Horizontal edges have no points in range
+    lo = np.searchsorted(y_sorted, np.minimum(y0, y1), 'left')
+    hi = np.searchsorted(y_sorted, np.maximum(y0, y1), 'left')
+    pair_count = hi - lo
+    pair_cumsum = np.cumsum(pair_count)
+
+    start = 0
+    while start < edge_array.shape[0]:
+        pair_offset = pair_cumsum[start] - pair_count[start]
+        stop = int(np.searchsorted(
+            pair_cumsum, pair_offset + max_pairs, 'right'))
+        stop = max(stop, start + 1)
+        chunk_count = pair_count[start:stop]
+        total = int(chunk_count.sum())
+        if total:
+            edge_i = np.repeat(np.arange(start, stop), chunk_count)
+            sorted_i = (
+                np.arange(total) -
+                np.repeat(np.cumsum(chunk_count) - chunk_count, chunk_count) +
+                np.repeat(lo[start:stop], chunk_count))
+            point_i = y_order[sorted_i]
+            py = y_array[point_i]
+            x_int = x0[edge_i] + (
+                (py - y0[edge_i]) * (x1[edge_i] - x0[edge_i]) /
+                (y1[edge_i] - y0[edge_i]))
+            crossings += np.bincount(
+                point_i[x_array[point_i] < x_int], minlength=point_count)
+        start = stop
+    return (crossings % 2) == 1
+
+
+def polygon_bbox_func(edge_array):
+    """Bounding box (xmin, ymin, xmax, ymax) of polygon edges"""
+    return [
+        edge_array[:, [0, 2]].min(), edge_array[:, [1, 3]].min(),
+        edge_array[:, [0, 2]].max(), edge_array[:, [1, 3]].max()]
+
+
+def bbox_grid_pairs(query_bbox, index_bbox):
+    """Pairs of overlapping bounding boxes from a uniform grid index
+
+    The index boxes are binned into a uniform grid over their extent.
+    Each query box is only compared to the index boxes in the grid
+    cells it touches.
+
+    Args:
+        query_bbox (:class:`numpy.array`): (n, 4) array of
+            xmin, ymin, xmax, ymax
+        index_bbox (:class:`numpy.array`): (m, 4) array of
+            xmin, ymin, xmax, ymax
+
+    Returns:
+        tuple: query and index box indices of each overlapping pair,
+            sorted by query index
+    """
+    query_bbox = np.asarray(query_bbox, dtype=np.float64).reshape(-1, 4)
+    index_bbox = np.asarray(index_bbox, dtype=np.float64).reshape(-1, 4)
+    if not query_bbox.shape[0] or not index_bbox.shape[0]:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    grid_xmin, grid_ymin = index_bbox[:, :2].min(axis=0)
+    grid_xmax, grid_ymax = index_bbox[:, 2:].max(axis=0)
+    grid_n = 2 * int(math.ceil(math.sqrt(index_bbox.shape[0])))
+    cell_w = (grid_xmax - grid_xmin) / grid_n or 1.0
+    cell_h = (grid_ymax - grid_ymin) / grid_n or 1.0
+
+    def grid_ranges(bbox):
+        col_min, row_min, col_max, row_max = [
+            np.clip(np.floor((bbox[:, i] - origin) / size), 0, grid_n - 1)
+            .astype(np.int64)
+            for i, origin, size in [
+                (0, grid_xmin, cell_w), (1, grid_ymin, cell_h),
+                (2, grid_xmin, cell_w), (3, grid_ymin, cell_h)]]
+        return col_min, row_min, col_max, row_max
+
+    def grid_cells(bbox):
+        """Grid cell of each cell/box pair, with the box index"""
+        col_min, row_min, col_max, row_max = grid_ranges(bbox)
+        col_count = col_max - col_min + 1
+        cell_count = col_count * (row_max - row_min + 1)
+        box_i = np.repeat(np.arange(bbox.shape[0]), cell_count)
+        k = np.arange(box_i.size) - np.repeat(
+            np.cumsum(cell_count) - cell_count, cell_count)
+        cells = (
+            (row_min[box_i] + k // col_count[box_i]) * grid_n +
+            col_min[box_i] + k % col_count[box_i])
+        return cells, box_i
+
+    # Register each index box in every grid cell it touches
+    cell_array, cell_index = grid_cells(index_bbox)
+    cell_order = np.argsort(cell_array, kind='mergesort')
+    cell_index = cell_index[cell_order]
+    cell_count = np.bincount(cell_array, minlength=grid_n * grid_n)
+    cell_start = np.cumsum(cell_count) - cell_count
+    del cell_array, cell_order
+
+    # Only query boxes that overlap the grid
+    query_i = np.where(
+        (query_bbox[:, 2] >= grid_xmin) & (query_bbox[:, 0] <= grid_xmax) &
+        (query_bbox[:, 3] >= grid_ymin) & (query_bbox[:, 1] <= grid_ymax))[0]
+    query_cell, query_box = grid_cells(query_bbox[query_i])
+    query_box = query_i[query_box]
+    candidate_count = cell_count[query_cell]
+    pair_query = np.repeat(query_box, candidate_count)
+    pair_index = cell_index[
+        np.repeat(cell_start[query_cell], candidate_count) +
+        np.arange(pair_query.size) -
+        np.repeat(np.cumsum(candidate_count) - candidate_count,
+                  candidate_count)]
+    del query_i, query_cell, query_box, candidate_count
+
+    # Keep overlapping boxes and remove pairs found in more than one cell
+    overlap_mask = (
+        (query_bbox[pair_query, 0] <= index_bbox[pair_index, 2]) &
+        (query_bbox[pair_query, 2] >= index_bbox[pair_index, 0]) &
+        (query_bbox[pair_query, 1] <= index_bbox[pair_index, 3]) &
+        (query_bbox[pair_query, 3] >= index_bbox[pair_index, 1]))
+    pair_key = np.unique(
+        pair_query[overlap_mask] * index_bbox.shape[0] +
+        pair_index[overlap_mask])
+    return pair_key // index_bbox.shape[0], pair_key % index_bbox.shape[0]
+
+
+def points_in_polygons_func(x_array, y_array, edge_list, max_pairs=2**22):
+    """Index of the polygon that contains each point
+
+    Points are only tested against the polygons whose bounding box
+    contains the point (bbox_grid_pairs).
+    If polygons overlap, the last one is kept.
+
+    Args:
+        x_array (:class:`numpy.array`):
+        y_array (:class:`numpy.array`):
+        edge_list (list): edge arrays from polygon_edge_func
+        max_pairs (int): maximum number of point/edge pairs per chunk
+
+    Returns:
+        :class:`numpy.array`: polygon index of each point (-1 if none)
+    """
+    x_array = np.asarray(x_array, dtype=np.float64)
+    y_array = np.asarray(y_array, dtype=np.float64)
+    poly_index = np.empty(x_array.size, dtype=np.int64)
+    poly_index.fill(-1)
+    poly_list = [i for i, e in enumerate(edge_list) if e.shape[0]]
+    if not poly_list or not x_array.size:
+        return poly_index
+
+    # Candidate point/polygon pairs
+    pair_point, pair_poly = bbox_grid_pairs(
+        np.column_stack((x_array, y_array, x_array, y_array)),
+        np.array([polygon_bbox_func(edge_list[i]) for i in poly_list]))
+
+    # Crossing number test of the candidate points for each polygon
+    pair_order = np.argsort(pair_poly, kind='mergesort')
+    pair_point, pair_poly = pair_point[pair_order], pair_poly[pair_order]
+    poly_bounds = np.searchsorted(pair_poly, np.arange(len(poly_list) + 1))
+    for i, poly_i in enumerate(poly_list):
+        test_point = pair_point[poly_bounds[i]:poly_bounds[i + 1]]
+        if not test_point.size:
+            continue
+        inside_mask = point_in_polygon_func(
+            x_array[test_point], y_array[test_point],
+            edge_list[poly_i], max_pairs)
+        poly_index[test_point[inside_mask]] = poly_i
+    return poly_index
 
 
 def jensen_haise_func(hru_param_path, jh_coef_field, hru_elev_field,
@@ -1516,122 +3754,299 @@ def jensen_haise_func(hru_param_path, jh_coef_field, hru_elev_field,
 
 
 def remap_check(remap_path):
-    """"""
+    """Check that an ASCII remap file exists and compile it
+
+    Invalid, overlapping, and missing ranges are checked when the remap
+    is compiled (see :meth:`Remap.check`).  Since the remaps are applied
+    with NumPy instead of ReclassByASCIIFile, the ArcGIS 10.2 formatting
+    problems (blank lines, final newlines, long comments) no longer
+    matter and the file is not rewritten.
+
+    Returns:
+        :class:`support_functions.Remap`
+    """
     # Check that the file exists
     if not os.path.isfile(remap_path):
         logging.error(
             '\nERROR: ASCII remap file ({0}) does not exist\n'.format(
                 os.path.basename(remap_path)))
         sys.exit()
-
-    # Read in the remap
-    with open(remap_path, 'r') as remap_f:
-        remap_lines = remap_f.readlines()
-        line_count = len(remap_lines)
-
-    # Problems reading/applying ASCII remap files can be caused by:
-    #   Blank lines
-    #   Empty lines at the end (from a final newline character)
-    #   ArcGIS 10.2 - Old style in line comments (/*)
-    #   ArcGIS 10.2 - Comments can't be in first line (?)
-    #   ArcGIS 10.2 - Comments can't be longer than 80 characters (?)
-    # If either of these are present in the file, resave the filtered lines
-
-    # Check for old style comments (/*) in ASCII remap files
-    # This could be changed to save the comments at the end of the file
-    if arcpy.GetInstallInfo()['Version'].startswith('10.2'):
-        if any([l for l in remap_lines if '/*' in l]):
-            logging.error(
-                    ('\nERROR: ASCII remap file ({0}) has pre-ArcGIS 10.2 ' +
-                     'comments (\*)\n  Try running the "convert_remap_arc10p2.py"' +
-                     'script\n').format(os.path.basename(remap_path)))
-            sys.exit()
-
-    # First check for final newline character
-    save_flag = False
-    if remap_lines and remap_lines[-1] and remap_lines[-1].endswith('\n'):
-        logging.debug('  Final newline character')
-        save_flag = True
-
-    # Then remove empty lines and strip white space and newline characters
-    # If lines were removed, resave the filtered remap file
-    remap_lines = [l.strip() for l in remap_lines]
-    remap_lines = [l for l in remap_lines if l]
-    if len(remap_lines) != line_count:
-        logging.debug('  Whitespace or empty lines')
-        save_flag = True
-
-    # Trim comments longer than 80 characters
-    if arcpy.GetInstallInfo()['Version'].startswith('10.2'):
-        if any([len(l) > 80 for l in remap_lines if "#" in l]):
-            remap_lines = [l[:79] if "#" in l else l for l in remap_lines]
-            logging.debug('  Lines longer than 80 characters')
-            save_flag = True
-
-    # If lines were removed, resave the filtered remap file
-    if save_flag:
-        logging.warning(
-            '  The ASCII remap file ({0}) will be overwritten'.format(
-                os.path.basename(remap_path)))
-        with open(remap_path, 'w') as remap_f:
-            for i, line in enumerate(remap_lines):
-                # Don't write newline character on last line
-                # This causes an error in ArcGIS 10.2.2
-                if (i+1) < len(remap_lines):
-                    remap_f.write(line + '\n')
-                else:
-                    remap_f.write(line)
-    return True
+    return Remap(remap_path)
 
 
 #  Remap aspect
 # logging.info('\nRemapping Aspect to HRU_ASPECT')
-# arcpy.CalculateField_management(
-#    polygon_path, hru_aspect_field,
-#    'Reclass(!{0}!)'.format(dem_aspect_field),
-#    'PYTHON', remap_code_block(aspect_remap_path))
+# remap_field_func(
+#    polygon_path, dem_aspect_field, hru_aspect_field, aspect_remap_path)
 # # arcpy.DeleteField_management(polygon_path, dem_aspect_field)
 
 
-def remap_code_block(remap_path):
-    """"""
-    with open(remap_path) as remap_f:
-        lines = remap_f.readlines()
-    remap_cb = ''
-    for l in lines:
-        # Skip comment lines
-        if '#' in l:
-            continue
-        # Remove remap description
-        l = l.strip().split('/*')[0]
-        # Split line on spaces and semi-colon
-        l_split = [item.strip() for item in re.split('[ :]+', l)]
-        # Remap as a range if a min, max and value are all present
-        if len(l_split) == 3:
-            range_remap_flag = True
-        # Otherwise remap directly
-        elif len(l_split) == 2:
-            range_remap_flag = False
-        # Skip lines that don't match format
-        else:
-            continue
-        # Write remap code block
-        if not range_remap_flag:
-            if not remap_cb:
-                remap_cb = ('    if value == {0}: ' +
-                            'return {1}\n'.format(*l_split))
+def remap_field_func(table_path, input_field, output_field, remap_path):
+    """Remap the values of one field into another field
+
+    The input column is read and remapped as a single array instead of
+    evaluating a Reclass() code block for each row with CalculateField.
+    Null input values are written as null.
+
+    Args:
+        table_path (str): feature class or table path
+        input_field (str): field with the values to remap
+        output_field (str): field to write the remapped values to
+        remap_path: ASCII remap file path or a compiled Remap
+
+    Returns:
+        None
+    """
+    if isinstance(remap_path, Remap):
+        remap_obj = remap_path
+    else:
+        remap_obj = remap_check(remap_path)
+    input_array = np.array(
+        [row[0] for row in arcpy.da.SearchCursor(table_path, [input_field])],
+        dtype=np.float64)
+    output_array = remap_array_func(input_array, [remap_obj])[0]
+    if output_array.dtype == np.int32:
+        null_mask = output_array == remap_int_nodata
+    else:
+        null_mask = np.isnan(output_array)
+    output_list = output_array.tolist()
+    with arcpy.da.UpdateCursor(table_path, [output_field]) as u_cursor:
+        for i, row in enumerate(u_cursor):
+            if null_mask[i]:
+                row[0] = None
             else:
-                remap_cb += ('    elif value == {0}: ' +
-                             'return {1}\n'.format(*l_split))
+                row[0] = output_list[i]
+            u_cursor.updateRow(row)
+    del input_array, output_array, output_list, null_mask
+
+
+# Integer nodata value for remapped rasters (ArcGIS 32-bit signed default)
+remap_int_nodata = -2147483648
+
+
+class Remap():
+    """ASCII remap file compiled to NumPy lookups
+
+    Direct lines ("value : output") are applied with a dense lookup array
+    for integer inputs or with searchsorted on the sorted values.
+    Range lines ("min max : output") are applied with searchsorted on the
+    sorted range maximums.  Range maximums are inclusive and minimums are
+    inclusive unless they equal the maximum of the next lower range, so a
+    value on the boundary shared by two ranges is assigned to the lower
+    range.
+    Values that aren't in the remap keep their input value, which is the
+    ReclassByASCIIFile default (missing_values='DATA').
+    """
+    def __init__(self, remap_path, max_lookup_size=2**24):
+        self.remap_path = remap_path
+        self.max_lookup_size = max_lookup_size
+        direct_list, range_list = [], []
+        with open(remap_path) as remap_f:
+            for l in remap_f.readlines():
+                # Skip comment lines
+                if '#' in l:
+                    continue
+                # Remove remap description
+                l = l.strip().split('/*')[0]
+                # Split line on spaces and semi-colon
+                l_split = [
+                    item.strip() for item in re.split('[ :]+', l)
+                    if item.strip()]
+                # Remap as a range if a min, max and value are all present
+                if len(l_split) == 3:
+                    range_list.append(map(float, l_split))
+                # Otherwise remap directly
+                elif len(l_split) == 2:
+                    direct_list.append(map(float, l_split))
+        if not direct_list and not range_list:
+            logging.error(
+                '\nERROR: ASCII remap file ({0}) has no remap lines\n'.format(
+                    os.path.basename(remap_path)))
+            sys.exit()
+
+        # Remap outputs are integers unless a value has a fraction
+        output_values = [l[-1] for l in direct_list + range_list]
+        if all([float(v).is_integer() for v in output_values]):
+            self.dtype = np.int32
         else:
-            if not remap_cb:
-                remap_cb = ('    if (value >= {0} and value <= {1}): ' +
-                            'return {2}\n').format(*l_split)
-            else:
-                remap_cb += ('    elif (value > {0} and value <= {1}): ' +
-                             'return {2}\n').format(*l_split)
-    remap_cb = 'def Reclass(value):\n' + remap_cb
-    return remap_cb
+            self.dtype = np.float64
+
+        direct_array = np.array(direct_list, dtype=np.float64).reshape(-1, 2)
+        direct_array = direct_array[np.argsort(direct_array[:, 0])]
+        self.direct_keys = direct_array[:, 0]
+        self.direct_values = direct_array[:, 1].astype(self.dtype)
+
+        range_array = np.array(range_list, dtype=np.float64).reshape(-1, 3)
+        range_array = range_array[np.argsort(range_array[:, 1])]
+        self.range_min = range_array[:, 0]
+        self.range_max = range_array[:, 1]
+        self.range_values = range_array[:, 2].astype(self.dtype)
+        # Range minimums are inclusive unless shared with the lower range
+        self.range_min_flag = np.ones(self.range_min.shape, dtype=np.bool)
+        self.range_min_flag[1:] = self.range_min[1:] != self.range_max[:-1]
+        self.check()
+
+        # Dense lookup array for integer direct keys
+        self.lookup_min = None
+        if (self.direct_keys.size and
+            np.all(np.mod(self.direct_keys, 1) == 0) and
+            (self.direct_keys[-1] - self.direct_keys[0] <
+             self.max_lookup_size)):
+            self.lookup_min = int(self.direct_keys[0])
+            self.lookup_max = int(self.direct_keys[-1])
+            self.lookup_array = np.arange(
+                self.lookup_min, self.lookup_max + 1).astype(self.dtype)
+            self.lookup_mask = np.zeros(
+                self.lookup_array.shape, dtype=np.bool)
+            lookup_i = self.direct_keys.astype(np.int64) - self.lookup_min
+            self.lookup_array[lookup_i] = self.direct_values
+            self.lookup_mask[lookup_i] = True
+
+    def check(self):
+        """Check for invalid, overlapping, and missing ranges
+
+        Invalid ranges (min > max), overlapping ranges, and direct values
+        that are remapped to different outputs are errors.  Gaps between
+        ranges and direct values inside a range (the direct value is
+        used) are logged as warnings.  Single value ranges (i.e. -1 -1
+        for flat aspect) are lookups, not part of a series of ranges,
+        so the gaps next to them are not warned about.
+        """
+        remap_name = os.path.basename(self.remap_path)
+        invalid_mask = self.range_min > self.range_max
+        if np.any(invalid_mask):
+            logging.error(
+                '\nERROR: ASCII remap file ({0}) has ranges with a '
+                'minimum greater than the maximum'.format(remap_name))
+            for range_min, range_max in zip(
+                    self.range_min[invalid_mask], self.range_max[invalid_mask]):
+                logging.error('  {0} {1}'.format(range_min, range_max))
+            sys.exit()
+
+        # Ranges are sorted by maximum, so an overlap is any range that
+        #   starts before the previous range ends
+        overlap_i = np.nonzero(self.range_min[1:] < self.range_max[:-1])[0]
+        if overlap_i.size:
+            logging.error(
+                '\nERROR: ASCII remap file ({0}) has overlapping '
+                'ranges'.format(remap_name))
+            for i in overlap_i:
+                logging.error('  {0} {1} and {2} {3}'.format(
+                    self.range_min[i], self.range_max[i],
+                    self.range_min[i + 1], self.range_max[i + 1]))
+            sys.exit()
+        single_mask = self.range_min == self.range_max
+        gap_mask = (
+            (self.range_min[1:] > self.range_max[:-1]) &
+            ~single_mask[1:] & ~single_mask[:-1])
+        for i in np.nonzero(gap_mask)[0]:
+            logging.warning(
+                '  {0}: values between {1} and {2} are not remapped'.format(
+                    remap_name, self.range_max[i], self.range_min[i + 1]))
+
+        # Duplicate direct values are only an error if the outputs differ
+        dup_i = np.nonzero(self.direct_keys[1:] == self.direct_keys[:-1])[0]
+        conflict_i = dup_i[
+            self.direct_values[dup_i] != self.direct_values[dup_i + 1]]
+        if conflict_i.size:
+            logging.error(
+                '\nERROR: ASCII remap file ({0}) remaps the same value to '
+                'different outputs'.format(remap_name))
+            for i in conflict_i:
+                logging.error('  {0}'.format(self.direct_keys[i]))
+            sys.exit()
+        if self.range_max.size and self.direct_keys.size:
+            range_i = np.minimum(
+                np.searchsorted(self.range_max, self.direct_keys),
+                self.range_max.size - 1)
+            inside_mask = (
+                (self.direct_keys >= self.range_min[range_i]) &
+                (self.direct_keys <= self.range_max[range_i]))
+            for direct_key in self.direct_keys[inside_mask]:
+                logging.warning(
+                    '  {0}: value {1} is also inside a range'.format(
+                        remap_name, direct_key))
+
+    def __call__(self, input_array):
+        """Remap an array of values (nodata should already be removed)"""
+        input_array = np.asarray(input_array)
+        int_flag = np.issubdtype(input_array.dtype, np.integer)
+        # Like ReclassByASCIIFile, the output is integer for integer remaps
+        output_array = input_array.astype(self.dtype)
+
+        if self.range_max.size:
+            range_i = np.searchsorted(self.range_max, input_array, side='left')
+            range_c = np.minimum(range_i, self.range_max.size - 1)
+            range_mask = (range_i < self.range_max.size) & (
+                (input_array > self.range_min[range_c]) |
+                (self.range_min_flag[range_c] &
+                 (input_array == self.range_min[range_c])))
+            output_array[range_mask] = self.range_values[range_c[range_mask]]
+
+        if self.direct_keys.size and int_flag and self.lookup_min is not None:
+            lookup_i = input_array.astype(np.int64) - self.lookup_min
+            direct_mask = (lookup_i >= 0) & (lookup_i < self.lookup_array.size)
+            direct_mask[direct_mask] = self.lookup_mask[lookup_i[direct_mask]]
+            output_array[direct_mask] = self.lookup_array[
+                lookup_i[direct_mask]]
+        elif self.direct_keys.size:
+            direct_i = np.searchsorted(self.direct_keys, input_array)
+            direct_c = np.minimum(direct_i, self.direct_keys.size - 1)
+            direct_mask = self.direct_keys[direct_c] == input_array
+            output_array[direct_mask] = self.direct_values[
+                direct_c[direct_mask]]
+        return output_array
+
+
+def remap_array_func(input_array, remap_list, input_nodata=None):
+    """Apply several remaps to the same array in a single pass
+
+    Valid values are only extracted once.  Integer arrays are reduced to
+    their unique values so each remap only evaluates the distinct values
+    and the results are expanded back with one take per output.
+
+    Args:
+        input_array (:class:`numpy.array`): input values
+        remap_list (list): Remap objects, or lists of Remap objects that
+            are applied in order (i.e. remap the output of a remap)
+        input_nodata: input nodata value (NaN is always nodata)
+
+    Returns:
+        list of arrays, nodata is NaN for float outputs and
+        remap_int_nodata for integer outputs
+    """
+    if np.issubdtype(input_array.dtype, np.floating):
+        valid_mask = np.isfinite(input_array)
+    else:
+        valid_mask = np.ones(input_array.shape, dtype=np.bool)
+    if input_nodata is not None and not np.isnan(input_nodata):
+        valid_mask &= (input_array != input_nodata)
+    valid_values = input_array[valid_mask]
+    if np.issubdtype(input_array.dtype, np.integer):
+        valid_values, unique_index = np.unique(
+            valid_values, return_inverse=True)
+    else:
+        unique_index = None
+
+    output_list = []
+    for remap_item in remap_list:
+        if isinstance(remap_item, Remap):
+            remap_item = [remap_item]
+        output_values = valid_values
+        for remap_obj in remap_item:
+            output_values = remap_obj(output_values)
+        if unique_index is not None:
+            output_values = output_values[unique_index]
+        if np.issubdtype(output_values.dtype, np.integer):
+            output_array = np.empty(input_array.shape, dtype=np.int32)
+            output_array.fill(remap_int_nodata)
+        else:
+            output_array = np.empty(input_array.shape, dtype=np.float64)
+            output_array.fill(np.NaN)
+        output_array[valid_mask] = output_values
+        output_list.append(output_array)
+        del output_values
+    return output_list
 
 
 # def reclass_ascii_float_func(raster_path, remap_path):
@@ -1737,7 +4152,8 @@ def raster_to_array_with_xy(input_path):
     return array, X, Y
 
 
-def array_to_raster(input_array, output_path, pnt, cs, mask_array=None):
+def array_to_raster(input_array, output_path, pnt, cs, mask_array=None,
+                    int_nodata=None):
     """"""
     output_array = np.copy(input_array)
     # Float arrays have to have nodata set to some value (-9999)
@@ -1749,6 +4165,9 @@ def array_to_raster(input_array, output_path, pnt, cs, mask_array=None):
     elif output_array.dtype == np.bool:
         output_array = output_array.astype(np.uint8)
         output_nodata = 255
+    # Integer arrays must have nodata set explicitly (if there is any)
+    else:
+        output_nodata = int_nodata
     # If a mask array is give, assume all 0 values are nodata
     if np.any(mask_array): output_array[mask_array == 0] = output_nodata
     output_obj = arcpy.NumPyArrayToRaster(
@@ -1760,8 +4179,44 @@ def array_to_raster(input_array, output_path, pnt, cs, mask_array=None):
     arcpy.CalculateStatistics_management(output_path)
 
 
+# Raster.pixelType values and the matching MosaicToNewRaster pixel types
+mosaic_pixel_type_dict = {
+    'U1': '1_BIT', 'U2': '2_BIT', 'U4': '4_BIT',
+    'U8': '8_BIT_UNSIGNED', 'S8': '8_BIT_SIGNED',
+    'U16': '16_BIT_UNSIGNED', 'S16': '16_BIT_SIGNED',
+    'U32': '32_BIT_UNSIGNED', 'S32': '32_BIT_SIGNED',
+    'F32': '32_BIT_FLOAT', 'F64': '64_BIT'}
+
+
+def mosaic_tiles_func(tile_path_list, output_path):
+    """Mosaic tile rasters (from array_to_raster) into one raster
+
+    The tiles are deleted once the mosaic is saved, so a large raster
+    can be written one tile at a time without holding it in memory.
+
+    Args:
+        tile_path_list (list): tile raster paths (tiles don't overlap)
+        output_path (str): output raster path
+    """
+    tile_obj = Raster(tile_path_list[0])
+    pixel_type = mosaic_pixel_type_dict[tile_obj.pixelType]
+    tile_cs = tile_obj.meanCellWidth
+    del tile_obj
+    if arcpy.Exists(output_path):
+        arcpy.Delete_management(output_path)
+    arcpy.MosaicToNewRaster_management(
+        ';'.join(tile_path_list), os.path.dirname(output_path),
+        os.path.basename(output_path), env.outputCoordinateSystem,
+        pixel_type, tile_cs, 1)
+    arcpy.CalculateStatistics_management(output_path)
+    for tile_path in tile_path_list:
+        arcpy.Delete_management(tile_path)
+
+
+@instrument('flood_fill')
 def flood_fill(test_array, four_way_flag=True, edge_flt=None):
     """Flood fill algorithm"""
+    run_report.add_rows(test_array.size)
     input_array = np.copy(test_array)
     input_rows, input_cols = input_array.shape
     h_max = np.nanmax(input_array * 2.0)
@@ -1867,3 +4322,102 @@ def np_binary_erosion(input_array, structure=np.ones((3,3)).astype(np.bool)):
             binary_erosion[row+1, col+1] = np.min(
                 input_pad_array[row:row+3, col:col+3][struc_mask])
     return binary_erosion[1:rows+1, 1:cols+1]
+
+
+def nearest_valid_index(valid_mask):
+    """Row/col index of the nearest valid cell (Nibble equivalent)
+
+    Two pass Euclidean distance transform with index propagation
+    (Felzenszwalb & Huttenlocher). The first pass finds the nearest valid
+    row in each column using a cumulative max/min of the row indices.
+    The second pass finds the lower envelope of the column distance
+    parabolas along each row, carrying the row/col index of the valid
+    cell with it. Both passes are vectorized across the other axis.
+
+    Args:
+        valid_mask: Boolean NumPy array, True for cells with valid data
+
+    Returns:
+        tuple: (row, col) index arrays of the nearest valid cell.
+            Both are -1 if there are no valid cells in the array.
+    """
+    rows, cols = valid_mask.shape
+    row_array = np.tile(np.arange(rows)[:, np.newaxis], (1, cols))
+
+    # Nearest valid row above and below each cell
+    above = np.maximum.accumulate(
+        np.where(valid_mask, row_array, -1), axis=0)
+    below = np.minimum.accumulate(
+        np.where(valid_mask, row_array, rows)[::-1], axis=0)[::-1]
+    use_below = (
+        (below < rows) &
+        ((above < 0) | ((below - row_array) < (row_array - above))))
+    col_near_row = np.where(use_below, below, above)
+    col_dist2 = np.where(
+        col_near_row >= 0, (col_near_row - row_array) ** 2.0, np.inf)
+    del above, below, use_below, row_array
+
+    # Lower envelope of the parabolas col_dist2[:, v] + (q - v) ** 2
+    # v: columns of the envelope parabolas, z: envelope breakpoints
+    row_index = np.arange(rows)
+    v = np.zeros((rows, cols), dtype=np.int64)
+    z = np.zeros((rows, cols + 1))
+    k = np.full(rows, -1, dtype=np.int64)
+    s = np.zeros(rows)
+    for q in xrange(cols):
+        f_q = col_dist2[:, q]
+        active = np.isfinite(f_q)
+        # Remove parabolas that are hidden by the parabola at q
+        while True:
+            check = active & (k >= 0)
+            k_check = np.maximum(k, 0)
+            v_k = v[row_index, k_check]
+            with np.errstate(invalid='ignore'):
+                s = np.where(
+                    check,
+                    ((f_q + q * q) - (col_dist2[row_index, v_k] + v_k * v_k)) /
+                    np.maximum(2.0 * (q - v_k), 1),
+                    s)
+            pop = check & (s <= z[row_index, k_check])
+            if not np.any(pop):
+                break
+            k[pop] -= 1
+        k[active] += 1
+        k_active = k[active]
+        v[row_index[active], k_active] = q
+        z[row_index[active], k_active] = np.where(
+            k_active == 0, -np.inf, s[active])
+        z[row_index[active], k_active + 1] = np.inf
+    has_valid = k >= 0
+
+    # Read the nearest cell for each column off the envelope
+    near_row = np.full((rows, cols), -1, dtype=np.int64)
+    near_col = np.full((rows, cols), -1, dtype=np.int64)
+    k = np.zeros(rows, dtype=np.int64)
+    for q in xrange(cols):
+        while True:
+            advance = has_valid & (z[row_index, k + 1] < q)
+            if not np.any(advance):
+                break
+            k[advance] += 1
+        v_k = v[row_index, k]
+        near_col[has_valid, q] = v_k[has_valid]
+        near_row[has_valid, q] = col_near_row[row_index, v_k][has_valid]
+    return near_row, near_col
+
+
+def nearest_fill(input_array, nearest_index):
+    """Fill every cell with the value of the nearest valid cell
+
+    Args:
+        input_array: NumPy array to fill
+        nearest_index: (row, col) tuple from nearest_valid_index()
+            Multiple arrays with the same nodata mask can share the index
+
+    Returns:
+        NumPy array: Filled copy of the input array
+    """
+    near_row, near_col = nearest_index
+    if np.any(near_row < 0):
+        return np.copy(input_array)
+    return input_array[near_row, near_col]
@@ -8,7 +8,7 @@
 #--------------------------------
 
 import argparse
-# from collections import defaultdict
+from collections import defaultdict
 import ConfigParser
 import datetime as dt
 import logging
@@ -16,13 +16,16 @@ import os
 # import re
 import sys
 
+import select_arcpy
 import arcpy
 from arcpy import env
 from arcpy.sa import *
+import numpy as np
 
 from support_functions import *
 
 
+@instrument('veg_parameters', stage_flag=True)
 def veg_parameters(config_path, overwrite_flag=False, debug_flag=False):
     """Calculate PRMS Vegetation Parameters
 
@@ -116,12 +119,14 @@ def veg_parameters(config_path, overwrite_flag=False, debug_flag=False):
     srain_intcp_remap_path = os.path.join(hru.remap_ws, hru.srain_intcp_remap_name)
     wrain_intcp_remap_path = os.path.join(hru.remap_ws, hru.wrain_intcp_remap_name)
     root_depth_remap_path = os.path.join(hru.remap_ws, hru.root_depth_remap_name)
-    remap_path_list = [
-        cov_type_remap_path, covden_sum_remap_path, covden_win_remap_path,
-        snow_intcp_remap_path, srain_intcp_remap_path,
-        wrain_intcp_remap_path, root_depth_remap_path]
-    for remap_path in remap_path_list:
-        remap_check(remap_path)
+    # Remaps are compiled (and checked) once here
+    cov_type_remap = remap_check(cov_type_remap_path)
+    covden_sum_remap = remap_check(covden_sum_remap_path)
+    covden_win_remap = remap_check(covden_win_remap_path)
+    snow_intcp_remap = remap_check(snow_intcp_remap_path)
+    srain_intcp_remap = remap_check(srain_intcp_remap_path)
+    wrain_intcp_remap = remap_check(wrain_intcp_remap_path)
+    root_depth_remap = remap_check(root_depth_remap_path)
 
     # DEADBEEF
     # if not os.path.isfile(cov_type_remap_path):
@@ -274,87 +279,141 @@ def veg_parameters(config_path, overwrite_flag=False, debug_flag=False):
     del transform_str, veg_type_orig_sr, veg_type_obj
 
 
-    # Reclassifying vegetation cover type
-    logging.info('\nCalculating COV_TYPE')
-    logging.debug('  Reclassifying: {0}'.format(cov_type_remap_path))
-    cov_type_obj = ReclassByASCIIFile(
-        veg_type_path, cov_type_remap_path)
-    cov_type_obj.save(cov_type_path)
-    del cov_type_obj
-
-    # Summer cover density
-    logging.info('Calculating COVDEN_SUM')
-    logging.debug('  Reclassifying: {0}'.format(covden_sum_remap_path))
-    covden_sum_obj = ReclassByASCIIFile(
-        veg_cover_path, covden_sum_remap_path)
-    covden_sum_obj *= 0.01
-    covden_sum_obj.save(covden_sum_path)
-    del covden_sum_obj
-
-    # Winter cover density
-    logging.info('Calculating COVDEN_WIN')
-    logging.debug('  Reclassifying: {0}'.format(covden_win_remap_path))
-    covden_win_obj = ReclassByASCIIFile(
-        cov_type_path, covden_win_remap_path)
-    covden_win_obj *= 0.01
-    covden_win_obj *= Raster(covden_sum_path)
-    covden_win_obj.save(covden_win_path)
-    del covden_win_obj
-
-    # Snow interception storage capacity
-    logging.info('Calculating SNOW_INTCP')
-    logging.debug('  Reclassifying: {0}'.format(snow_intcp_remap_path))
-    snow_intcp_obj = ReclassByASCIIFile(
-        veg_type_path, snow_intcp_remap_path)
-    snow_intcp_obj.save(snow_intcp_path)
-    del snow_intcp_obj
-
-    # Winter rain interception storage capacity
-    logging.info('Calculating WRAIN_INTCP')
-    logging.debug('  Reclassifying: {0}'.format(wrain_intcp_remap_path))
-    wrain_intcp_obj = ReclassByASCIIFile(
-        veg_type_path, wrain_intcp_remap_path)
-    wrain_intcp_obj.save(wrain_intcp_path)
-    del wrain_intcp_obj
-
-    # Summer rain interception storage capacity
-    logging.info('Calculating SRAIN_INTCP')
-    logging.debug('  Reclassifying: {0}'.format(srain_intcp_remap_path))
-    srain_intcp_obj = ReclassByASCIIFile(
-        veg_type_path, srain_intcp_remap_path)
-    srain_intcp_obj.save(srain_intcp_path)
-    del srain_intcp_obj
-
-    # Root depth
-    logging.info('Calculating ROOT_DEPTH')
-    logging.debug('  Reclassifying: {0}'.format(root_depth_remap_path))
-    root_depth_obj = ReclassByASCIIFile(
-        veg_type_path, root_depth_remap_path)
-    root_depth_obj.save(root_depth_path)
-    del root_depth_obj
-
-    # Short-wave radiation transmission coefficent
-    logging.info('Calculating {0}'.format(hru.rad_trncf_field))
-    rad_trncf_obj = 0.9917 * Exp(-2.7557 * Raster(covden_win_path))
-    rad_trncf_obj.save(rad_trncf_path)
-    del rad_trncf_obj
-
-
-    # List of rasters, fields, and stats for zonal statistics
+    # Vegetation parameters are calculated tile by tile on the veg type
+    #   grid and reduced directly to HRU zonal statistics
+    # Veg type, veg cover, and the HRU zones are read once per tile and
+    #   the derived layers are only kept in memory (unless saved)
+    logging.info('\nCalculating vegetation parameters')
+    veg_type_obj = Raster(veg_type_path)
+    veg_cover_obj = Raster(veg_cover_path)
+    veg_xmin = veg_type_obj.extent.XMin
+    veg_ymax = veg_type_obj.extent.YMax
+    veg_cs = veg_type_obj.meanCellWidth
+    veg_rows, veg_cols = veg_type_obj.height, veg_type_obj.width
+    if veg_cover_obj.meanCellWidth != veg_cs:
+        logging.info(
+            '  Veg. cover will be resampled to the veg. type cellsize')
+
+    # HRU zones on the veg type grid
+    logging.debug('  Converting HRU polygons to zone raster')
+    zone_path = os.path.join(veg_temp_ws, 'hru_zones.img')
+    zone_raster_func(
+        hru.polygon_path, hru.fid_field, zone_path, veg_type_path, veg_cs)
+    zone_obj = Raster(zone_path)
+
+    remap_dict = {
+        'cov_type': cov_type_remap, 'covden_sum': covden_sum_remap,
+        'covden_win': covden_win_remap, 'snow_intcp': snow_intcp_remap,
+        'wrain_intcp': wrain_intcp_remap, 'srain_intcp': srain_intcp_remap,
+        'root_depth': root_depth_remap}
+    veg_path_dict = {
+        'cov_type': cov_type_path, 'covden_sum': covden_sum_path,
+        'covden_win': covden_win_path, 'snow_intcp': snow_intcp_path,
+        'wrain_intcp': wrain_intcp_path, 'srain_intcp': srain_intcp_path,
+        'root_depth': root_depth_path, 'rad_trncf': rad_trncf_path}
+
+    # List of layers, fields, and stats for zonal statistics
     zs_veg_dict = dict()
-    zs_veg_dict[hru.cov_type_field] = [cov_type_path, 'MAJORITY']
-    zs_veg_dict[hru.covden_sum_field] = [covden_sum_path, 'MEAN']
-    zs_veg_dict[hru.covden_win_field] = [covden_win_path, 'MEAN']
-    zs_veg_dict[hru.snow_intcp_field] = [snow_intcp_path, 'MAJORITY']
-    zs_veg_dict[hru.srain_intcp_field] = [srain_intcp_path, 'MAJORITY']
-    zs_veg_dict[hru.wrain_intcp_field] = [wrain_intcp_path, 'MAJORITY']
-    zs_veg_dict[hru.root_depth_field] = [root_depth_path, 'MAJORITY']
-    zs_veg_dict[hru.rad_trncf_field] = [rad_trncf_path, 'MEAN']
-
-
-    # Calculate zonal statistics
-    logging.info('\nCalculating vegetation zonal statistics')
-    zonal_stats_func(zs_veg_dict, hru.polygon_path, hru)
+    zs_veg_dict[hru.cov_type_field] = ['cov_type', 'MAJORITY']
+    zs_veg_dict[hru.covden_sum_field] = ['covden_sum', 'MEAN']
+    zs_veg_dict[hru.covden_win_field] = ['covden_win', 'MEAN']
+    zs_veg_dict[hru.snow_intcp_field] = ['snow_intcp', 'MAJORITY']
+    zs_veg_dict[hru.srain_intcp_field] = ['srain_intcp', 'MAJORITY']
+    zs_veg_dict[hru.wrain_intcp_field] = ['wrain_intcp', 'MAJORITY']
+    zs_veg_dict[hru.root_depth_field] = ['root_depth', 'MAJORITY']
+    zs_veg_dict[hru.rad_trncf_field] = ['rad_trncf', 'MEAN']
+    zs_acc_dict = dict(
+        (zs_field, ZonalAccumulator(zs_stat))
+        for zs_field, (veg_layer, zs_stat) in zs_veg_dict.items())
+
+    # Root depth is always saved since soil_parameters needs it
+    # Each tile is saved as it is processed and the tiles are mosaiced
+    if hru.save_veg_rasters_flag:
+        save_layer_list = sorted(veg_path_dict.keys())
+    else:
+        save_layer_list = ['root_depth']
+    veg_tile_dict = defaultdict(list)
+    env.outputCoordinateSystem = hru.sr
+
+    # Only HRUs that changed since the last run are recalculated
+    hru_changes = HRUChanges(
+        hru, 'veg_parameters',
+        [repr(sorted(zs_veg_dict.items())), veg_type_path, veg_cover_path,
+         cov_type_remap_path, covden_sum_remap_path, covden_win_remap_path,
+         snow_intcp_remap_path, srain_intcp_remap_path,
+         wrain_intcp_remap_path, root_depth_remap_path])
+
+    # The saved rasters don't depend on the HRUs, so if only some HRUs
+    #   changed and the rasters exist, only the window of the changed
+    #   HRUs is processed and the rasters are not rebuilt
+    if (hru_changes.fid_list is not None and
+            all(arcpy.Exists(veg_path_dict[veg_layer])
+                for veg_layer in save_layer_list)):
+        save_layer_list = []
+        win_row_i, win_row_j, win_col_i, win_col_j = \
+            hru_changes.raster_window(
+                veg_xmin, veg_ymax, veg_cs, veg_rows, veg_cols)
+    else:
+        win_row_i, win_row_j, win_col_i, win_col_j = 0, veg_rows, 0, veg_cols
+    win_xmin = veg_xmin + win_col_i * veg_cs
+    win_cols = win_col_j - win_col_i
+
+    # Process roughly 1 million cells per tile
+    tile_rows = max(int(2 ** 20 / max(win_cols, 1)), 1)
+    for row_i in xrange(win_row_i, win_row_j, tile_rows):
+        tile_n = min(tile_rows, win_row_j - row_i)
+        tile_ymax = veg_ymax - row_i * veg_cs
+        logging.debug('  Rows: {0}-{1}'.format(row_i, row_i + tile_n))
+        veg_type_array, veg_type_nodata = raster_tile_func(
+            veg_type_obj, win_xmin, tile_ymax, veg_cs, tile_n, win_cols)
+        veg_cover_array, veg_cover_nodata = raster_tile_func(
+            veg_cover_obj, win_xmin, tile_ymax, veg_cs, tile_n, win_cols)
+        zone_array, zone_nodata = raster_tile_func(
+            zone_obj, win_xmin, tile_ymax, veg_cs, tile_n, win_cols)
+        if np.issubdtype(zone_array.dtype, np.floating):
+            zone_mask = np.isfinite(zone_array)
+        else:
+            zone_mask = zone_array != zone_nodata
+        zone_array = np.where(zone_mask, zone_array, -1).astype(np.int64)
+
+        veg_layer_dict = veg_layers_func(
+            veg_type_array, veg_type_nodata,
+            veg_cover_array, veg_cover_nodata, remap_dict)
+        for zs_field, (veg_layer, zs_stat) in zs_veg_dict.items():
+            zs_acc_dict[zs_field].add(
+                zone_array, veg_layer_dict[veg_layer], remap_int_nodata)
+        tile_pnt = arcpy.Point(win_xmin, tile_ymax - tile_n * veg_cs)
+        for veg_layer in save_layer_list:
+            tile_path = os.path.join(veg_temp_ws, '{0}_tile{1}.img'.format(
+                veg_layer, len(veg_tile_dict[veg_layer])))
+            array_to_raster(
+                veg_layer_dict[veg_layer], tile_path, tile_pnt, veg_cs,
+                int_nodata=remap_int_nodata)
+            veg_tile_dict[veg_layer].append(tile_path)
+        del veg_type_array, veg_cover_array, zone_array, zone_mask
+        del veg_layer_dict
+    del veg_type_obj, veg_cover_obj, zone_obj
+    arcpy.Delete_management(zone_path)
+
+    # Write zonal statistics
+    logging.info('\nWriting vegetation zonal statistics')
+    for zs_field, (veg_layer, zs_stat) in sorted(zs_veg_dict.items()):
+        logging.info('  {0}: {1}'.format(zs_field, zs_stat))
+    zonal_stats_update_func(
+        dict((zs_field, zs_acc.result())
+             for zs_field, zs_acc in zs_acc_dict.items()),
+        hru.polygon_path, hru, fid_list=hru_changes.fid_list)
+    del zs_acc_dict
+
+    # Mosaic the saved vegetation raster tiles
+    if save_layer_list:
+        logging.info('\nSaving vegetation rasters')
+    for veg_layer in save_layer_list:
+        logging.info('  {0}'.format(veg_path_dict[veg_layer]))
+        mosaic_tiles_func(
+            veg_tile_dict[veg_layer], veg_path_dict[veg_layer])
+    arcpy.ClearEnvironment('outputCoordinateSystem')
+    del veg_tile_dict
 
 
     # Short-wave radiation transmission coefficient
@@ -394,9 +453,57 @@ def veg_parameters(config_path, overwrite_flag=False, debug_flag=False):
         arcpy.Delete_management(hru_polygon_layer)
         del hru_polygon_layer
 
+    hru_changes.save()
     logging.info('Done!')
 
 
+def veg_layers_func(veg_type_array, veg_type_nodata, veg_cover_array,
+                    veg_cover_nodata, remap_dict):
+    """Calculate all of the derived vegetation layers for a tile
+
+    Args:
+        veg_type_array (:class:`numpy.array`): vegetation type values
+        veg_type_nodata: vegetation type nodata value
+        veg_cover_array (:class:`numpy.array`): vegetation cover values
+        veg_cover_nodata: vegetation cover nodata value
+        remap_dict (dict): compiled remaps, keyed by layer name
+
+    Returns:
+        dict of layer names and arrays
+        Remapped layers are integers (nodata is remap_int_nodata)
+        Cover densities and rad_trncf are floats (nodata is NaN)
+    """
+    veg_layer_dict = dict()
+
+    # All vegetation type remaps are applied in a single pass
+    # Winter cover density is remapped from the remapped cover type
+    (veg_layer_dict['cov_type'], covden_win_array,
+     veg_layer_dict['snow_intcp'], veg_layer_dict['wrain_intcp'],
+     veg_layer_dict['srain_intcp'],
+     veg_layer_dict['root_depth']) = remap_array_func(
+        veg_type_array,
+        [remap_dict['cov_type'],
+         [remap_dict['cov_type'], remap_dict['covden_win']],
+         remap_dict['snow_intcp'], remap_dict['wrain_intcp'],
+         remap_dict['srain_intcp'], remap_dict['root_depth']],
+        veg_type_nodata)
+
+    # Cover densities are remapped as percents
+    covden_sum_array = remap_array_func(
+        veg_cover_array, [remap_dict['covden_sum']], veg_cover_nodata)[0]
+    veg_layer_dict['covden_sum'] = np.where(
+        covden_sum_array == remap_int_nodata, np.nan,
+        0.01 * covden_sum_array)
+    veg_layer_dict['covden_win'] = veg_layer_dict['covden_sum'] * np.where(
+        covden_win_array == remap_int_nodata, np.nan,
+        0.01 * covden_win_array)
+
+    # Short-wave radiation transmission coefficent
+    veg_layer_dict['rad_trncf'] = 0.9917 * np.exp(
+        -2.7557 * veg_layer_dict['covden_win'])
+    return veg_layer_dict
+
+
 def get_remap_keys(remap_path):
     """"""
     with open(remap_path) as remap_f: